@@ -1,23 +1,36 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash, session
-import requests
-import pandas as pd
-from datetime import datetime
+from flask import Flask, Response, render_template, request, jsonify, send_file, redirect, url_for, flash, session, stream_with_context, g, has_app_context
+from datetime import datetime, timedelta
 import io
+import json
 import os
 import sqlite3
+import threading
+import time
+import hashlib
+import hmac
+import atexit
+import base64
+import bisect
+import gzip
+import queue
+import secrets
+import uuid
+import zipfile
+from collections import OrderedDict, deque
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
+from flask_login import LoginManager, login_user, logout_user, login_required, login_url, current_user
 from functools import wraps
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
+
+# pandas, reportlab และ requests import ภายในฟังก์ชันที่ใช้ (โหลดเมื่อใช้งานครั้งแรก)
+# เพื่อให้ app เริ่มทำงานเร็วและแต่ละ worker ใช้ memory น้อยลง เมื่อ request ส่วนใหญ่เป็น login / ประมาณราคาเร็ว
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'  # เปลี่ยนเป็น secret key ที่ปลอดภัยในการ deploy จริง
@@ -28,9 +41,76 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'กรุณาเข้าสู่ระบบก่อนใช้งาน'
 
+@login_manager.unauthorized_handler
+def unauthorized():
+    """API ตอบ 401 เป็น JSON ส่วนหน้าเว็บ redirect ไปหน้า login เหมือนเดิม"""
+    if request.path.startswith('/api/'):
+        return jsonify({
+            'success': False,
+            'error': login_manager.login_message
+        }), 401
+
+    flash(login_manager.login_message, login_manager.login_message_category)
+    return redirect(login_url(login_manager.login_view, request.url))
+
 # Ollama API Configuration
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+OLLAMA_BASE_URL = "http://localhost:11434"
+# Ollama หลาย instance (หลาย port หรือหลายเครื่อง) กระจายงานให้ตัวที่งานค้างน้อยที่สุด เช่น
+# ["http://localhost:11434", "http://localhost:11435", "http://gpu-2:11434"]
+OLLAMA_BACKENDS = [OLLAMA_BASE_URL]
 OLLAMA_MODEL = "llama3.2"  # สามารถเปลี่ยนเป็น model อื่นได้
+OLLAMA_GENERATE_TIMEOUT = 60  # วินาทีสูงสุดที่รอผลการประเมินแบบไม่ stream
+OLLAMA_STREAM_READ_TIMEOUT = 60  # วินาทีสูงสุดที่รอระหว่าง chunk ในโหมด streaming
+OLLAMA_CONNECT_TIMEOUT = 5
+OLLAMA_MAX_CONCURRENCY = 2  # จำนวนการประเมินที่ส่งให้ Ollama ได้พร้อมกัน (ต่อ backend)
+OLLAMA_QUEUE_TIMEOUT = 10  # วินาทีที่ request รอคิวได้ ถ้าเกินจะตอบ 503 ทันที
+OLLAMA_RETRY_AFTER = 15  # ค่า Retry-After (วินาที) ที่ส่งกลับเมื่อคิวเต็ม
+OLLAMA_RETRIES = 2  # จำนวนครั้งที่ลองเชื่อมต่อใหม่เมื่อเชื่อมต่อไม่ได้
+OLLAMA_RETRY_BACKOFF = 0.5  # เวลารอก่อนลองใหม่ (วินาที, เพิ่มเป็น 2 เท่าทุกครั้ง)
+OLLAMA_POOL_SIZE = 10  # จำนวน connection ที่เปิดค้างไว้ใช้ซ้ำ (ต่อ backend)
+OLLAMA_BACKEND_MAX_FAILURES = 2  # backend ที่เรียกไม่สำเร็จติดกันครบจำนวนนี้จะถูกพักไว้ (ไม่ส่งงานให้)
+OLLAMA_BACKEND_EJECT_SECONDS = 30  # วินาทีที่พัก backend ไว้ (รับกลับเร็วกว่านี้ถ้าตรวจสอบสถานะผ่าน)
+OLLAMA_HEALTH_INTERVAL = 15  # ตรวจสอบสถานะ Ollama ทุกกี่วินาที (ทำใน background ครั้งเดียวต่อ process)
+# เปิด /api/check-ollama/stream (SSE) ส่งสถานะให้ browser เมื่อมีการเปลี่ยนแปลง แต่ละ tab จะใช้ worker ค้างไว้
+# จึงควรเปิดเฉพาะเมื่อรันด้วย worker แบบ thread / async (เช่น gunicorn --threads หรือ gevent) ไม่เช่นนั้นหน้าเว็บจะตรวจสอบเป็นระยะแทน
+OLLAMA_STATUS_STREAM = False
+OLLAMA_STATUS_STREAM_MAX_AGE = 300  # วินาทีสูงสุดของการเชื่อมต่อ SSE แต่ละครั้ง (browser จะเชื่อมต่อใหม่เอง)
+OLLAMA_STATUS_HEARTBEAT = 25  # วินาที ส่ง keep-alive ใน SSE เพื่อไม่ให้ proxy ตัดการเชื่อมต่อ
+OLLAMA_CONNECTION_ERROR = ('ไม่สามารถเชื่อมต่อกับ Ollama ได้ กรุณาตรวจสอบว่า Ollama กำลังทำงานอยู่ที่ '
+                           + ', '.join(url.split('://')[-1] for url in OLLAMA_BACKENDS))
+
+# ข้อมูลทรัพย์สินที่ใช้ในการประเมินด้วย AI
+EVALUATION_FIELDS = ['property_type', 'location', 'area', 'bedrooms', 'bathrooms', 'age', 'condition', 'additional_info']
+NUMERIC_EVALUATION_FIELDS = {'area', 'bedrooms', 'bathrooms', 'age'}
+
+# เวอร์ชันของ prompt (เพิ่มเลขทุกครั้งที่แก้ build_evaluation_prompt เพื่อไม่ให้ใช้ cache เก่า)
+PROMPT_VERSION = 1
+
+# Cache ผลการประเมินจาก AI
+AI_DATABASE = 'PasitDev_ai.db'
+EVALUATION_CACHE_TTL = 24 * 60 * 60  # อายุ cache (วินาที)
+EVALUATION_CACHE_MAX_ENTRIES = 5000  # จำนวนรายการสูงสุด เกินแล้วลบรายการที่ไม่ได้ใช้นานที่สุด (LRU)
+
+# คิวงานประเมินด้วย AI แบบ asynchronous (/api/jobs)
+EVALUATION_WORKERS = 2  # จำนวน worker thread ที่ประมวลผลงานในคิว
+JOB_WAIT_MAX = 30  # วินาทีสูงสุดที่ GET /api/jobs/<id>?wait= รอผลได้
+JOB_STALE_AFTER = 10 * 60  # งานที่อยู่ในสถานะ running นานเกินนี้ (เช่น process ตาย) จะถูกนำกลับเข้าคิว
+JOB_SWEEP_INTERVAL = 60  # วินาที worker ตรวจหางานที่ค้างและลบงานเก่า
+JOB_RETENTION = 7 * 24 * 60 * 60  # วินาที งานที่เสร็จแล้ว (done / error) เก็บไว้นานเท่านี้แล้วลบ
+
+# รายงาน PDF
+PDF_FONT_REGULAR = 'fonts/THSarabunNew.ttf'
+PDF_FONT_BOLD = 'fonts/THSarabunNew-Bold.ttf'
+PDF_WARMUP = False  # True = โหลดฟอนต์และ style ตั้งแต่เริ่ม app (ไม่เช่นนั้นโหลดเมื่อสร้าง PDF ครั้งแรก)
+PDF_WORKERS = 2  # จำนวน process ที่ใช้สร้าง PDF (0 = สร้างใน Flask worker เอง)
+PDF_MAX_PENDING = 8  # จำนวนงาน PDF ที่รอคิวและกำลังสร้างได้พร้อมกัน เกินแล้วตอบ 503
+PDF_RETRY_AFTER = 5  # วินาที ที่แนะนำให้ client ลองใหม่เมื่อคิว PDF เต็ม
+PDF_RENDER_TIMEOUT = 60  # วินาทีสูงสุดที่รอสร้าง PDF
+PDF_TEMPLATE_VERSION = 1  # เพิ่มเลขทุกครั้งที่แก้หน้าตารายงาน เพื่อไม่ให้ใช้ PDF เก่าใน cache
+PDF_CACHE_FOLDER = 'pdf_cache'
+PDF_CACHE_MAX_BYTES = 200 * 1024 * 1024  # ขนาดรวมสูงสุดของ PDF ที่ cache ไว้
+BATCH_PDF_MAX_ITEMS = 200  # จำนวนรายการสูงสุดต่อ /api/download-pdf/batch
+PDF_BATCH_WINDOW = 4  # จำนวน PDF ที่สร้างล่วงหน้าพร้อมกันระหว่างส่ง ZIP
 
 # ข้อมูลจังหวัดทั้งหมดในประเทศไทย (77 จังหวัด)
 PROVINCES_DATA = {
@@ -120,38 +200,130 @@ PROVINCES_DATA = {
     'นราธิวาส': {'region': 'ใต้', 'multiplier': 0.8},
 }
 
+# ราคาต่อตารางเมตรโดยประมาณ (หน่วย: บาท) ใช้เมื่อไม่มีข้อมูลราคาที่อัปโหลด
+DEFAULT_BASE_PRICES = {
+    'คอนโด': 50000,
+    'บ้านเดี่ยว': 35000,
+    'ทาวน์เฮาส์': 30000,
+    'อาคารพาณิชย์': 40000,
+    'ที่ดิน': 15000
+}
+DEFAULT_BASE_PRICE = 30000  # ประเภททรัพย์สินที่ไม่รู้จัก
+
+# อายุ cache ของ /api/provinces ใน browser (วินาที)
+PROVINCES_CACHE_MAX_AGE = 24 * 60 * 60
+
 # Upload Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# สร้างโฟลเดอร์ uploads ถ้ายังไม่มี
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-# เก็บข้อมูลราคาที่อัปโหลดจาก Excel
-price_database = {}
+UPLOAD_MAX_REPORTED_ERRORS = 100  # จำนวนข้อความ error สูงสุดที่ส่งกลับ (error_count ยังนับทั้งหมด)
+
+# อัปโหลดไฟล์ราคาขนาดใหญ่แบบ streaming: POST /api/upload-price-data?filename=<ชื่อไฟล์> (body คือตัวไฟล์)
+PRICE_STREAM_MAX_BYTES = 2 * 1024 * 1024 * 1024  # ขนาดไฟล์สูงสุดของโหมดนี้ (แทน MAX_CONTENT_LENGTH)
+PRICE_STREAM_EXTENSIONS = {'csv', 'xlsx'}  # .xls ต้องอ่านทั้งไฟล์เข้า memory จึงไม่รองรับในโหมดนี้
+PRICE_STREAM_CHUNK_ROWS = 50000  # จำนวนแถวที่ตรวจสอบและบันทึกต่อ 1 transaction
+PRICE_STREAM_READ_SIZE = 1024 * 1024  # byte ที่อ่านจาก request ต่อครั้งตอนเขียนลง disk
+PRICE_STREAM_MAX_ACTIVE_PER_USER = 1  # การอัปโหลดแบบ streaming ที่ยังไม่เสร็จได้พร้อมกันต่อผู้ใช้ (เกินแล้วตอบ 429)
+PRICE_STREAM_RETRY_AFTER = 30  # ค่า Retry-After (วินาที) เมื่อผู้ใช้มีการอัปโหลดค้างอยู่แล้ว
+PRICE_UPLOAD_HEARTBEAT_INTERVAL = 15  # วินาที การรับไฟล์ / การนำเข้าที่ยังทำงานอยู่บันทึก heartbeat_at อย่างน้อยทุกเท่านี้
+PRICE_UPLOAD_STALE_AFTER = 2 * 60  # ไม่มี heartbeat นานเกินนี้ (เช่น process ตาย): processing เริ่มใหม่, receiving เป็น error
+PRICE_UPLOAD_SWEEP_INTERVAL = 60  # วินาที worker ตรวจหาการอัปโหลดที่ค้างและไฟล์ที่ไม่มีเจ้าของใน UPLOAD_FOLDER
+
+# ประมาณราคาแบบ batch (/api/batch-estimate)
+BATCH_MAX_ROWS = 100000
+BATCH_AI_MAX_ROWS = 20  # จำนวนแถวสูงสุดที่ส่งให้ AI ประเมินต่อ 1 ไฟล์ (ส่งเข้าคิว /api/jobs)
+
+# Metrics สำหรับ Prometheus (/metrics)
+METRICS_ENABLED = True
+# /metrics เปิดเผยจำนวนผู้ใช้และสถานะคิวภายใน จึงตอบเฉพาะ admin ที่ login อยู่, scraper ที่ส่ง
+# header "Authorization: Bearer <METRICS_TOKEN>" หรือ IP ใน METRICS_ALLOWED_IPS
+METRICS_TOKEN = None
+METRICS_ALLOWED_IPS = ()  # เช่น ('127.0.0.1',) ถ้า Prometheus อยู่เครื่องเดียวกัน (ห้ามใช้ถ้าอยู่หลัง reverse proxy บนเครื่องเดียวกัน)
+# รวมค่าจากทุก worker process (gunicorn -w N): แต่ละ process เขียนค่าของตัวเองลงโฟลเดอร์นี้ / None = ค่าเฉพาะ process ที่ตอบ
+METRICS_MULTIPROCESS_DIR = 'metrics_data'
+METRICS_SNAPSHOT_INTERVAL = 5  # วินาที ค่าของ worker อื่นใน /metrics ช้ากว่าจริงได้ไม่เกินเท่านี้
+METRICS_DEAD_RETENTION = 7 * 24 * 60 * 60  # วินาที เก็บ counter ของ worker ที่จบไปแล้วไว้นานเท่านี้
 
 # ========================================
 # Database Configuration
 # ========================================
 
 DATABASE = 'PasitDev.db'
-
-def get_db():
-    """เชื่อมต่อกับ SQLite database"""
-    conn = sqlite3.connect(DATABASE)
+DB_BUSY_TIMEOUT = 5000  # ms ที่รอเมื่อ database ถูก lock ก่อนจะ error
+DB_CACHED_STATEMENTS = 128  # จำนวน SQL statement ที่ compile แล้วเก็บไว้ใช้ซ้ำต่อ connection
+
+# Cache ข้อมูลผู้ใช้ที่ login แล้ว (ไม่ต้อง query database ทุก request)
+USER_CACHE_TTL = 60  # วินาที
+USER_CACHE_MAX_ENTRIES = 1000
+USER_CACHE_CHECK_INTERVAL = 1.0  # วินาที ตรวจสอบว่ามีผู้ใช้ถูกแก้/ลบ (จาก process อื่น) บ่อยแค่ไหน
+
+# Password hashing (ดูรูปแบบ method ได้จาก werkzeug.security.generate_password_hash)
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'  # เปลี่ยนแล้ว hash เดิมจะถูก hash ใหม่อัตโนมัติเมื่อผู้ใช้ login
+PASSWORD_HASH_WORKERS = 2  # จำนวน process ที่ใช้ hash รหัสผ่าน (0 = ทำใน Flask worker เอง)
+PASSWORD_HASH_MAX_PENDING = 32  # งาน hash ที่รอคิวได้พร้อมกัน
+PASSWORD_HASH_TIMEOUT = 30  # วินาทีสูงสุดที่รอคิว / รอผล
+
+# จำกัดการ login ผิด (นับรวมทุก process ในตาราง login_failures)
+LOGIN_RATE_WINDOW = 15 * 60  # วินาที
+LOGIN_MAX_FAILURES_PER_IP = 20
+LOGIN_MAX_FAILURES_PER_ACCOUNT = 5  # ต่อบัญชีจาก IP เดียวกัน (IP อื่นยัง login บัญชีนี้ได้ ผู้อื่นจึงล็อกบัญชีของเราไม่ได้)
+LOGIN_ACCOUNT_DELAY_AFTER = 10  # login บัญชีนี้ผิดรวมทุก IP ครบเท่านี้ ทุกครั้งถัดไปจะถูกหน่วงเวลา (ไม่บล็อก)
+LOGIN_ACCOUNT_DELAY = 1.0  # วินาที
+
+# บันทึก last_login / ประวัติการ login แบบ write-behind
+LOGIN_EVENTS_FLUSH_INTERVAL = 0.5  # วินาที
+LOGIN_EVENTS_BATCH_SIZE = 500  # เขียนทันทีเมื่อมีเหตุการณ์ค้างครบจำนวนนี้
+LOGIN_EVENTS_MAX_PENDING = 50000  # จำนวนสูงสุดที่ค้างใน memory ได้เมื่อเขียน database ไม่ได้
+LOGIN_EVENTS_RETENTION_DAYS = 90  # ลบประวัติการ login ที่เก่ากว่านี้
+LOGIN_EVENTS_PRUNE_INTERVAL = 60 * 60  # วินาที ตรวจลบประวัติเก่า
+
+# หน้า Admin
+ADMIN_USERS_PAGE_SIZE = 50  # จำนวนผู้ใช้ต่อหน้า
+ADMIN_USERS_MAX_PAGE_SIZE = 200  # limit สูงสุดของ /api/admin/users
+
+def connect_db(path=DATABASE):
+    """
+    เปิด connection ใหม่พร้อมตั้งค่า pragma
+    ใช้ตรง ๆ ได้ใน background thread / script (ผู้เรียกต้องปิดเอง) ใน request ให้ใช้ get_db()
+    """
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT / 1000, cached_statements=DB_CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA synchronous = NORMAL')  # ปลอดภัยเมื่อใช้ WAL และเขียนเร็วกว่า FULL
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}')
     return conn
 
+def get_db():
+    """
+    connection ของ request ปัจจุบัน (เปิดครั้งแรกที่เรียก ใช้ร่วมกันทั้ง request และปิดใน close_db)
+    ถ้าเรียกนอก request จะได้ connection ใหม่ ผู้เรียกต้องปิดเอง
+    """
+    if not has_app_context():
+        return connect_db()
+
+    if 'db' not in g:
+        g.db = connect_db()
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exception):
+    """ปิด connection ของ request (transaction ที่ยังไม่ commit จะถูกยกเลิก)"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.close()
+
 def getYear():
     now = datetime.now()
     return now.strftime("%Y")
 
+users_fts_enabled = False
+
 def init_db():
     """สร้างตาราง users ถ้ายังไม่มี"""
-    conn = get_db()
+    conn = connect_db()
+    # WAL: อ่านพร้อมกับเขียนได้ ไม่เกิด "database is locked" ตอน login พร้อมกัน (ตั้งครั้งเดียว มีผลกับไฟล์ถาวร)
+    conn.execute('PRAGMA journal_mode = WAL')
     cursor = conn.cursor()
 
     # สร้างตาราง users
@@ -167,52 +339,1153 @@ def init_db():
         )
     ''')
 
-    # สร้าง admin account เริ่มต้น (email: admin@PasitDev.com, password: admin123)
-    try:
+    # index สำหรับหน้า Admin (แบ่งหน้าตาม created_at, id / กรองตาม role / เรียงตาม last_login)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_last_login ON users (last_login)')
+
+    # บันทึก id ของผู้ใช้ที่ถูกแก้ข้อมูลที่ cache ไว้ (email, ชื่อ, สิทธิ์) หรือถูกลบ จาก process ใดก็ได้
+    # UserCache ของแต่ละ process อ่านรายการใหม่เป็นระยะ แล้วลบเฉพาะผู้ใช้เหล่านั้นออกจาก cache
+    # (เก็บไว้ 1000 รายการล่าสุด ถ้า process ใดตามไม่ทันจะล้าง cache ทั้งหมดแทน)
+    cursor.executescript('''
+        DROP TRIGGER IF EXISTS users_version_update;
+        DROP TRIGGER IF EXISTS users_version_delete;
+        DROP TABLE IF EXISTS user_meta;
+
+        CREATE TABLE IF NOT EXISTS user_changes (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL
+        );
+
+        CREATE TRIGGER IF NOT EXISTS user_changes_update AFTER UPDATE OF email, full_name, role ON users BEGIN
+            INSERT INTO user_changes (user_id) VALUES (old.id);
+            DELETE FROM user_changes WHERE version <= last_insert_rowid() - 1000;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS user_changes_delete AFTER DELETE ON users BEGIN
+            INSERT INTO user_changes (user_id) VALUES (old.id);
+            DELETE FROM user_changes WHERE version <= last_insert_rowid() - 1000;
+        END;
+    ''')
+
+    # จำนวนผู้ใช้แยกตาม role สำหรับหน้า Admin ปรับด้วย trigger ทุกครั้งที่เพิ่ม/ลบผู้ใช้หรือเปลี่ยนสิทธิ์
+    # (ไม่ต้อง GROUP BY ทั้งตารางทุกครั้งที่เปิดหน้า) นับจากตาราง users ครั้งเดียวตอนสร้างตาราง
+    # ทำใน transaction เดียวกัน process อื่นจึงไม่เพิ่มผู้ใช้แทรกระหว่างนับกับสร้าง trigger
+    cursor.execute('BEGIN IMMEDIATE')
+    role_counts_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_role_counts'").fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_role_counts (
+            role TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS user_role_counts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO user_role_counts (role, count) VALUES (new.role, 1)
+            ON CONFLICT (role) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS user_role_counts_delete AFTER DELETE ON users BEGIN
+            UPDATE user_role_counts SET count = count - 1 WHERE role = old.role;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS user_role_counts_update AFTER UPDATE OF role ON users
+        WHEN old.role IS NOT new.role BEGIN
+            UPDATE user_role_counts SET count = count - 1 WHERE role = old.role;
+            INSERT INTO user_role_counts (role, count) VALUES (new.role, 1)
+            ON CONFLICT (role) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    if not role_counts_exists:
         cursor.execute('''
-            INSERT INTO users (email, password, full_name, role)
-            VALUES (?, ?, ?, ?)
-        ''', ('admin@PasitDev.com', generate_password_hash('admin123'), 'ผู้ดูแลระบบ', 'admin'))
+            INSERT INTO user_role_counts (role, count)
+            SELECT role, COUNT(*) FROM users WHERE role IS NOT NULL GROUP BY role
+        ''')
+    conn.commit()
+
+    # Full-text index สำหรับค้นหาผู้ใช้ด้วยอีเมล์/ชื่อ (trigram ค้นหาคำกลางข้อความและภาษาไทยได้)
+    global users_fts_enabled
+    try:
+        fts_exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'").fetchone()
+        cursor.executescript('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                email, full_name, content='users', content_rowid='id', tokenize='trigram'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+                INSERT INTO users_fts (rowid, email, full_name) VALUES (new.id, new.email, new.full_name);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+                INSERT INTO users_fts (users_fts, rowid, email, full_name)
+                VALUES ('delete', old.id, old.email, old.full_name);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF email, full_name ON users BEGIN
+                INSERT INTO users_fts (users_fts, rowid, email, full_name)
+                VALUES ('delete', old.id, old.email, old.full_name);
+                INSERT INTO users_fts (rowid, email, full_name) VALUES (new.id, new.email, new.full_name);
+            END;
+        ''')
+        if not fts_exists:
+            cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
         conn.commit()
-        print("✅ สร้าง Admin account เริ่มต้น: admin@PasitDev.com / admin123")
-    except sqlite3.IntegrityError:
-        pass  # Admin account มีอยู่แล้ว
+        users_fts_enabled = True
+    except sqlite3.OperationalError:
+        # SQLite ที่ไม่มี FTS5 / trigram ใช้ LIKE แทน
+        users_fts_enabled = False
+
+    # สร้าง admin account เริ่มต้น (email: admin@PasitDev.com, password: admin123)
+    # ตรวจสอบก่อน เพื่อไม่ต้อง hash รหัสผ่าน (ช้า) ทุกครั้งที่เริ่ม app
+    admin_exists = cursor.execute('SELECT 1 FROM users WHERE email = ?', ('admin@PasitDev.com',)).fetchone()
+    if not admin_exists:
+        try:
+            cursor.execute('''
+                INSERT INTO users (email, password, full_name, role)
+                VALUES (?, ?, ?, ?)
+            ''', ('admin@PasitDev.com', generate_password_hash('admin123', PASSWORD_HASH_METHOD), 'ผู้ดูแลระบบ', 'admin'))
+            conn.commit()
+            print("✅ สร้าง Admin account เริ่มต้น: admin@PasitDev.com / admin123")
+        except sqlite3.IntegrityError:
+            pass  # process อื่นสร้างไปแล้ว
 
     conn.close()
 
-# เรียกใช้ init_db เมื่อเริ่มต้น app
-init_db()
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_app_resources():
+    """
+    เตรียม database, โฟลเดอร์ uploads และข้อมูลที่คำนวณล่วงหน้า
+    เรียกซ้ำได้ ทำจริงครั้งเดียวต่อ process (import app.py เฉย ๆ จะไม่แตะ database / disk)
+    """
+    global _initialized
+    if _initialized:
+        return
+
+    with _init_lock:
+        if _initialized:
+            return
+
+        # สร้างโฟลเดอร์ uploads ถ้ายังไม่มี
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        init_db()
+        # ตารางอื่นใน database เดียวกับ users สร้างตอนเริ่ม app ไม่ใช่ตอน request แรกที่ใช้
+        # (schema ที่เปลี่ยนระหว่าง INSERT users พร้อมกัน ทำให้ trigger ของ users_fts ตอบ "no such table" ได้)
+        for store in (price_store, login_limiter, login_events):
+            store._connect().close()
+        get_provinces_responses()
+        price_uploads.ensure_started()
+        evaluation_jobs.ensure_started()
+        if METRICS_ENABLED:
+            metrics.start()
+
+        if PDF_WARMUP:
+            pdf_renderer.warm_up()
+
+        _initialized = True
+
+def create_app():
+    """
+    App factory: เตรียม resource ทั้งหมดแล้วคืน Flask app
+    ใช้กับ WSGI server เช่น gunicorn "app:create_app()"
+    """
+    init_app_resources()
+    return app
+
+@app.before_request
+def ensure_initialized():
+    """กันกรณีรันผ่าน app (ไม่ได้ผ่าน create_app) ให้เตรียม resource ก่อน request แรก"""
+    init_app_resources()
+    if METRICS_ENABLED:
+        metrics.start()  # worker ที่ fork หลัง create_app (gunicorn --preload) เริ่มเขียน snapshot ของตัวเอง
+
+# ========================================
+# Metrics (Prometheus)
+# ========================================
+
+HTTP_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+OLLAMA_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+PDF_SIZE_BUCKETS = (10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000)
+
+def format_metric_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def format_metric_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Metric:
+    """
+    metric หนึ่งชื่อ เก็บค่าแยกตาม label (tuple ของค่า label ตามลำดับ labelnames)
+    ค่าอยู่ใน memory ของแต่ละ process การบันทึกค่าแค่ lock + บวกเลข จึงเปิดไว้ตลอดได้
+    mode คือวิธีรวมค่าของ gauge จากหลาย process (sum / max / min) counter และ histogram รวมด้วยผลบวกเสมอ
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=(), mode='sum'):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.mode = mode
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def values(self):
+        """ค่าของ process นี้ {ค่า label: ค่า}"""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values_list):
+        """รวม values() ของหลาย process"""
+        combine = {'sum': lambda a, b: a + b, 'max': max, 'min': min}[
+            'sum' if self.kind in ('counter', 'histogram') else self.mode]
+        merged = {}
+        for values in values_list:
+            for labels, value in values.items():
+                merged[labels] = combine(merged[labels], value) if labels in merged else value
+        return merged
+
+    def samples(self, values):
+        """[(ชื่อ sample, ค่า label, ค่า, label เพิ่มเติม (ชื่อ, ค่า) หรือ None)] สำหรับแสดงผล"""
+        return [(self.name, labels, value, None) for labels, value in sorted(values.items())]
+
+    def expose(self, values=None):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, value, extra in self.samples(self.values() if values is None else values):
+            lines.append(f'{name}{format_metric_labels(self.labelnames, labels, extra)} {format_metric_value(value)}')
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=HTTP_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [จำนวนในแต่ละช่อง (ไม่สะสม) ..., ช่องเกิน bucket สุดท้าย, ผลรวม]
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def values(self):
+        with self._lock:
+            return {labels: list(state) for labels, state in self._values.items()}
+
+    def merge(self, values_list):
+        merged = {}
+        for values in values_list:
+            for labels, state in values.items():
+                if len(state) != len(self.buckets) + 2:
+                    continue  # snapshot จาก process ที่ใช้ bucket ชุดอื่น (โค้ดคนละเวอร์ชัน)
+                if labels in merged:
+                    merged[labels] = [a + b for a, b in zip(merged[labels], state)]
+                else:
+                    merged[labels] = list(state)
+        return merged
+
+    def samples(self, values):
+        samples = []
+        for labels, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', labels, cumulative, ('le', format_metric_value(float(bound)))))
+            count = cumulative + state[-2]
+            samples.append((f'{self.name}_bucket', labels, count, ('le', '+Inf')))
+            samples.append((f'{self.name}_sum', labels, state[-1], None))
+            samples.append((f'{self.name}_count', labels, count, None))
+        return samples
+
+class CallbackMetric(Metric):
+    """ค่าที่อ่านตอน scrape จาก fn() (ตัวเลข หรือ dict ของ labels -> ค่า) ไม่มีต้นทุนระหว่างรับ request"""
+
+    def __init__(self, name, help_text, fn, kind='gauge', labelnames=(), mode='sum'):
+        super().__init__(name, help_text, labelnames, mode)
+        self.fn = fn
+        self.kind = kind
+
+    def values(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            return dict(value)
+        return {} if value is None else {(): value}
+
+class MetricsRegistry:
+    """
+    รวม metric ทั้งหมดและแสดงผลในรูปแบบ Prometheus text (version 0.0.4)
+    ถ้ากำหนด directory ทุก process จะเขียนค่าของตัวเองลง metrics-<pid>.json ทุก interval วินาที
+    และตอน scrape จะรวมค่าจากทุกไฟล์ (แบบเดียวกับ multiprocess mode ของ prometheus_client)
+    worker ใดตอบ /metrics ก็ได้ค่ารวมเดียวกัน
+    - counter / histogram: รวมทุก process รวมถึง process ที่จบไปแล้ว ค่าจึงไม่ลดลงเมื่อ worker ถูก restart
+    - gauge: รวมเฉพาะ process ที่ยังทำงาน (ไฟล์ถูกเขียนภายใน 3 เท่าของ interval) ตาม mode ของ metric
+    - ไฟล์ของ process ที่จบไปแล้วนานเกิน dead_retention วินาทีจะถูกลบ
+    """
+
+    def __init__(self, directory=None, interval=5.0, dead_retention=7 * 24 * 60 * 60):
+        self.directory = directory
+        self.interval = interval
+        self.dead_retention = dead_retention
+        self._metrics = OrderedDict()
+        self._pid = None
+        self._write_lock = threading.Lock()
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'metric ซ้ำ: {metric.name}')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), mode='sum'):
+        return self.register(Gauge(name, help_text, labelnames, mode))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=HTTP_LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name, help_text, fn, kind='gauge', labelnames=(), mode='sum'):
+        return self.register(CallbackMetric(name, help_text, fn, kind, labelnames, mode))
+
+    def start(self):
+        """เริ่มเขียน snapshot ของ process นี้เป็นระยะ (เรียกซ้ำได้ process ที่ fork มาจะเริ่มของตัวเองใหม่)"""
+        if not self.directory or self._pid == os.getpid():
+            return
+
+        with self._write_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # path เต็ม: thread และ atexit เขียนที่เดิมแม้ working directory จะเปลี่ยนภายหลัง
+            self.directory = os.path.abspath(self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.write_snapshot()
+        atexit.register(self.write_snapshot)
+        threading.Thread(target=self._run, name='metrics-snapshot', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                print(f"⚠️ เขียน snapshot ของ metrics ไม่ได้: {e}")
+
+    def _local_values(self):
+        values = {}
+        for metric in self._metrics.values():
+            try:
+                values[metric.name] = metric.values()
+            except Exception as e:
+                # ค่าหนึ่งอ่านไม่ได้ (เช่น database ถูก lock) ไม่ให้ทั้งหน้า /metrics ใช้ไม่ได้
+                print(f"⚠️ อ่านค่า metric {metric.name} ไม่ได้: {e}")
+        return values
+
+    def write_snapshot(self, values=None):
+        """เขียนค่าปัจจุบันของ process นี้ลง metrics-<pid>.json (เขียนไฟล์ใหม่แล้ว rename จึงไม่มีใครอ่านไฟล์ครึ่ง ๆ)"""
+        values = self._local_values() if values is None else values
+        data = {name: [[list(labels), value] for labels, value in items.items()] for name, items in values.items()}
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        with self._write_lock:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(path + '.tmp', path)
+
+    def _collect(self, local):
+        """[(ยังทำงานอยู่, {ชื่อ metric: values})] ของทุก process (process นี้ใช้ค่าที่เพิ่งอ่าน)"""
+        processes = [(True, local)]
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            pid = entry.name[len('metrics-'):-len('.json')]
+            if not entry.name.startswith('metrics-') or not entry.name.endswith('.json') or not pid.isdigit():
+                continue
+            if int(pid) == os.getpid():
+                continue
+            try:
+                age = now - entry.stat().st_mtime
+                if age > self.dead_retention:
+                    os.remove(entry.path)
+                    continue
+                with open(entry.path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # ไฟล์ถูกลบ / แทนที่ระหว่างอ่าน
+            alive = age <= self.interval * 3
+            processes.append((alive, {
+                name: {tuple(labels): value for labels, value in items} for name, items in data.items()
+            }))
+        return processes
+
+    def render(self):
+        local = self._local_values()
+        processes = [(True, local)]
+        if self.directory and self._pid == os.getpid():
+            self.write_snapshot(local)
+            processes = self._collect(local)
+
+        lines = []
+        for metric in self._metrics.values():
+            if metric.name not in local:
+                continue
+            keep_dead = metric.kind in ('counter', 'histogram')
+            values_list = [values[metric.name] for alive, values in processes
+                           if (alive or keep_dead) and metric.name in values]
+            try:
+                lines.extend(metric.expose(metric.merge(values_list)))
+            except Exception as e:
+                print(f"⚠️ อ่านค่า metric {metric.name} ไม่ได้: {e}")
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry(METRICS_MULTIPROCESS_DIR, METRICS_SNAPSHOT_INTERVAL, METRICS_DEAD_RETENTION)
+
+# HTTP
+http_requests_total = metrics.counter(
+    'http_requests_total', 'จำนวน request แยกตาม route และ status', ('method', 'endpoint', 'status'))
+http_request_duration = metrics.histogram(
+    'http_request_duration_seconds', 'เวลาตอบ request แยกตาม route', ('method', 'endpoint'))
+http_requests_in_flight = metrics.gauge(
+    'http_requests_in_flight', 'request ที่กำลังทำงานอยู่แยกตาม route', ('endpoint',))
+
+# Ollama
+ollama_request_duration = metrics.histogram(
+    'ollama_request_duration_seconds', 'เวลาเรียก /api/generate ของ Ollama (ไม่รวมเวลารอคิว)', ('mode',),
+    OLLAMA_LATENCY_BUCKETS)
+ollama_queue_wait = metrics.histogram(
+    'ollama_queue_wait_seconds', 'เวลาที่ request รอคิวก่อนได้เรียก Ollama', (), OLLAMA_LATENCY_BUCKETS)
+ollama_eval_tokens = metrics.counter('ollama_eval_tokens_total', 'จำนวน token ที่ Ollama สร้าง (eval_count)')
+ollama_prompt_tokens = metrics.counter(
+    'ollama_prompt_eval_tokens_total', 'จำนวน token ของ prompt (prompt_eval_count)')
+ollama_eval_seconds = metrics.counter(
+    'ollama_eval_duration_seconds_total', 'เวลาที่ Ollama ใช้สร้าง token รวม (eval_duration)')
+ollama_load_duration = metrics.histogram(
+    'ollama_load_duration_seconds', 'เวลาโหลด model ต่อการเรียก (load_duration)', (), OLLAMA_LATENCY_BUCKETS)
+ollama_tokens_per_second = metrics.histogram(
+    'ollama_tokens_per_second', 'ความเร็วการสร้าง token ต่อการเรียก (eval_count / eval_duration)', (),
+    TOKENS_PER_SECOND_BUCKETS)
+
+# PDF
+pdf_render_duration = metrics.histogram(
+    'pdf_render_duration_seconds', 'เวลาสร้าง PDF ใน worker แยกตามชนิดงาน', ('kind',))
+pdf_size_bytes = metrics.histogram('pdf_size_bytes', 'ขนาดไฟล์ PDF ที่สร้าง', ('kind',), PDF_SIZE_BUCKETS)
+
+# อัปโหลดราคา
+price_upload_rows = metrics.counter('price_upload_rows_total', 'จำนวนแถวราคาที่นำเข้าสำเร็จ')
+price_upload_errors = metrics.counter('price_upload_error_rows_total', 'จำนวนแถวราคาที่นำเข้าไม่ได้')
+price_upload_duration = metrics.histogram(
+    'price_upload_duration_seconds', 'เวลาอ่านและนำเข้าไฟล์ราคาต่อการอัปโหลด')
+price_upload_rows_per_second = metrics.gauge(
+    'price_upload_rows_per_second', 'ความเร็วการนำเข้าของการอัปโหลดครั้งล่าสุด (แถว/วินาที)', mode='max')
+
+# ค่าที่อ่านจากสถิติเดิมของแต่ละส่วนตอน scrape
+# ค่าที่ทุก process เห็นเหมือนกัน (ข้อมูลใน database ร่วมกัน) ใช้ mode='max' แทนการบวก
+metrics.callback('price_store_entries', 'จำนวนรายการราคาที่อัปโหลดไว้', lambda: len(price_store), mode='max')
+metrics.callback('price_store_version', 'เวอร์ชันข้อมูลราคา (เพิ่มทุกครั้งที่อัปโหลด)', lambda: price_store.version,
+                 mode='max')
+metrics.callback('ollama_active_requests', 'การเรียก Ollama ที่กำลังทำงาน', lambda: ollama_client.active)
+metrics.callback('ollama_waiting_requests', 'request ที่รอคิว Ollama', lambda: ollama_client.waiting)
+metrics.callback('ollama_rejected_total', 'request ที่รอคิว Ollama นานเกินจนได้ 503',
+                 lambda: ollama_client.rejected, 'counter')
+metrics.callback('ollama_backend_up', 'สถานะของแต่ละ backend (1 = ใช้ได้, 0 = เชื่อมต่อไม่ได้หรือถูกพักไว้)',
+                 lambda: ollama_backend_stats('up'), 'gauge', ('backend',), mode='max')
+metrics.callback('ollama_backend_active_requests', 'การเรียก Ollama ที่กำลังทำงานแยกตาม backend',
+                 lambda: ollama_backend_stats('active'), 'gauge', ('backend',))
+metrics.callback('ollama_backend_requests_total', 'จำนวนการเรียก Ollama แยกตาม backend',
+                 lambda: ollama_backend_stats('requests'), 'counter', ('backend',))
+metrics.callback('ollama_backend_ejections_total', 'จำนวนครั้งที่ backend ถูกพักไว้เพราะเรียกไม่สำเร็จ',
+                 lambda: ollama_backend_stats('ejections'), 'counter', ('backend',))
+metrics.callback('ollama_failovers_total', 'จำนวนครั้งที่ย้ายการเรียกไป backend อื่น',
+                 lambda: ollama_client.failovers, 'counter')
+metrics.callback('ollama_up', 'ผลตรวจสอบสถานะ Ollama ล่าสุด (1 = เชื่อมต่อได้)',
+                 lambda: {True: 1, False: 0}.get(ollama_health.stats()['connected']), mode='max')
+metrics.callback('evaluation_cache_requests_total', 'การค้นหาผลประเมินใน cache แยกตามผล',
+                 lambda: {('hit',): evaluation_cache.hits, ('miss',): evaluation_cache.misses},
+                 'counter', ('result',))
+metrics.callback('evaluation_singleflight_executions_total', 'การประเมินที่เรียก Ollama จริง (ไม่นับที่รวมกับ request อื่น)',
+                 lambda: evaluation_flight.executions, 'counter')
+metrics.callback('evaluation_singleflight_coalesced_total', 'request ที่ใช้ผลจากการประเมินชุดเดียวกันที่กำลังทำอยู่',
+                 lambda: evaluation_flight.coalesced, 'counter')
+metrics.callback('evaluation_singleflight_in_flight', 'การประเมินที่กำลังทำอยู่ (แยกตามข้อมูลทรัพย์สิน)',
+                 lambda: evaluation_flight.stats()['in_flight'])
+metrics.callback('evaluation_singleflight_waiting', 'request ที่กำลังรอผลจากการประเมินชุดเดียวกัน',
+                 lambda: evaluation_flight.waiting)
+metrics.callback('evaluation_jobs_queued', 'งานประเมินที่รอในคิว', lambda: evaluation_jobs.stats()['queued'],
+                 mode='max')
+metrics.callback('pdf_pending_renders', 'งานสร้าง PDF ที่รอคิวและกำลังสร้าง', lambda: pdf_pool.pending)
+metrics.callback('pdf_rejected_total', 'งานสร้าง PDF ที่ถูกปฏิเสธเพราะคิวเต็ม', lambda: pdf_pool.rejected, 'counter')
+metrics.callback('pdf_timeouts_total', 'งานสร้าง PDF ที่รอผลเกิน PDF_RENDER_TIMEOUT (ตอบ 503)',
+                 lambda: pdf_pool.timeouts, 'counter')
+metrics.callback('pdf_cache_requests_total', 'การค้นหา PDF ใน cache แยกตามผล',
+                 lambda: {('hit',): pdf_cache.hits, ('miss',): pdf_cache.misses}, 'counter', ('result',))
+metrics.callback('price_uploads_queued', 'ไฟล์ราคา (อัปโหลดแบบ streaming) ที่รอนำเข้า',
+                 lambda: price_uploads.stats()['queued'], mode='max')
+metrics.callback('user_cache_requests_total', 'การค้นหาผู้ใช้ใน cache แยกตามผล',
+                 lambda: {('hit',): user_cache.hits, ('miss',): user_cache.misses}, 'counter', ('result',))
+metrics.callback('user_cache_evictions_total', 'ผู้ใช้ที่ถูกลบออกจาก cache เพราะเต็ม (LRU)',
+                 lambda: user_cache.evictions, 'counter')
+metrics.callback('user_cache_invalidations_total', 'จำนวนครั้งที่ล้าง cache ผู้ใช้เพราะข้อมูลผู้ใช้ถูกแก้',
+                 lambda: user_cache.invalidations, 'counter')
+metrics.callback('password_hash_operations_total', 'จำนวนการ hash / ตรวจสอบรหัสผ่านแยกตามชนิด',
+                 lambda: {('hash',): password_hasher.hashes, ('verify',): password_hasher.verifies,
+                          ('rehash',): password_hasher.rehashes}, 'counter', ('operation',))
+metrics.callback('password_hash_seconds_total', 'เวลารวมของการ hash / ตรวจสอบรหัสผ่าน (รวมเวลารอ pool)',
+                 lambda: password_hasher.seconds, 'counter')
+metrics.callback('password_hash_rejected_total', 'งาน hash รหัสผ่านที่ถูกปฏิเสธเพราะคิวเต็มหรือรอนานเกิน',
+                 lambda: password_hasher.rejected, 'counter')
+metrics.callback('login_events_pending', 'login event ที่ยังไม่ได้เขียนลง database',
+                 lambda: login_events.stats()['pending'])
+
+def ollama_backend_stats(key):
+    """ค่าของแต่ละ backend สำหรับ metric (key = 'up' คือใช้งานได้และไม่ถูกพักไว้)"""
+    values = {}
+    for backend in ollama_client.stats()['backends']:
+        if key == 'up':
+            values[(backend['url'],)] = int(backend['healthy'] is not False and not backend['ejected'])
+        else:
+            values[(backend['url'],)] = backend[key]
+    return values
+
+def observe_ollama_response(data):
+    """บันทึกตัวเลขที่ Ollama ส่งมากับคำตอบสุดท้าย (หน่วยเวลาเป็น nanosecond)"""
+    eval_count = data.get('eval_count') or 0
+    eval_duration = (data.get('eval_duration') or 0) / 1e9
+    ollama_eval_tokens.inc(amount=eval_count)
+    ollama_prompt_tokens.inc(amount=data.get('prompt_eval_count') or 0)
+    ollama_eval_seconds.inc(amount=eval_duration)
+    if data.get('load_duration') is not None:
+        ollama_load_duration.observe(data['load_duration'] / 1e9)
+    if eval_count and eval_duration:
+        ollama_tokens_per_second.observe(eval_count / eval_duration)
+
+def observe_price_upload(row_count, error_count, seconds):
+    price_upload_rows.inc(amount=row_count)
+    price_upload_errors.inc(amount=error_count)
+    price_upload_duration.observe(seconds)
+    if seconds > 0:
+        price_upload_rows_per_second.set(round(row_count / seconds, 1))
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_requests_in_flight.inc((g.metrics_endpoint,))
+
+@app.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exception):
+    """บันทึกเวลาและ status ของ request (ทำงานแม้ view จะ raise exception)"""
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+
+    endpoint = g.pop('metrics_endpoint')
+    status = g.pop('metrics_status', 500)
+    http_requests_in_flight.dec((endpoint,))
+    http_request_duration.observe(time.perf_counter() - start, (request.method, endpoint))
+    http_requests_total.inc((request.method, endpoint, str(status)))
+
+# ========================================
+# Price Store
+# ========================================
+
+PRICE_CACHE_CHECK_INTERVAL = 1.0  # วินาที ตรวจสอบว่ามีการอัปโหลดราคาใหม่ (จาก process อื่น) บ่อยแค่ไหน
+
+# คอลัมน์ใน price_uploads สำหรับติดตามสถานะการอัปโหลดแบบ streaming (การอัปโหลดปกติมีสถานะ done ทันที)
+PRICE_UPLOAD_STATUS_COLUMNS = (
+    ('status', "TEXT NOT NULL DEFAULT 'done'"),  # receiving / queued / processing / done / error
+    ('stored_path', 'TEXT'),
+    ('bytes_total', 'INTEGER'),
+    ('bytes_processed', 'INTEGER'),
+    ('errors', 'TEXT'),  # JSON ข้อความ error รายแถว (สูงสุด UPLOAD_MAX_REPORTED_ERRORS รายการ)
+    ('error', 'TEXT'),
+    ('started_at', 'REAL'),
+    ('finished_at', 'REAL'),
+    ('user_id', 'INTEGER'),  # ผู้อัปโหลด (ดูสถานะได้เฉพาะผู้อัปโหลดและ admin)
+    ('heartbeat_at', 'REAL')  # เวลาล่าสุดที่การรับไฟล์ / การนำเข้ายังทำงานอยู่ (ดู PRICE_UPLOAD_STALE_AFTER)
+)
+
+class PriceStore:
+    """
+    ข้อมูลราคาที่อัปโหลดจาก Excel เก็บใน SQLite (ตาราง price_data, key คือ (province, property_type))
+    - ทุก process/worker เห็นข้อมูลชุดเดียวกัน และข้อมูลยังอยู่หลัง restart
+    - ทุกการอัปโหลดบันทึกใน price_uploads และเพิ่มเลข version ใน price_meta
+      (อัปโหลดแบบ streaming บันทึกทีละ chunk และเพิ่ม version ทุก chunk)
+    - อ่านผ่าน cache ใน memory (dict) ซึ่งโหลดใหม่เมื่อ version เปลี่ยน
+    """
+
+    def __init__(self, path, check_interval):
+        self.path = path
+        self.check_interval = check_interval
+        self._prices = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._table_ready:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS price_data (
+                    province TEXT NOT NULL,
+                    property_type TEXT NOT NULL,
+                    base_price_per_sqm REAL NOT NULL,
+                    upload_id INTEGER,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (province, property_type)
+                ) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS price_uploads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT,
+                    row_count INTEGER NOT NULL,
+                    error_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+
+                CREATE TABLE IF NOT EXISTS price_meta (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL
+                );
+
+                INSERT OR IGNORE INTO price_meta (id, version) VALUES (1, 0);
+            ''')
+
+            # คอลัมน์สถานะของการอัปโหลดแบบ streaming (เพิ่มให้ฐานข้อมูลเดิมด้วย)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(price_uploads)')}
+            for column, definition in PRICE_UPLOAD_STATUS_COLUMNS:
+                if column not in columns:
+                    try:
+                        conn.execute(f'ALTER TABLE price_uploads ADD COLUMN {column} {definition}')
+                    except sqlite3.OperationalError:
+                        pass  # process อื่นเพิ่มไปแล้ว
+            conn.commit()
+            self._table_ready = True
+        return conn
+
+    def _refresh(self):
+        """โหลดข้อมูลใหม่ถ้า version ในฐานข้อมูลเปลี่ยน (ตรวจสอบไม่บ่อยกว่า check_interval)"""
+        now = time.time()
+        if now - self._checked_at < self.check_interval:
+            return
+
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+
+            conn = self._connect()
+            try:
+                version = conn.execute('SELECT version FROM price_meta WHERE id = 1').fetchone()[0]
+                if version != self._version:
+                    rows = conn.execute('SELECT province, property_type, base_price_per_sqm FROM price_data').fetchall()
+                    self._prices = {(province, property_type): price for province, property_type, price in rows}
+                    self._version = version
+            finally:
+                conn.close()
+
+            self._checked_at = now
+
+    @property
+    def version(self):
+        self._refresh()
+        return self._version
+
+    def snapshot(self):
+        """คืนค่า (version, dict ของ (province, property_type) -> ราคาต่อตารางเมตร) ห้ามแก้ไข dict ที่ได้"""
+        self._refresh()
+        return self._version, self._prices
+
+    def get(self, province, property_type):
+        """ราคาต่อตารางเมตรที่อัปโหลดไว้ หรือ None ถ้าไม่มี"""
+        self._refresh()
+        return self._prices.get((province, property_type))
+
+    def all(self):
+        """ข้อมูลราคาทั้งหมด เรียงตามจังหวัดและประเภท"""
+        self._refresh()
+        return [
+            {'province': province, 'property_type': property_type, 'base_price_per_sqm': price}
+            for (province, property_type), price in sorted(self._prices.items())
+        ]
+
+    def __len__(self):
+        self._refresh()
+        return len(self._prices)
+
+    def bulk_upsert(self, rows, filename=None, error_count=0):
+        """
+        เพิ่ม/อัปเดตราคาหลายรายการใน transaction เดียว
+        rows คือ list ของ (province, property_type, base_price_per_sqm) คืนค่า upload id
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                upload_id = conn.execute(
+                    'INSERT INTO price_uploads (filename, row_count, error_count) VALUES (?, ?, ?)',
+                    (filename, len(rows), error_count)
+                ).lastrowid
+                version = self._upsert(conn, rows, upload_id)
+        finally:
+            conn.close()
+
+        self._apply(rows, version)
+        return upload_id
+
+    def _upsert(self, conn, rows, upload_id):
+        """บันทึกราคาและเพิ่ม version (ต้องเรียกภายใน transaction) คืนค่า version ใหม่"""
+        conn.executemany('''
+            INSERT INTO price_data (province, property_type, base_price_per_sqm, upload_id)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (province, property_type) DO UPDATE SET
+                base_price_per_sqm = excluded.base_price_per_sqm,
+                upload_id = excluded.upload_id,
+                updated_at = CURRENT_TIMESTAMP
+        ''', ((province, property_type, price, upload_id) for province, property_type, price in rows))
+        conn.execute('UPDATE price_meta SET version = version + 1 WHERE id = 1')
+        return conn.execute('SELECT version FROM price_meta WHERE id = 1').fetchone()[0]
+
+    def _apply(self, rows, version):
+        """อัปเดต cache ใน memory หลังบันทึกสำเร็จ"""
+        with self._lock:
+            if self._version is not None and version == self._version + 1:
+                # ไม่มี process อื่นเขียนคั่นระหว่างนั้น อัปเดต cache ได้เลยไม่ต้องโหลดใหม่ทั้งหมด
+                prices = dict(self._prices)
+                prices.update(((province, property_type), price) for province, property_type, price in rows)
+                self._prices = prices
+                self._version = version
+            else:
+                self._checked_at = 0.0
+
+    def create_upload(self, filename, status, stored_path=None, user_id=None, max_active=None):
+        """
+        สร้างรายการอัปโหลดแบบ streaming (ยังไม่มีข้อมูล) คืนค่า upload id
+        คืนค่า None ถ้าผู้ใช้มีการอัปโหลดที่ยังไม่เสร็จครบ max_active รายการแล้ว (ตรวจสอบใน statement เดียวกัน)
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute('''
+                    INSERT INTO price_uploads (filename, row_count, error_count, status, stored_path, user_id, heartbeat_at)
+                    SELECT ?, 0, 0, ?, ?, ?, ?
+                    WHERE ? IS NULL OR (
+                        SELECT COUNT(*) FROM price_uploads
+                        WHERE user_id = ? AND status IN ('receiving', 'queued', 'processing')
+                    ) < ?
+                ''', (filename, status, stored_path, user_id, time.time(), max_active, user_id, max_active))
+                return cursor.lastrowid if cursor.rowcount == 1 else None
+        finally:
+            conn.close()
+
+    def claim_upload(self, upload_id):
+        """
+        จองการอัปโหลดที่รอนำเข้า (ป้องกันไม่ให้ worker อื่นทำซ้ำ)
+        คืนค่าเวลาที่จอง (ใช้กับ append_upload_rows) หรือ None ถ้าจองไม่ได้
+        """
+        claimed_at = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                claimed = conn.execute('''
+                    UPDATE price_uploads
+                    SET status = 'processing', started_at = ?, heartbeat_at = ?,
+                        row_count = 0, error_count = 0, bytes_processed = 0
+                    WHERE id = ? AND status = 'queued'
+                ''', (claimed_at, claimed_at, upload_id)).rowcount == 1
+        finally:
+            conn.close()
+        return claimed_at if claimed else None
+
+    def append_upload_rows(self, upload_id, claimed_at, rows, row_count, error_count, bytes_processed):
+        """
+        บันทึกข้อมูลหนึ่ง chunk ของการอัปโหลดแบบ streaming ความคืบหน้า และ heartbeat ใน transaction เดียว
+        คืนค่า False (ไม่บันทึก) ถ้าการอัปโหลดถูกนำกลับเข้าคิวและจองใหม่แล้ว (claimed_at ไม่ตรง)
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                owned = conn.execute('''
+                    UPDATE price_uploads
+                    SET row_count = row_count + ?, error_count = error_count + ?,
+                        bytes_processed = COALESCE(?, bytes_processed), heartbeat_at = ?
+                    WHERE id = ? AND status = 'processing' AND started_at = ?
+                ''', (row_count, error_count, bytes_processed, time.time(), upload_id, claimed_at)).rowcount == 1
+                version = self._upsert(conn, rows, upload_id) if owned and rows else None
+        finally:
+            conn.close()
+
+        if version is not None:
+            self._apply(rows, version)
+        return owned
+
+    def update_upload(self, upload_id, **fields):
+        conn = self._connect()
+        try:
+            with conn:
+                assignments = ', '.join(f'{name} = ?' for name in fields)
+                conn.execute(f'UPDATE price_uploads SET {assignments} WHERE id = ?', (*fields.values(), upload_id))
+        finally:
+            conn.close()
+
+    def get_upload(self, upload_id):
+        """ข้อมูลการอัปโหลด หรือ None ถ้าไม่พบ"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute('SELECT * FROM price_uploads WHERE id = ?', (upload_id,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def recover_uploads(self, stale_after):
+        """
+        จัดการการอัปโหลดที่ไม่มี heartbeat นานเกิน stale_after (process ที่ทำอยู่ตาย)
+        - processing: นำกลับเข้าคิว (ไฟล์อยู่บน disk ครบแล้ว)
+        - receiving: เป็น error (body ที่รับไม่ครบหายไปกับ process)
+        คืนค่า (id ที่รอนำเข้าทั้งหมด, stored_path ของการรับไฟล์ที่ถูกยกเลิก)
+        """
+        now = time.time()
+        cutoff = now - stale_after
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('''
+                    UPDATE price_uploads SET status = 'queued', started_at = NULL, heartbeat_at = NULL
+                    WHERE status = 'processing' AND COALESCE(heartbeat_at, started_at, 0) < ?
+                ''', (cutoff,))
+                abandoned = conn.execute('''
+                    SELECT id, stored_path FROM price_uploads
+                    WHERE status = 'receiving' AND COALESCE(heartbeat_at, 0) < ?
+                ''', (cutoff,)).fetchall()
+                conn.executemany('''
+                    UPDATE price_uploads SET status = 'error', error = ?, finished_at = ?
+                    WHERE id = ? AND status = 'receiving'
+                ''', [('การรับไฟล์ถูกขัดจังหวะ กรุณาอัปโหลดใหม่', now, upload_id) for upload_id, _ in abandoned])
+                queued = [row[0] for row in conn.execute(
+                    "SELECT id FROM price_uploads WHERE status = 'queued' ORDER BY id"
+                )]
+        finally:
+            conn.close()
+        return queued, [path for _, path in abandoned if path]
+
+    def active_upload_paths(self):
+        """stored_path ของการอัปโหลดที่ยังไม่เสร็จ (ไฟล์ที่ยังต้องใช้)"""
+        conn = self._connect()
+        try:
+            return {row[0] for row in conn.execute('''
+                SELECT stored_path FROM price_uploads
+                WHERE status IN ('receiving', 'queued', 'processing') AND stored_path IS NOT NULL
+            ''')}
+        finally:
+            conn.close()
+
+    def uploads(self, limit=20):
+        """ประวัติการอัปโหลดล่าสุด"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                'SELECT id, filename, row_count, error_count, created_at FROM price_uploads ORDER BY id DESC LIMIT ?',
+                (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+# เก็บข้อมูลราคาที่อัปโหลดจาก Excel
+price_store = PriceStore(DATABASE, PRICE_CACHE_CHECK_INTERVAL)
+
+class PriceIndex:
+    """
+    ราคาต่อตารางเมตรของทุก (จังหวัด, ประเภททรัพย์สิน) ที่คำนวณไว้ล่วงหน้าจากข้อมูลราคา 1 version
+    ลำดับการเลือกราคา:
+    1. uploaded - ราคาที่อัปโหลดไว้ของจังหวัดและประเภทนั้น
+    2. regional - ค่าเฉลี่ยของราคาที่อัปโหลดในภูมิภาคเดียวกัน (ปรับด้วยตัวคูณของแต่ละจังหวัด)
+    3. default  - ราคาพื้นฐานของประเทศ (DEFAULT_BASE_PRICES) × ตัวคูณจังหวัด
+    """
+
+    def __init__(self, version, prices):
+        self.version = version
+        self.entries = {}
+        self._frame_lookup = None
+
+        # ราคาที่อัปโหลด หารด้วยตัวคูณจังหวัด = ราคาเทียบระดับประเทศ ใช้หาค่าเฉลี่ยรายภูมิภาค
+        regional_totals = {}
+        for (province, property_type), price in prices.items():
+            self.entries[(province, property_type)] = (price, 'uploaded')
+
+            province_info = PROVINCES_DATA.get(province)
+            if province_info:
+                key = (province_info['region'], property_type)
+                total, count = regional_totals.get(key, (0.0, 0))
+                regional_totals[key] = (total + price / province_info['multiplier'], count + 1)
+
+        property_types = set(DEFAULT_BASE_PRICES) | {property_type for _, property_type in prices}
+        for province, province_info in PROVINCES_DATA.items():
+            multiplier = province_info['multiplier']
+            for property_type in property_types:
+                if (province, property_type) in self.entries:
+                    continue
+
+                regional = regional_totals.get((province_info['region'], property_type))
+                if regional:
+                    total, count = regional
+                    self.entries[(province, property_type)] = (total / count * multiplier, 'regional')
+                else:
+                    base_price = DEFAULT_BASE_PRICES.get(property_type, DEFAULT_BASE_PRICE)
+                    self.entries[(province, property_type)] = (base_price * multiplier, 'default')
+
+    def lookup(self, province, property_type):
+        """คืนค่า (ราคาต่อตารางเมตร, ที่มาของราคา)"""
+        entry = self.entries.get((province, property_type))
+        if entry is not None:
+            return entry
+
+        # จังหวัดหรือประเภทที่ไม่รู้จัก
+        multiplier = PROVINCES_DATA.get(province, {}).get('multiplier', 1.0)
+        return DEFAULT_BASE_PRICES.get(property_type, DEFAULT_BASE_PRICE) * multiplier, 'default'
+
+    def lookup_frame(self, province, property_type):
+        """lookup() ทั้งตาราง (vectorized) คืนค่า (Series ราคาต่อตารางเมตร, Series ที่มาของราคา)"""
+        import pandas as pd
+
+        if self._frame_lookup is None:
+            keys = pd.MultiIndex.from_tuples(list(self.entries.keys()))
+            self._frame_lookup = pd.DataFrame(list(self.entries.values()), index=keys, columns=['price', 'source'])
+
+        matched = self._frame_lookup.reindex(pd.MultiIndex.from_arrays([province, property_type]))
+        price = pd.Series(matched['price'].to_numpy(), index=province.index)
+        source = pd.Series(matched['source'].to_numpy(), index=province.index)
+
+        missing = price.isna()
+        if missing.any():
+            multiplier = province[missing].map({name: info['multiplier'] for name, info in PROVINCES_DATA.items()})
+            price[missing] = property_type[missing].map(DEFAULT_BASE_PRICES).fillna(DEFAULT_BASE_PRICE) * multiplier.fillna(1.0)
+            source[missing] = 'default'
+
+        return price, source
+
+_price_index = None
+_price_index_lock = threading.Lock()
+
+def get_price_index():
+    """PriceIndex ของข้อมูลราคา version ปัจจุบัน (สร้างใหม่เฉพาะเมื่อ version เปลี่ยน)"""
+    global _price_index
+
+    version, prices = price_store.snapshot()
+    index = _price_index
+    if index is not None and index.version == version:
+        return index
+
+    with _price_index_lock:
+        if _price_index is None or _price_index.version != version:
+            _price_index = PriceIndex(version, prices)
+        return _price_index
 
 # ========================================
 # User Model for Flask-Login
 # ========================================
 
-class User(UserMixin):
+class User:
+    """ผู้ใช้ที่ login แล้ว (มี attribute ที่ Flask-Login ต้องการครบ โดยไม่ต้องใช้ UserMixin)"""
+
+    __slots__ = ('id', 'email', 'full_name', 'role')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
     def __init__(self, id, email, full_name, role):
         self.id = id
         self.email = email
         self.full_name = full_name
         self.role = role
 
+    def get_id(self):
+        return str(self.id)
+
     def is_admin(self):
         return self.role == 'admin'
 
+class UserCache:
+    """
+    Cache ของ User ตาม id เพื่อไม่ให้ load_user ต้อง query database ทุก request
+    - อ่านตาราง user_changes ไม่บ่อยกว่า check_interval วินาที แล้วลบเฉพาะผู้ใช้ที่ถูกแก้/ลบ
+      (จาก process ใดก็ได้) การแก้ไขจึงมีผลกับทุก worker ภายใน check_interval วินาที
+    - รายการที่เก่ากว่า ttl วินาทีจะโหลดใหม่
+    - เกิน max_entries จะลบรายการที่ไม่ได้ใช้นานที่สุด (LRU)
+    """
+
+    def __init__(self, ttl, max_entries, check_interval):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.version = None  # user_changes.version ล่าสุดที่อ่านแล้ว
+        self._checked_at = 0.0
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, connect):
+        """
+        ลบผู้ใช้ที่ถูกแก้/ลบตั้งแต่ครั้งก่อนออกจาก cache (ตรวจสอบไม่บ่อยกว่า check_interval)
+        connect คือฟังก์ชันที่คืน connection เรียกเฉพาะเมื่อถึงเวลาตรวจสอบ
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+
+        with self._refresh_lock:
+            if now - self._checked_at < self.check_interval:
+                return
+
+            conn = connect()
+            if self.version is None:
+                rows = []
+                version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM user_changes').fetchone()[0]
+            else:
+                rows = conn.execute('SELECT version, user_id FROM user_changes WHERE version > ? ORDER BY version',
+                                    (self.version,)).fetchall()
+                version = rows[-1][0] if rows else self.version
+
+            with self._lock:
+                if self.version is not None and rows and rows[0][0] != self.version + 1:
+                    # รายการเก่าถูกลบไปแล้ว ไม่รู้ว่าผู้ใช้คนใดถูกแก้บ้าง
+                    self.invalidations += len(self._users)
+                    self._users.clear()
+                else:
+                    for _, user_id in rows:
+                        if self._users.pop(user_id, None) is not None:
+                            self.invalidations += 1
+                self.version = version
+            self._checked_at = time.monotonic()
+
+    def get(self, user_id):
+        """คืน User ที่ cache ไว้ หรือ None ถ้าไม่มี/หมดอายุ"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry and now - entry[1] <= self.ttl:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._users[user_id]
+            self.misses += 1
+            return None
+
+    def set(self, user, version):
+        """
+        cache User ที่อ่านจาก database หลังจากอ่านค่า self.version (ส่งมาเป็น version)
+        ถ้าระหว่างนั้นมีการ refresh() ข้อมูลที่อ่านมาอาจเก่ากว่าการแก้ไขที่เพิ่งเห็น จึงไม่ cache
+        """
+        with self._lock:
+            if version != self.version:
+                return
+            self._users[user.id] = (user, time.monotonic())
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        """ลบออกทันทีใน process นี้ (process อื่นเห็นการแก้ไขจาก user_changes)"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._users),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'version': self.version,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_MAX_ENTRIES, USER_CACHE_CHECK_INTERVAL)
+
 @login_manager.user_loader
 def load_user(user_id):
-    """โหลดข้อมูลผู้ใช้จาก database"""
+    """โหลดข้อมูลผู้ใช้จาก cache หรือ database"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    user_cache.refresh(get_db)
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    version = user_cache.version  # อ่านก่อน query (ดู UserCache.set)
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+    cursor.execute('SELECT id, email, full_name, role FROM users WHERE id = ?', (user_id,))
     user_data = cursor.fetchone()
-    conn.close()
 
     if user_data:
-        return User(
+        user = User(
             id=user_data['id'],
             email=user_data['email'],
             full_name=user_data['full_name'],
             role=user_data['role']
         )
+        user_cache.set(user, version)
+        return user
     return None
 
 def admin_required(f):
@@ -228,193 +1501,2704 @@ def admin_required(f):
     return decorated_function
 
 # ========================================
-# Helper Functions
+# Password Hashing
 # ========================================
 
-def allowed_file(filename):
-    """ตรวจสอบว่าไฟล์เป็น Excel หรือไม่"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def generate_pdf_report(evaluation_data, ai_response):
+class PasswordHashBusyError(Exception):
+    """คิว hash รหัสผ่านเต็ม"""
 
-    # Register Thai fonts
-    pdfmetrics.registerFont(TTFont('THSarabun', 'fonts/THSarabunNew.ttf'))
-    pdfmetrics.registerFont(TTFont('THSarabun-Bold', 'fonts/THSarabunNew-Bold.ttf'))
+class PasswordHasher:
+    """
+    hash / ตรวจสอบรหัสผ่านใน process pool แยกจาก Flask worker
+    (KDF ตั้งใจให้ช้า ถ้าทำใน request thread ตอน login พร้อมกันจำนวนมากจะแย่ง CPU กันทั้งระบบ)
+    - workers = 0 ทำใน thread ของ request เอง
+    - งานที่รอคิวเกิน max_pending จะรอได้ไม่เกิน timeout วินาที แล้ว raise PasswordHashBusyError
+    """
 
-    buffer = BytesIO()
+    def __init__(self, method, workers, max_pending, timeout):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.hashes = 0
+        self.verifies = 0
+        self.rehashes = 0
+        self.rejected = 0
+        self.seconds = 0.0
+        self._executor = None
+        self._dummy_hash = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+
+    def _busy(self):
+        with self._lock:
+            self.rejected += 1
+        return PasswordHashBusyError('ขณะนี้มีผู้เข้าสู่ระบบจำนวนมาก กรุณาลองใหม่อีกครั้งในอีกสักครู่')
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # ใช้ spawn เพราะ process หลักมี thread อื่นทำงานอยู่ (fork แล้วอาจ deadlock)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise self._busy()
+
+        started = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return fn(*args)
 
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=40,
-        leftMargin=40,
-        topMargin=40,
-        bottomMargin=40
-    )
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                future = self._get_executor().submit(fn, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                # pool ช้าหรืองานค้างมาก: ยกเลิกงาน (ถ้ายังไม่เริ่ม) แล้วให้ตอบ 503 แทน 500
+                future.cancel()
+                raise self._busy()
+        finally:
+            self._slots.release()
+            with self._lock:
+                self.seconds += time.perf_counter() - started
+
+    def hash(self, password):
+        with self._lock:
+            self.hashes += 1
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        with self._lock:
+            self.verifies += 1
+        return self._run(check_password_hash, pwhash, password)
+
+    def rehash(self, password):
+        """hash รหัสผ่านใหม่แทน hash เดิมที่ needs_rehash()"""
+        with self._lock:
+            self.rehashes += 1
+        return self.hash(password)
+
+    @property
+    def dummy_hash(self):
+        """
+        hash ของรหัสผ่านสุ่มด้วย method ปัจจุบัน (สร้างครั้งเดียว) ใช้ตรวจสอบแทนเมื่อไม่พบอีเมล์
+        ให้เวลาตอบเท่ากับบัญชีที่มีอยู่จริง
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = generate_password_hash(secrets.token_hex(16), self.method)
+        return self._dummy_hash
+
+    @property
+    def prefix(self):
+        """
+        ส่วนหน้าของ hash ที่ method ปัจจุบันสร้าง (เช่น 'scrypt' -> 'scrypt:32768:8:1')
+        ได้จาก dummy_hash จึงตรงกับ hash จริงแม้ method ไม่ได้ระบุ cost เอง
+        """
+        return self.dummy_hash.split('$', 1)[0]
+
+    def needs_rehash(self, pwhash):
+        """hash ถูกสร้างด้วย method/cost อื่น (เช่น hash เก่าก่อนเปลี่ยน PASSWORD_HASH_METHOD)"""
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    def stats(self):
+        with self._lock:
+            total = self.hashes + self.verifies
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'hashes': self.hashes,
+                'verifies': self.verifies,
+                'rehashes': self.rehashes,
+                'rejected': self.rejected,
+                'avg_ms': round(self.seconds / total * 1000, 2) if total else 0.0
+            }
+
+password_hasher = PasswordHasher(PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING,
+                                 PASSWORD_HASH_TIMEOUT)
+
+class LoginRateLimiter:
+    """
+    นับจำนวนครั้งที่ login ผิดต่อ key (IP / IP + อีเมล์ / อีเมล์) ภายในช่วงเวลา window วินาที
+    เก็บในตาราง login_failures จึงนับรวมทุก worker process และยังอยู่หลัง restart
+    login สำเร็จจะล้างประวัติของอีเมล์นั้น
+    """
 
-    styles = getSampleStyleSheet()
+    def __init__(self, path, window, prune_interval=60):
+        self.path = path
+        self.window = window
+        self.prune_interval = prune_interval
+        self.blocked = 0
+        self.delayed = 0
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._table_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS login_failures (
+                    key TEXT NOT NULL,
+                    failed_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_login_failures_key ON login_failures (key, failed_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_login_failures_failed_at ON login_failures (failed_at)')
+            conn.commit()
+            self._table_ready = True
+        return conn
 
-    # Title Style
-    styles.add(ParagraphStyle(
-        name='TitleTH',
-        fontName='THSarabun-Bold',
-        fontSize=26,
-        leading=32,       # ระยะห่างบรรทัด
-        alignment=1,      # Center
-        spaceAfter=20
-    ))
+    def _window(self, key):
+        # (จำนวนครั้งที่ผิดภายใน window, เวลาของครั้งแรกในนั้น)
+        conn = self._connect()
+        try:
+            return conn.execute(
+                'SELECT COUNT(*), MIN(failed_at) FROM login_failures WHERE key = ? AND failed_at > ?',
+                (key, time.time() - self.window)
+            ).fetchone()
+        finally:
+            conn.close()
 
-    # Normal text
-    styles.add(ParagraphStyle(
-        name='BodyTH',
-        fontName='THSarabun',
-        fontSize=16,
-        leading=22,       # บรรทัดห่างขึ้น (อ่านง่าย)
-        spaceBefore=4,
-        spaceAfter=4
-    ))
+    def retry_after(self, key, limit):
+        """วินาทีที่ต้องรอก่อน login ได้อีกครั้ง (0 = ยังไม่ถูกจำกัด)"""
+        count, oldest = self._window(key)
+        if count < limit:
+            return 0
+        with self._lock:
+            self.blocked += 1
+        return max(1, int(self.window - (time.time() - oldest)) + 1)
+
+    def delay(self, key, limit, seconds):
+        """หน่วงเวลา seconds วินาทีถ้า key ผิดครบ limit ครั้งแล้ว (ชะลอการเดารหัสผ่านโดยไม่ล็อกบัญชี)"""
+        count, _ = self._window(key)
+        if count < limit:
+            return
+        with self._lock:
+            self.delayed += 1
+        time.sleep(seconds)
+
+    def record_failure(self, *keys):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('INSERT INTO login_failures (key, failed_at) VALUES (?, ?)',
+                                 [(key, now) for key in keys])
+                if now - self._pruned_at >= self.prune_interval:
+                    self._pruned_at = now
+                    conn.execute('DELETE FROM login_failures WHERE failed_at <= ?', (now - self.window,))
+        finally:
+            conn.close()
 
-    # Section Header
-    styles.add(ParagraphStyle(
-        name='SectionTH',
-        fontName='THSarabun-Bold',
-        fontSize=18,
-        leading=24,
-        spaceBefore=12,
-        spaceAfter=6
-    ))
+    def reset(self, *keys):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('DELETE FROM login_failures WHERE key = ?', [(key,) for key in keys])
+        finally:
+            conn.close()
 
-    story = []
+    def stats(self):
+        conn = self._connect()
+        try:
+            tracked = conn.execute(
+                'SELECT COUNT(DISTINCT key) FROM login_failures WHERE failed_at > ?', (time.time() - self.window,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            return {
+                'tracked_keys': tracked,
+                'blocked': self.blocked,
+                'delayed': self.delayed
+            }
 
-    # Title
-    story.append(Paragraph("รายงานผลการประเมินราคาอสังหาริมทรัพย์", styles["TitleTH"]))
-    story.append(Spacer(1, 14))
+login_limiter = LoginRateLimiter(DATABASE, LOGIN_RATE_WINDOW)
 
-    # AI Evaluation
-    story.append(Paragraph("ผลการประเมินโดย AI", styles["SectionTH"]))
-    story.append(Paragraph(ai_response, styles["BodyTH"]))
-    story.append(Spacer(1, 16))
+# ========================================
+# Login Events (write-behind)
+# ========================================
 
-    # Property Data
-    story.append(Paragraph("ข้อมูลทรัพย์สิน", styles["SectionTH"]))
+class LoginEventWriter:
+    """
+    บันทึก last_login และประวัติการ login (login_events) แบบ write-behind
+    - login() แค่เพิ่มเหตุการณ์ลง buffer ใน memory ไม่ต้องรอ write lock ของ SQLite
+    - background thread เขียนลง database เป็น batch ทุก flush_interval วินาที หรือเมื่อมีครบ batch_size รายการ
+    - thread เดียวกันลบประวัติที่เก่ากว่า retention_days ทุก prune_interval วินาที (ครั้งละ batch_size แถว)
+    - flush ที่เหลือทั้งหมดเมื่อปิด app (atexit)
+    """
 
-    for key, value in evaluation_data.items():
-        story.append(Paragraph(f"<b>{key}</b>: {value}", styles["BodyTH"]))
+    def __init__(self, path, flush_interval, batch_size, max_pending, retention_days, prune_interval):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.pruned = 0
+        self._pruned_at = None
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._table_ready = False
+
+    def _connect(self):
+        conn = connect_db(self.path)
+        if not self._table_ready:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS login_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    email TEXT,
+                    event TEXT NOT NULL,
+                    ip_address TEXT,
+                    created_at TIMESTAMP NOT NULL
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_login_events_user ON login_events (user_id, created_at);
+                CREATE INDEX IF NOT EXISTS idx_login_events_created_at ON login_events (created_at);
+            ''')
+            self._table_ready = True
+        return conn
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='login-event-writer', daemon=True)
+                self._thread.start()
+
+    def record(self, event, user_id=None, email=None, ip_address=None):
+        """เพิ่มเหตุการณ์ (login / login_failed) ลง buffer"""
+        self.ensure_started()
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                # database เขียนไม่ได้นานเกินไป ทิ้งเหตุการณ์เก่าสุดเพื่อไม่ให้ memory โตไม่จำกัด
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append((user_id, email, event, ip_address, datetime.now()))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self._pruned_at is None or time.monotonic() - self._pruned_at >= self.prune_interval:
+                self._pruned_at = time.monotonic()
+                self.prune()
+
+    def prune(self):
+        """ลบประวัติการ login ที่เก่ากว่า retention_days (แบ่งเป็น transaction สั้น ๆ ไม่ขวาง login)"""
+        cutoff = datetime.now() - timedelta(days=self.retention_days)
+        try:
+            conn = self._connect()
+            try:
+                while not self._stopped.is_set():
+                    with conn:
+                        deleted = conn.execute('''
+                            DELETE FROM login_events WHERE id IN (
+                                SELECT id FROM login_events WHERE created_at < ? LIMIT ?
+                            )
+                        ''', (cutoff, self.batch_size)).rowcount
+                    with self._lock:
+                        self.pruned += deleted
+                    if deleted < self.batch_size:
+                        return
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"❌ ลบประวัติการ login เก่าไม่สำเร็จ: {e}")
+
+    def flush(self):
+        """เขียนเหตุการณ์ทั้งหมดที่ค้างอยู่ลง database (ครั้งละไม่เกิน batch_size ต่อ transaction)"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                if not batch:
+                    return
+
+                # last_login ของแต่ละคนใช้ค่าล่าสุดใน batch
+                last_logins = {}
+                for user_id, _, event, _, created_at in batch:
+                    if event == 'login' and user_id is not None:
+                        last_logins[user_id] = created_at
+
+                try:
+                    conn = self._connect()
+                    try:
+                        with conn:
+                            conn.executemany('''
+                                INSERT INTO login_events (user_id, email, event, ip_address, created_at)
+                                VALUES (?, ?, ?, ?, ?)
+                            ''', batch)
+                            conn.executemany('UPDATE users SET last_login = ? WHERE id = ?',
+                                             [(created_at, user_id) for user_id, created_at in last_logins.items()])
+                    finally:
+                        conn.close()
+                except sqlite3.Error:
+                    # เขียนไม่สำเร็จ (เช่น database ถูก lock นาน) นำกลับเข้า buffer แล้วลองใหม่รอบถัดไป
+                    with self._lock:
+                        self._pending.extendleft(reversed(batch))
+                        self.failures += 1
+                    return
+
+                with self._lock:
+                    self.written += len(batch)
+                    self.batches += 1
+
+    def close(self):
+        """หยุด background thread และ flush ที่เหลือ (เรียกตอนปิด app)"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'written': self.written,
+                'batches': self.batches,
+                'failures': self.failures,
+                'dropped': self.dropped,
+                'pruned': self.pruned
+            }
+
+login_events = LoginEventWriter(DATABASE, LOGIN_EVENTS_FLUSH_INTERVAL, LOGIN_EVENTS_BATCH_SIZE,
+                                LOGIN_EVENTS_MAX_PENDING, LOGIN_EVENTS_RETENTION_DAYS,
+                                LOGIN_EVENTS_PRUNE_INTERVAL)
+atexit.register(login_events.close)
 
-    story.append(Spacer(1, 20))
+# ========================================
+# Admin User Listing
+# ========================================
 
-    doc.build(story)
+def encode_user_cursor(user):
+    """cursor ของหน้าถัดไป (created_at, id ของผู้ใช้คนสุดท้ายในหน้า)"""
+    raw = json.dumps([user['created_at'], user['id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
 
-    buffer.seek(0)
-    return buffer
+def decode_user_cursor(cursor_text):
+    """คืนค่า (created_at, id) หรือ None ถ้า cursor ไม่ถูกต้อง"""
+    try:
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor_text.encode('ascii')))
+        return str(created_at), int(user_id)
+    except (ValueError, TypeError, UnicodeError):
+        return None
 
-def getYear():
-    now = datetime.now()
-    y = now.strftime("%Y")
-    return y
+def users_search_clause(query):
+    """
+    เงื่อนไข SQL สำหรับค้นหาผู้ใช้ด้วยอีเมล์/ชื่อ คืนค่า (sql, params)
+    ใช้ FTS5 (trigram) ถ้าทุกคำยาวอย่างน้อย 3 ตัวอักษร ไม่เช่นนั้นใช้ LIKE
+    """
+    terms = query.split()
+    if users_fts_enabled and all(len(term) >= 3 for term in terms):
+        match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        return 'id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)', [match]
+
+    sql = []
+    params = []
+    for term in terms:
+        pattern = '%{}%'.format(term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+        sql.append("(email LIKE ? ESCAPE '\\' OR full_name LIKE ? ESCAPE '\\')")
+        params.extend([pattern, pattern])
+    return ' AND '.join(sql), params
+
+def list_users(conn, query='', role=None, cursor=None, limit=ADMIN_USERS_PAGE_SIZE):
+    """
+    ผู้ใช้เรียงจากสมัครล่าสุด แบ่งหน้าแบบ keyset บน (created_at, id)
+    (เวลาที่ใช้ไม่ขึ้นกับจำนวนผู้ใช้หรือหน้าที่เปิด ต่างจาก OFFSET)
+    คืนค่า (users, cursor ของหน้าถัดไป หรือ None ถ้าเป็นหน้าสุดท้าย)
+    """
+    where = []
+    params = []
+
+    if query and query.strip():
+        sql, search_params = users_search_clause(query.strip())
+        where.append(sql)
+        params.extend(search_params)
+
+    if role:
+        where.append('role = ?')
+        params.append(role)
+
+    if cursor:
+        where.append('(created_at, id) < (?, ?)')
+        params.extend(cursor)
+
+    sql = 'SELECT id, email, full_name, role, created_at, last_login FROM users'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+    params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    users = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_user_cursor(users[-1]) if len(rows) > limit else None
+    return users, next_cursor
+
+def count_users_by_role(conn):
+    """จำนวนผู้ใช้แยกตาม role (อ่านจากตาราง user_role_counts ที่ trigger ปรับให้)"""
+    counts = {'admin': 0, 'user': 0}
+    for role, count in conn.execute('SELECT role, count FROM user_role_counts'):
+        counts[role] = count
+    counts['total'] = sum(counts.values())
+    return counts
 
 # ========================================
-# Authentication Routes
+# Helper Functions
 # ========================================
 
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    """หน้า Login"""
-    if current_user.is_authenticated:
-        return redirect(url_for('index'))
+def allowed_file(filename):
+    """ตรวจสอบว่าไฟล์เป็น Excel หรือไม่"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-    if request.method == 'POST':
-        email = request.form.get('email')
-        password = request.form.get('password')
-        remember = request.form.get('remember', False)
+def read_uploaded_table(file):
+    """อ่านไฟล์ Excel/CSV ที่อัปโหลดเป็น DataFrame"""
+    import pandas as pd
 
-        if not email or not password:
-            flash('กรุณากรอกอีเมล์และรหัสผ่าน', 'danger')
-            return render_template('login.html')
+    if file.filename.endswith('.csv'):
+        return pd.read_csv(file)
+    return pd.read_excel(file)
 
-        # ตรวจสอบ user ในฐานข้อมูล
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-        user_data = cursor.fetchone()
+def normalize_price_frame(df, first_row=2):
+    """
+    แปลงตารางราคาที่อัปโหลดให้อยู่ในรูปแบบมาตรฐานทั้งตารางในครั้งเดียว (vectorized)
+    คืนค่า (DataFrame ของแถวที่ถูกต้อง, Series ข้อความ error ของแถวที่ไม่ถูกต้อง โดย index คือเลขแถวในไฟล์)
+    first_row คือเลขแถวในไฟล์ของแถวแรกใน df (อ่านทีละ chunk จะไม่ใช่แถวที่ 2)
+    """
+    import pandas as pd
 
-        if user_data and check_password_hash(user_data['password'], password):
-            # Login สำเร็จ
-            user = User(
-                id=user_data['id'],
-                email=user_data['email'],
-                full_name=user_data['full_name'],
-                role=user_data['role']
-            )
-            login_user(user, remember=remember)
+    province = df['province'].astype('string').str.strip()
+    property_type = df['property_type'].astype('string').str.strip()
+    base_price = pd.to_numeric(df['base_price_per_sqm'], errors='coerce')
 
-            # อัปเดต last_login
-            cursor.execute('UPDATE users SET last_login = ? WHERE id = ?',
-                         (datetime.now(), user_data['id']))
-            conn.commit()
-            conn.close()
+    invalid_province = (province.isna() | (province == '')).fillna(True).to_numpy(dtype=bool)
+    invalid_type = (property_type.isna() | (property_type == '')).fillna(True).to_numpy(dtype=bool)
+    invalid_price = (base_price.isna() | (base_price.abs() == float('inf'))).to_numpy(dtype=bool)
+    invalid = invalid_province | invalid_type | invalid_price
 
-            flash(f'ยินดีต้อนรับ {user.full_name}!', 'success')
+    valid = pd.DataFrame({
+        'province': province.to_numpy(dtype=object)[~invalid],
+        'property_type': property_type.to_numpy(dtype=object)[~invalid],
+        'base_price_per_sqm': base_price.to_numpy(dtype=float)[~invalid]
+    })
 
-            # Redirect to next page or index
-            next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('index'))
-        else:
-            flash('อีเมล์หรือรหัสผ่านไม่ถูกต้อง', 'danger')
-            conn.close()
+    # ข้อความ error ของแถวที่ไม่ถูกต้อง (เลขแถวในไฟล์ แถวที่ 1 คือหัวตาราง)
+    error_rows = invalid.nonzero()[0]
+    reasons = pd.Series('ราคาต่อตารางเมตรไม่ถูกต้อง', index=error_rows + first_row, dtype=object)
+    reasons[invalid_type[error_rows]] = 'ไม่ระบุประเภททรัพย์สิน'
+    reasons[invalid_province[error_rows]] = 'ไม่ระบุจังหวัด'
 
-    return render_template('login.html')
+    return valid, reasons
 
-@app.route('/register', methods=['GET', 'POST'])
-def register():
-    """หน้า Register (สมัครสมาชิก)"""
-    if current_user.is_authenticated:
-        return redirect(url_for('index'))
+def ingest_price_frame(df, filename=None):
+    """
+    เพิ่ม/อัปเดตข้อมูลราคาจากตารางที่อัปโหลด (ถ้ามี key ซ้ำในไฟล์ ใช้แถวสุดท้าย)
+    คืนค่า (จำนวนแถวที่อัปเดต, ข้อความ error สูงสุด UPLOAD_MAX_REPORTED_ERRORS รายการ, จำนวน error ทั้งหมด)
+    """
+    rows, valid_count, errors = prepare_price_rows(df)
+    if rows:
+        price_store.bulk_upsert(rows, filename=filename, error_count=len(errors))
 
-    if request.method == 'POST':
-        email = request.form.get('email')
-        password = request.form.get('password')
-        confirm_password = request.form.get('confirm_password')
-        full_name = request.form.get('full_name')
+    return valid_count, price_error_messages(errors), len(errors)
 
-        # Validation
-        if not email or not password or not full_name:
-            flash('กรุณากรอกข้อมูลให้ครบถ้วน', 'danger')
-            return render_template('register.html')
+def prepare_price_rows(df, first_row=2):
+    """
+    ตรวจสอบตารางราคา คืนค่า (list ของ (province, property_type, ราคา) สำหรับบันทึก, จำนวนแถวที่ถูกต้อง, Series error)
+    ถ้ามี key ซ้ำใช้แถวสุดท้าย
+    """
+    valid, errors = normalize_price_frame(df, first_row)
 
-        if password != confirm_password:
-            flash('รหัสผ่านไม่ตรงกัน', 'danger')
-            return render_template('register.html')
+    latest = valid.drop_duplicates(['province', 'property_type'], keep='last')
+    rows = list(zip(
+        latest['province'].tolist(),
+        latest['property_type'].tolist(),
+        latest['base_price_per_sqm'].tolist()
+    ))
+    return rows, len(valid), errors
 
-        if len(password) < 4:
-            flash('รหัสผ่านต้องมีอย่างน้อย 4 ตัวอักษร', 'danger')
-            return render_template('register.html')
+def price_error_messages(errors, limit=UPLOAD_MAX_REPORTED_ERRORS):
+    return [f"แถว {row}: {reason}" for row, reason in errors.head(limit).items()]
 
-        # ตรวจสอบว่าอีเมล์ซ้ำหรือไม่
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
-        existing_user = cursor.fetchone()
+def estimate_prices_frame(df):
+    """
+    ประมาณราคาทุกแถวของตารางในครั้งเดียว (vectorized)
+    ต้องมี columns: province, property_type, area
+    ราคาต่อตารางเมตรมาจาก PriceIndex (เหมือน /api/quick-estimate)
+    """
+    import pandas as pd
 
-        if existing_user:
-            flash('อีเมล์นี้ถูกใช้งานแล้ว', 'danger')
-            conn.close()
-            return render_template('register.html')
+    province = df['province'].astype(str).str.strip()
+    property_type = df['property_type'].astype(str).str.strip()
+    area = pd.to_numeric(df['area'], errors='coerce')
 
-        # สร้าง account ใหม่
-        hashed_password = generate_password_hash(password)
-        try:
-            cursor.execute('''
-                INSERT INTO users (email, password, full_name, role)
+    multiplier = province.map({name: info['multiplier'] for name, info in PROVINCES_DATA.items()})
+    region = province.map({name: info['region'] for name, info in PROVINCES_DATA.items()})
+    price_per_sqm, price_source = get_price_index().lookup_frame(province, property_type)
+
+    invalid_area = area.isna() | (area <= 0)
+
+    result = df.copy()
+    result['region'] = region
+    result['multiplier'] = multiplier
+    result['price_per_sqm'] = price_per_sqm
+    result['estimated_price'] = (area * price_per_sqm).where(~invalid_area).round(0)
+    result['price_source'] = price_source
+    result['error'] = invalid_area.map({True: 'ขนาดพื้นที่ไม่ถูกต้อง', False: ''})
+    return result
+
+_provinces_responses = None
+
+def build_provinces_responses():
+    """
+    สร้าง response ของ /api/provinces ล่วงหน้า (ทั้งหมด และแยกตามภูมิภาค)
+    คืนค่า dict ของ region (None = ทั้งหมด) -> (JSON bytes, gzip bytes, etag)
+    """
+    provinces_list = sorted(
+        ({'name': province, 'region': data['region'], 'multiplier': data['multiplier']}
+         for province, data in PROVINCES_DATA.items()),
+        key=lambda x: x['name']
+    )
+
+    slices = {None: provinces_list}
+    for province in provinces_list:
+        slices.setdefault(province['region'], []).append(province)
+
+    responses = {}
+    for region, provinces in slices.items():
+        body = json.dumps({
+            'success': True,
+            'provinces': provinces,
+            'total': len(provinces)
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        responses[region] = (body, gzip.compress(body, mtime=0), hashlib.sha1(body).hexdigest())
+    return responses
+
+def get_provinces_responses():
+    """response ของ /api/provinces ที่สร้างไว้แล้ว (สร้างครั้งแรกเมื่อถูกเรียก)"""
+    global _provinces_responses
+    if _provinces_responses is None:
+        _provinces_responses = build_provinces_responses()
+    return _provinces_responses
+
+def extract_property_data(data):
+    """ดึงข้อมูลทรัพย์สินที่ใช้ประเมินจาก request body"""
+    return {field: data.get(field, '') for field in EVALUATION_FIELDS}
+
+def public_property_data(property_data):
+    """ข้อมูลทรัพย์สินที่ส่งกลับไปให้ client (ไม่รวม additional_info)"""
+    return {field: property_data[field] for field in EVALUATION_FIELDS if field != 'additional_info'}
+
+def build_evaluation_prompt(property_data):
+    """สร้าง prompt สำหรับให้ AI ประเมินราคา"""
+    return f"""คุณเป็นผู้เชี่ยวชาญด้านการประเมินราคาอสังหาริมทรัพย์ในประเทศไทย กรุณาประเมินราคาทรัพย์สินตามข้อมูลต่อไปนี้:
+
+ประเภททรัพย์สิน: {property_data['property_type']}
+ทำเลที่ตั้ง: {property_data['location']}
+ขนาดพื้นที่: {property_data['area']} ตารางเมตร
+จำนวนห้องนอน: {property_data['bedrooms']} ห้อง
+จำนวนห้องน้ำ: {property_data['bathrooms']} ห้อง
+อายุอาคาร: {property_data['age']} ปี
+สภาพทรัพย์สิน: {property_data['condition']}
+ข้อมูลเพิ่มเติม: {property_data['additional_info']}
+
+กรุณาวิเคราะห์และให้คำแนะนำเกี่ยวกับ:
+1. ราคาประเมินโดยประมาณ (บาท)
+2. ปัจจัยที่ส่งผลต่อราคา
+3. แนวโน้มตลาดในพื้นที่
+4. คำแนะนำสำหรับผู้ซื้อหรือผู้ขาย
+
+โปรดตอบเป็นภาษาไทยและให้รายละเอียดที่ชัดเจน"""
+
+def normalize_property_data(property_data):
+    """ปรับข้อมูลทรัพย์สินให้อยู่ในรูปแบบมาตรฐาน เพื่อให้ข้อมูลเดียวกันได้ cache key เดียวกัน"""
+    normalized = {}
+    for field in EVALUATION_FIELDS:
+        value = ' '.join(str(property_data.get(field, '') or '').split())
+
+        # ตัวเลขเขียนต่างกันแต่ค่าเท่ากัน เช่น "50", "50.0" ให้ถือว่าเป็นค่าเดียวกัน
+        if field in NUMERIC_EVALUATION_FIELDS and value:
+            try:
+                number = float(value.replace(',', ''))
+                value = str(int(number)) if number.is_integer() else repr(number)
+            except ValueError:
+                pass
+
+        normalized[field] = value
+    return normalized
+
+def evaluation_cache_key(property_data):
+    """สร้าง cache key จาก hash ของข้อมูลทรัพย์สิน + model + เวอร์ชันของ prompt"""
+    payload = json.dumps({
+        'inputs': normalize_property_data(property_data),
+        'model': OLLAMA_MODEL,
+        'prompt_version': PROMPT_VERSION
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def ndjson_line(obj):
+    """แปลง dict เป็น 1 บรรทัดของ NDJSON"""
+    return json.dumps(obj, ensure_ascii=False) + '\n'
+
+def resolve_report_data(data):
+    """
+    ข้อมูลสำหรับสร้างรายงาน PDF จาก request ({property_data, evaluation} หรือ {job_id})
+    คืนค่า (property_data, evaluation, error) โดย error เป็น (payload, status_code) หรือ None
+    """
+    evaluation_data = data.get('property_data', {})
+    ai_response = data.get('evaluation', '')
+
+    # ใช้ผลจากงานในคิวได้โดยส่ง job_id มาแทน
+    if data.get('job_id'):
+        job = evaluation_jobs.get(data['job_id'])
+        if job is None:
+            return None, None, ({
+                'success': False,
+                'error': 'ไม่พบงานที่ระบุ'
+            }, 404)
+        if job['status'] != 'done':
+            return None, None, ({
+                'success': False,
+                'error': 'งานประเมินยังไม่เสร็จ',
+                'status': job['status']
+            }, 409)
+        evaluation_data = job['property_data']
+        ai_response = job['evaluation']
+
+    if not evaluation_data or not ai_response:
+        return None, None, ({
+            'success': False,
+            'error': 'ข้อมูลไม่ครบถ้วน'
+        }, 400)
+
+    if not isinstance(evaluation_data, dict) or not isinstance(ai_response, str):
+        return None, None, ({
+            'success': False,
+            'error': 'รูปแบบข้อมูลไม่ถูกต้อง'
+        }, 400)
+
+    return evaluation_data, ai_response, None
+
+# ========================================
+# Streaming Price Upload
+# ========================================
+
+PRICE_REQUIRED_COLUMNS = ['province', 'property_type', 'base_price_per_sqm']
+
+def spool_request_body(path, max_bytes, heartbeat=None):
+    """
+    เขียน body ของ request ลงไฟล์ทีละ PRICE_STREAM_READ_SIZE byte (ไม่อ่านทั้งไฟล์เข้า memory)
+    เรียก heartbeat() ทุก PRICE_UPLOAD_HEARTBEAT_INTERVAL วินาทีระหว่างรับ (ถ้ามี)
+    คืนค่าจำนวน byte ที่ได้รับ ถ้าเกิน max_bytes จะ raise RequestEntityTooLarge
+    """
+    stream = get_input_stream(request.environ, max_content_length=max_bytes)
+    received = 0
+    beat_at = time.monotonic()
+    try:
+        with open(path + '.part', 'wb') as f:
+            while True:
+                chunk = stream.read(PRICE_STREAM_READ_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                received += len(chunk)
+                if heartbeat and time.monotonic() - beat_at >= PRICE_UPLOAD_HEARTBEAT_INTERVAL:
+                    heartbeat()
+                    beat_at = time.monotonic()
+        os.replace(path + '.part', path)
+    except BaseException:
+        if os.path.exists(path + '.part'):
+            os.remove(path + '.part')
+        raise
+    return received
+
+def iter_price_chunks(path, chunk_rows):
+    """
+    อ่านไฟล์ราคา (.csv / .xlsx) ทีละไม่เกิน chunk_rows แถว เฉพาะคอลัมน์ที่ใช้
+    yield (DataFrame, เลขแถวในไฟล์ของแถวแรก, จำนวน byte ที่อ่านแล้ว หรือ None ถ้าไม่ทราบ)
+    ไม่มีคอลัมน์ที่จำเป็นจะ raise ValueError
+    """
+    import pandas as pd
+
+    first_row = 2
+    if path.lower().endswith('.csv'):
+        columns = pd.read_csv(path, nrows=0).columns
+        missing = [col for col in PRICE_REQUIRED_COLUMNS if col not in columns]
+        if missing:
+            raise ValueError(f'ขาด columns: {", ".join(missing)}')
+
+        with open(path, 'rb') as f:
+            for df in pd.read_csv(f, usecols=PRICE_REQUIRED_COLUMNS, dtype=str, chunksize=chunk_rows):
+                yield df, first_row, f.tell()
+                first_row += len(df)
+        return
+
+    from openpyxl import load_workbook
+
+    # read_only: อ่านทีละแถวจาก XML ใน zip ไม่สร้าง cell ทั้ง sheet ไว้ใน memory
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value).strip() if value is not None else '' for value in next(rows, ())]
+        missing = [col for col in PRICE_REQUIRED_COLUMNS if col not in header]
+        if missing:
+            raise ValueError(f'ขาด columns: {", ".join(missing)}')
+
+        indexes = [header.index(col) for col in PRICE_REQUIRED_COLUMNS]
+        batch = []
+        for row in rows:
+            values = tuple(row[i] if i < len(row) else None for i in indexes)
+            if all(value is None for value in values):
+                continue  # แถวว่าง (เช่นแถวที่มีแค่ format) ข้ามเหมือน CSV
+            batch.append(values)
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame.from_records(batch, columns=PRICE_REQUIRED_COLUMNS), first_row, None
+                first_row += len(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=PRICE_REQUIRED_COLUMNS), first_row, None
+    finally:
+        workbook.close()
+
+class PriceUploadQueue:
+    """
+    นำเข้าไฟล์ราคาขนาดใหญ่ใน background (อัปโหลดแบบ streaming)
+    - ไฟล์ถูกเขียนลง UPLOAD_FOLDER ก่อน แล้วอ่าน / ตรวจสอบ / บันทึกทีละ chunk ใน transaction ของตัวเอง
+      หน่วยความจำที่ใช้จึงคงที่ตาม chunk_rows ไม่ขึ้นกับขนาดไฟล์
+    - สถานะและความคืบหน้าอยู่ในตาราง price_uploads ดูได้จากทุก process
+    - chunk ที่บันทึกแล้วใช้งานได้ทันที ถ้าเกิด error กลางไฟล์ ข้อมูลก่อนหน้ายังอยู่
+    - ทุก sweep_interval วินาที worker ตรวจหาการอัปโหลดที่ไม่มี heartbeat นานเกิน stale_after
+      (process ที่รับไฟล์ / นำเข้าอยู่ตาย ทั้งตอน start และระหว่างทำงาน) และลบไฟล์ใน folder ที่ไม่มีเจ้าของ
+    """
+
+    def __init__(self, store, chunk_rows, folder, stale_after, sweep_interval):
+        self.store = store
+        self.chunk_rows = chunk_rows
+        self.folder = folder
+        self.stale_after = stale_after
+        self.sweep_interval = sweep_interval
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+        self.abandoned = 0
+        self._queue = queue.Queue()
+        self._pending = set()  # id ที่อยู่ใน _queue แล้ว (sweep ไม่ใส่ซ้ำ)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._swept_at = None
+
+    def ensure_started(self):
+        """เริ่ม worker thread (sweep ครั้งแรกทันที: นำการอัปโหลดที่ค้างอยู่ เช่นก่อน restart กลับเข้าคิว)"""
+        if self._thread:
+            return
+
+        with self._lock:
+            if self._thread:
+                return
+
+            # worker เดียว: SQLite เขียนได้ทีละ transaction อยู่แล้ว
+            self._thread = threading.Thread(target=self._work, name='price-upload-worker', daemon=True)
+            self._thread.start()
+
+    def submit(self, upload_id):
+        self.ensure_started()
+        self._enqueue(upload_id)
+
+    def _enqueue(self, upload_id):
+        with self._lock:
+            if upload_id in self._pending:
+                return False
+            self._pending.add(upload_id)
+        self._queue.put(upload_id)
+        return True
+
+    def _work(self):
+        while True:
+            if self._swept_at is None or time.monotonic() - self._swept_at >= self.sweep_interval:
+                try:
+                    self._sweep()
+                except Exception as e:
+                    print(f"❌ ตรวจสอบการอัปโหลดที่ค้างไม่สำเร็จ: {e}")
+                self._swept_at = time.monotonic()
+
+            try:
+                upload_id = self._queue.get(timeout=self.sweep_interval)
+            except queue.Empty:
+                continue
+            try:
+                self._process(upload_id)
+            except Exception as e:
+                print(f"❌ นำเข้าไฟล์ราคา {upload_id} ไม่สำเร็จ: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(upload_id)
+                self._queue.task_done()
+
+    def _sweep(self):
+        queued, abandoned = self.store.recover_uploads(self.stale_after)
+        recovered = sum(self._enqueue(upload_id) for upload_id in queued)
+        for path in abandoned:
+            for name in (path, path + '.part'):
+                if os.path.exists(name):
+                    os.remove(name)
+
+        # ไฟล์ price-upload-* ที่ไม่มีรายการที่ยังไม่เสร็จอ้างถึง และไม่ถูกเขียนมานานเกิน stale_after
+        # (เช่น .part ของ process ที่ตายระหว่างรับไฟล์ หรือไฟล์ที่ลบไม่สำเร็จ)
+        active = self.store.active_upload_paths()
+        cutoff = time.time() - self.stale_after
+        if os.path.isdir(self.folder):
+            for entry in os.scandir(self.folder):
+                if not entry.name.startswith('price-upload-') or not entry.is_file():
+                    continue
+                path = os.path.abspath(entry.path)
+                if path.endswith('.part'):
+                    path = path[:-len('.part')]
+                if path not in active and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+
+        with self._lock:
+            self.recovered += recovered
+            self.abandoned += len(abandoned)
+
+    def _process(self, upload_id):
+        claimed_at = self.store.claim_upload(upload_id)
+        if claimed_at is None:
+            return
+
+        upload = self.store.get_upload(upload_id)
+        started = time.perf_counter()
+        row_count = error_count = 0
+        messages = []
+        error = None
+        try:
+            for df, first_row, bytes_processed in iter_price_chunks(upload['stored_path'], self.chunk_rows):
+                rows, valid_count, errors = prepare_price_rows(df, first_row)
+                if not self.store.append_upload_rows(upload_id, claimed_at, rows, valid_count, len(errors),
+                                                     bytes_processed):
+                    # ถูกนำกลับเข้าคิวระหว่างทำ (heartbeat ขาดนานเกิน stale_after) worker ที่จองใหม่ทำต่อเอง
+                    print(f"⚠️ การนำเข้าไฟล์ราคา {upload_id} ถูกจองใหม่โดย worker อื่น หยุดทำงานนี้")
+                    return
+                row_count += valid_count
+                error_count += len(errors)
+                if len(messages) < UPLOAD_MAX_REPORTED_ERRORS:
+                    messages.extend(price_error_messages(errors, UPLOAD_MAX_REPORTED_ERRORS - len(messages)))
+        except sqlite3.Error as e:
+            error = f'บันทึกข้อมูลไม่สำเร็จ: {str(e)}'
+        except Exception as e:
+            error = f'ไม่สามารถอ่านไฟล์ได้: {str(e)}'
+
+        if error:
+            self.store.update_upload(upload_id, status='error', error=error,
+                                     errors=json.dumps(messages, ensure_ascii=False), finished_at=time.time())
+        else:
+            self.store.update_upload(upload_id, status='done', errors=json.dumps(messages, ensure_ascii=False),
+                                     bytes_processed=upload['bytes_total'], finished_at=time.time())
+        if os.path.exists(upload['stored_path']):
+            os.remove(upload['stored_path'])
+
+        observe_price_upload(row_count, error_count, time.perf_counter() - started)
+        with self._lock:
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'completed': self.completed,
+                'failed': self.failed,
+                'recovered': self.recovered,
+                'abandoned': self.abandoned
+            }
+
+price_uploads = PriceUploadQueue(price_store, PRICE_STREAM_CHUNK_ROWS, UPLOAD_FOLDER,
+                                 PRICE_UPLOAD_STALE_AFTER, PRICE_UPLOAD_SWEEP_INTERVAL)
+
+def price_upload_payload(upload):
+    """ข้อมูลการอัปโหลดสำหรับส่งกลับ client (ไม่รวม path ของไฟล์บน server)"""
+    progress = None
+    if upload['status'] == 'done':
+        progress = 1.0
+    elif upload['bytes_total'] and upload['bytes_processed']:
+        progress = round(min(upload['bytes_processed'] / upload['bytes_total'], 1.0), 4)
+
+    return {
+        'id': upload['id'],
+        'filename': upload['filename'],
+        'status': upload['status'],
+        'row_count': upload['row_count'],
+        'error_count': upload['error_count'],
+        'errors': json.loads(upload['errors']) if upload['errors'] else [],
+        'error': upload['error'],
+        'bytes_total': upload['bytes_total'],
+        'bytes_processed': upload['bytes_processed'],
+        'progress': progress,
+        'created_at': upload['created_at'],
+        'started_at': upload['started_at'],
+        'finished_at': upload['finished_at']
+    }
+
+# ========================================
+# PDF Reports
+# ========================================
+
+def notify_report_heading(doc, flowable):
+    """เอกสารรายงานรวม: ส่งหัวข้อของแต่ละทรัพย์สินเข้าสารบัญพร้อมเลขหน้า (ใช้เป็น afterFlowable)"""
+    style = getattr(flowable, 'style', None)
+    if style is not None and style.name == 'ReportHeadingTH':
+        doc.notify('TOCEntry', (0, flowable.getPlainText(), doc.page))
+
+class PdfRenderer:
+    """
+    สร้างรายงาน PDF โดยโหลดฟอนต์ภาษาไทยและ style เพียงครั้งเดียว แล้วใช้ซ้ำทุกรายงาน
+    โหลดเมื่อใช้งานครั้งแรก (thread-safe) หรือเรียก warm_up() ตอนเริ่ม app
+    """
+
+    def __init__(self, font_regular, font_bold):
+        self.font_regular = font_regular
+        self.font_bold = font_bold
+        self.renders = 0
+        self.render_seconds = 0.0
+        self._styles = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        # Register Thai fonts
+        pdfmetrics.registerFont(TTFont('THSarabun', self.font_regular))
+        pdfmetrics.registerFont(TTFont('THSarabun-Bold', self.font_bold))
+
+        styles = getSampleStyleSheet()
+
+        # Title Style
+        styles.add(ParagraphStyle(
+            name='TitleTH',
+            fontName='THSarabun-Bold',
+            fontSize=26,
+            leading=32,       # ระยะห่างบรรทัด
+            alignment=1,      # Center
+            spaceAfter=20
+        ))
+
+        # Normal text
+        styles.add(ParagraphStyle(
+            name='BodyTH',
+            fontName='THSarabun',
+            fontSize=16,
+            leading=22,       # บรรทัดห่างขึ้น (อ่านง่าย)
+            spaceBefore=4,
+            spaceAfter=4
+        ))
+
+        # Section Header
+        styles.add(ParagraphStyle(
+            name='SectionTH',
+            fontName='THSarabun-Bold',
+            fontSize=18,
+            leading=24,
+            spaceBefore=12,
+            spaceAfter=6
+        ))
+
+        # หัวข้อทรัพย์สินแต่ละรายการในรายงานรวม (แสดงในสารบัญ)
+        styles.add(ParagraphStyle(
+            name='ReportHeadingTH',
+            fontName='THSarabun-Bold',
+            fontSize=22,
+            leading=28,
+            spaceAfter=12
+        ))
+
+        # รายการในสารบัญ
+        styles.add(ParagraphStyle(
+            name='TocTH',
+            fontName='THSarabun',
+            fontSize=16,
+            leading=22
+        ))
+
+        return styles
+
+    @property
+    def styles(self):
+        if self._styles is None:
+            with self._lock:
+                if self._styles is None:
+                    self._styles = self._load()
+        return self._styles
+
+    def warm_up(self):
+        """โหลดฟอนต์และ style ล่วงหน้า"""
+        return self.styles
+
+    def story(self, evaluation_data, ai_response, title=True):
+        """เนื้อหาของรายงาน 1 ทรัพย์สิน"""
+        from reportlab.platypus import Paragraph, Spacer
+
+        styles = self.styles
+        story = []
+
+        # Title
+        if title:
+            story.append(Paragraph("รายงานผลการประเมินราคาอสังหาริมทรัพย์", styles["TitleTH"]))
+            story.append(Spacer(1, 14))
+
+        # AI Evaluation
+        story.append(Paragraph("ผลการประเมินโดย AI", styles["SectionTH"]))
+        story.append(Paragraph(ai_response, styles["BodyTH"]))
+        story.append(Spacer(1, 16))
+
+        # Property Data
+        story.append(Paragraph("ข้อมูลทรัพย์สิน", styles["SectionTH"]))
+
+        for key, value in evaluation_data.items():
+            story.append(Paragraph(f"<b>{key}</b>: {value}", styles["BodyTH"]))
+
+        story.append(Spacer(1, 20))
+        return story
+
+    def render(self, evaluation_data, ai_response):
+        """สร้าง PDF คืนค่าเป็น BytesIO"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate
+
+        started = time.perf_counter()
+        story = self.story(evaluation_data, ai_response)
+
+        buffer = BytesIO()
+
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=A4,
+            rightMargin=40,
+            leftMargin=40,
+            topMargin=40,
+            bottomMargin=40
+        )
+        doc.build(story)
+
+        buffer.seek(0)
+        with self._lock:
+            self.renders += 1
+            self.render_seconds += time.perf_counter() - started
+        return buffer
+
+    def render_batch(self, reports):
+        """
+        สร้าง PDF รวมหลายทรัพย์สิน [(property_data, evaluation)] มีสารบัญ และขึ้นหน้าใหม่ทุกรายการ
+        คืนค่าเป็น BytesIO
+        """
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+        from reportlab.platypus.tableofcontents import TableOfContents
+
+        started = time.perf_counter()
+        styles = self.styles
+
+        toc = TableOfContents()
+        toc.levelStyles = [styles["TocTH"]]
+
+        story = [
+            Paragraph("รายงานผลการประเมินราคาอสังหาริมทรัพย์", styles["TitleTH"]),
+            Paragraph(f"จำนวน {len(reports):,} รายการ", styles["BodyTH"]),
+            Spacer(1, 14),
+            Paragraph("สารบัญ", styles["SectionTH"]),
+            toc
+        ]
+
+        for index, (evaluation_data, ai_response) in enumerate(reports, 1):
+            heading = ' '.join(str(evaluation_data.get(field) or '') for field in ('property_type', 'location')).strip()
+            story.append(PageBreak())
+            story.append(Paragraph(f"{index}. {heading or 'ทรัพย์สิน'}", styles["ReportHeadingTH"]))
+            story.extend(self.story(evaluation_data, ai_response, title=False))
+
+        buffer = BytesIO()
+
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=A4,
+            rightMargin=40,
+            leftMargin=40,
+            topMargin=40,
+            bottomMargin=40
+        )
+        doc.afterFlowable = lambda flowable: notify_report_heading(doc, flowable)
+        # build หลายรอบเพื่อให้เลขหน้าในสารบัญถูกต้อง
+        doc.multiBuild(story)
+
+        buffer.seek(0)
+        with self._lock:
+            self.renders += 1
+            self.render_seconds += time.perf_counter() - started
+        return buffer
+
+    def stats(self):
+        with self._lock:
+            return {
+                'fonts_loaded': self._styles is not None,
+                'renders': self.renders,
+                'avg_render_ms': round(self.render_seconds / self.renders * 1000, 2) if self.renders else 0.0
+            }
+
+pdf_renderer = PdfRenderer(PDF_FONT_REGULAR, PDF_FONT_BOLD)
+
+class PdfBusyError(Exception):
+    """คิวสร้าง PDF เต็ม ให้ client ลองใหม่ภายหลัง"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def init_pdf_worker():
+    """โหลดฟอนต์ตั้งแต่ worker process เริ่มทำงาน"""
+    pdf_renderer.warm_up()
+
+def render_pdf_bytes(evaluation_data, ai_response):
+    """สร้าง PDF (ทำงานใน worker process) คืนค่า (bytes, เวลาที่ใช้สร้างเป็นวินาที)"""
+    started = time.perf_counter()
+    buffer = pdf_renderer.render(evaluation_data, ai_response)
+    return buffer.getvalue(), time.perf_counter() - started
+
+def render_batch_pdf_bytes(reports):
+    """สร้าง PDF รวมหลายรายการ (ทำงานใน worker process) คืนค่า (bytes, เวลาที่ใช้สร้างเป็นวินาที)"""
+    started = time.perf_counter()
+    buffer = pdf_renderer.render_batch(reports)
+    return buffer.getvalue(), time.perf_counter() - started
+
+class PdfRenderPool:
+    """
+    สร้าง PDF ใน process pool แยกจาก Flask worker เพราะ doc.build ใช้ CPU มาก
+    - workers = 0 สร้างใน thread ของ request เอง (ไม่ใช้ process pool)
+    - งานที่รอคิวและกำลังสร้างรวมกันเกิน max_pending จะ raise PdfBusyError ทันที
+    """
+
+    def __init__(self, workers, max_pending, timeout):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.renders = 0
+        self.failures = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.render_seconds = 0.0
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # ใช้ spawn เพราะ process หลักมี thread อื่นทำงานอยู่ (fork แล้วอาจ deadlock)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_pdf_worker
+                )
+            return self._executor
+
+    def _reset_executor(self, executor):
+        """worker process ตาย ทิ้ง pool เดิมแล้วสร้างใหม่ในการเรียกครั้งถัดไป"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def submit(self, fn, *args, wait=0):
+        """
+        ส่งงานสร้าง PDF (fn เช่น render_pdf_bytes) คืนค่า Future ของ (bytes, render_seconds)
+        รอคิวได้ไม่เกิน wait วินาที ถ้าคิวยังเต็มจะ raise PdfBusyError
+        """
+        acquired = self._slots.acquire(timeout=wait) if wait else self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise PdfBusyError('ขณะนี้มีการสร้าง PDF จำนวนมาก กรุณาลองใหม่อีกครั้งในอีกสักครู่', PDF_RETRY_AFTER)
+
+        with self._lock:
+            self.pending += 1
+
+        executor = None
+        try:
+            if self.workers <= 0:
+                future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(fn, *args)
+                except BrokenProcessPool:
+                    self._reset_executor(executor)
+                    executor = self._get_executor()
+                    future = executor.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+
+        kind = 'batch' if fn is render_batch_pdf_bytes else 'single'
+        future.add_done_callback(lambda f: self._done(f, executor, kind))
+        return future
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _done(self, future, executor, kind):
+        self._release()
+        error = future.exception() if not future.cancelled() else None
+        with self._lock:
+            if future.cancelled() or error is not None:
+                self.failures += 1
+            else:
+                self.renders += 1
+                self.render_seconds += future.result()[1]
+
+        if not future.cancelled() and error is None:
+            pdf_bytes, seconds = future.result()
+            pdf_render_duration.observe(seconds, (kind,))
+            pdf_size_bytes.observe(len(pdf_bytes), (kind,))
+
+        if isinstance(error, BrokenProcessPool):
+            self._reset_executor(executor)
+
+    def result(self, future):
+        """
+        รอผลของงานจาก submit() ไม่เกิน timeout วินาที คืนค่า bytes
+        ถ้าไม่เสร็จทันเวลา (pool ช้าหรืองานค้างมาก) จะยกเลิกงาน (ถ้ายังไม่เริ่ม) แล้ว raise PdfBusyError แทน 500
+        """
+        try:
+            return future.result(timeout=self.timeout)[0]
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise PdfBusyError('การสร้าง PDF ใช้เวลานานเกินกำหนด กรุณาลองใหม่อีกครั้งในอีกสักครู่', PDF_RETRY_AFTER)
+
+    def render(self, evaluation_data, ai_response):
+        """สร้าง PDF และรอจนเสร็จ คืนค่าเป็น bytes"""
+        return self.result(self.submit(render_pdf_bytes, evaluation_data, ai_response))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'renders': self.renders,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'avg_render_ms': round(self.render_seconds / self.renders * 1000, 2) if self.renders else 0.0
+            }
+
+pdf_pool = PdfRenderPool(PDF_WORKERS, PDF_MAX_PENDING, PDF_RENDER_TIMEOUT)
+
+def generate_pdf_report(evaluation_data, ai_response):
+    return BytesIO(pdf_pool.render(evaluation_data, ai_response))
+
+class PdfCache:
+    """
+    Cache ไฟล์ PDF ที่สร้างแล้วไว้บน disk ตาม hash ของข้อมูล + PDF_TEMPLATE_VERSION
+    - ขนาดรวมเกิน max_bytes จะลบไฟล์ที่ไม่ได้ใช้นานที่สุดก่อน (LRU ตาม mtime)
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def key(self, evaluation_data, ai_response):
+        raw = json.dumps({
+            'property_data': evaluation_data,
+            'evaluation': ai_response,
+            'template_version': PDF_TEMPLATE_VERSION
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        # path เต็ม: send_file ตีความ path แบบ relative จากโฟลเดอร์ของ app ไม่ใช่ working directory
+        return os.path.abspath(os.path.join(self.folder, f'{key}.pdf'))
+
+    def _entries(self):
+        """[(mtime, size, path)] ของไฟล์ใน cache"""
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.pdf'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def get(self, key):
+        """คืน path ของ PDF ที่ cache ไว้ หรือ None ถ้าไม่มี"""
+        path = self.path(key)
+        try:
+            # อัปเดต mtime เพื่อใช้เป็นลำดับ LRU
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def read(self, key):
+        """คืนเนื้อหา PDF ที่ cache ไว้ หรือ None ถ้าไม่มี"""
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        """บันทึก PDF ลง cache คืนค่า path ของไฟล์"""
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data)
+
+            if self._size > self.max_bytes:
+                self._evict(keep=path)
+        return path
+
+    def _evict(self, keep):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+pdf_cache = PdfCache(PDF_CACHE_FOLDER, PDF_CACHE_MAX_BYTES)
+
+class ZipStreamWriter:
+    """
+    file object แบบเขียนอย่างเดียว (ไม่มี seek) ให้ zipfile เขียนลง
+    แล้วดึงข้อมูลที่เขียนแล้วออกไปส่งให้ client ทีละส่วนด้วย drain()
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_batch_zip(reports):
+    """
+    สร้าง ZIP ของ PDF แยกรายการ คืนค่า generator ของ bytes สำหรับ streaming response
+    - สร้าง PDF พร้อมกันครั้งละไม่เกิน PDF_BATCH_WINDOW ไฟล์ และส่งออกตามลำดับทันทีที่แต่ละไฟล์เสร็จ
+    - ไฟล์แรกสร้างเสร็จก่อนเริ่ม response จึง raise PdfBusyError (ตอบ 503) หรือ error อื่นได้
+    - หลังเริ่ม response แล้ว (status 200) รายการที่สร้างไม่สำเร็จจะเป็นไฟล์ NNN_error.txt ใน ZIP แทน
+      ZIP จึงสมบูรณ์เสมอและบอกได้ว่ารายการใดขาดไป
+    """
+    window = deque()
+    position = [0]
+
+    def fill(wait):
+        while position[0] < len(reports) and len(window) < PDF_BATCH_WINDOW:
+            evaluation_data, ai_response = reports[position[0]]
+            cache_key = pdf_cache.key(evaluation_data, ai_response)
+            data = pdf_cache.read(cache_key)
+            future = None
+            if data is None:
+                try:
+                    # รอคิวเฉพาะเมื่อไม่มีไฟล์อื่นให้ส่งระหว่างรอ
+                    future = pdf_pool.submit(render_pdf_bytes, evaluation_data, ai_response,
+                                             wait=0 if window else wait)
+                except PdfBusyError:
+                    if not window:
+                        raise
+                    return
+            position[0] += 1
+            window.append((position[0], cache_key, data, future))
+
+    def take():
+        # (ชื่อไฟล์, bytes) ของรายการถัดไปใน window
+        index, cache_key, data, future = window.popleft()
+        if data is None:
+            data = pdf_pool.result(future)
+            pdf_cache.put(cache_key, data)
+        return f'{index:03d}_property_evaluation.pdf', data
+
+    fill(0)
+    try:
+        first = take()
+    except Exception:
+        for _, _, _, future in window:
+            if future is not None:
+                future.cancel()
+        raise
+
+    def generate():
+        output = ZipStreamWriter()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+            name, data = first
+            while True:
+                archive.writestr(name, data)
+                yield output.drain()
+
+                try:
+                    fill(PDF_RENDER_TIMEOUT)
+                except PdfBusyError as e:
+                    # คิว PDF เต็มนานเกิน PDF_RENDER_TIMEOUT: แจ้งรายการที่เหลือทั้งหมดแล้วจบ ZIP
+                    start = position[0] + 1
+                    archive.writestr(f'{start:03d}_error.txt',
+                                     f'รายการที่ {start}-{len(reports)}: ไม่ได้สร้าง PDF ({e})\n')
+                    break
+                if not window:
+                    break
+
+                index = window[0][0]
+                try:
+                    name, data = take()
+                except Exception as e:
+                    name, data = f'{index:03d}_error.txt', f'รายการที่ {index}: สร้าง PDF ไม่สำเร็จ ({e})\n'
+        yield output.drain()
+
+    return generate()
+
+def getYear():
+    now = datetime.now()
+    y = now.strftime("%Y")
+    return y
+
+# ========================================
+# AI Evaluation Cache
+# ========================================
+
+class EvaluationCache:
+    """
+    Cache ผลการประเมินจาก AI เก็บใน SQLite
+    - รายการที่เก่ากว่า ttl วินาทีถือว่าหมดอายุ
+    - ถ้าเกิน max_entries จะลบรายการที่ถูกใช้ล่าสุดนานที่สุดออก (LRU)
+    """
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._table_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS evaluation_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    property_data TEXT NOT NULL,
+                    evaluation TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_evaluation_cache_last_access ON evaluation_cache (last_access)')
+            conn.commit()
+            self._table_ready = True
+        return conn
+
+    def get(self, key):
+        """คืนผลการประเมินที่ cache ไว้ หรือ None ถ้าไม่มี/หมดอายุ"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT evaluation, created_at FROM evaluation_cache WHERE cache_key = ?',
+                               (key,)).fetchone()
+
+            if row and now - row[1] <= self.ttl:
+                conn.execute('UPDATE evaluation_cache SET last_access = ? WHERE cache_key = ?', (now, key))
+                conn.commit()
+                with self._lock:
+                    self.hits += 1
+                return row[0]
+
+            if row:
+                # หมดอายุแล้ว
+                conn.execute('DELETE FROM evaluation_cache WHERE cache_key = ?', (key,))
+                conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, property_data, evaluation):
+        """บันทึกผลการประเมินลง cache และลบรายการเก่าถ้าเกินขนาดที่กำหนด"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO evaluation_cache (cache_key, property_data, evaluation, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, json.dumps(property_data, ensure_ascii=False), evaluation, now, now))
+
+            count = conn.execute('SELECT COUNT(*) FROM evaluation_cache').fetchone()[0]
+            if count > self.max_entries:
+                conn.execute('''
+                    DELETE FROM evaluation_cache WHERE cache_key IN (
+                        SELECT cache_key FROM evaluation_cache ORDER BY last_access ASC LIMIT ?
+                    )
+                ''', (count - self.max_entries,))
+                with self._lock:
+                    self.evictions += count - self.max_entries
+
+            conn.commit()
+        finally:
+            conn.close()
+
+    def stats(self):
+        """สถิติการใช้งาน cache"""
+        conn = self._connect()
+        try:
+            entries = conn.execute('SELECT COUNT(*) FROM evaluation_cache').fetchone()[0]
+        finally:
+            conn.close()
+
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+evaluation_cache = EvaluationCache(AI_DATABASE, EVALUATION_CACHE_TTL, EVALUATION_CACHE_MAX_ENTRIES)
+
+# ========================================
+# Ollama Calls
+# ========================================
+
+class OllamaError(Exception):
+    """Ollama ตอบกลับด้วยข้อผิดพลาด (ข้อความเป็นภาษาไทย แสดงให้ผู้ใช้ได้)"""
+
+class OllamaBusyError(OllamaError):
+    """คิวของ Ollama เต็ม ให้ client ลองใหม่ภายหลัง"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def ollama_model_name(name):
+    """ชื่อ model แบบเต็ม (Ollama เติม :latest ให้ถ้าไม่ระบุ tag)"""
+    return name if ':' in name else f'{name}:latest'
+
+class OllamaBackend:
+    """
+    Ollama 1 instance ใน pool: นับการเรียกที่ค้างอยู่ และเก็บผลตรวจสอบสถานะล่าสุด
+    backend ที่เรียกไม่สำเร็จจะถูกพักไว้ (eject) จนครบเวลา หรือจนตรวจสอบสถานะผ่านอีกครั้ง
+    """
+
+    def __init__(self, url, max_concurrency):
+        self.url = url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.requests = 0
+        self.failures = 0  # จำนวนครั้งที่เรียกไม่สำเร็จติดกัน
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.healthy = None  # None = ยังไม่เคยตรวจสอบ
+        self.models = None  # model ที่ติดตั้งไว้ (/api/tags), None = ยังไม่รู้
+        self.loaded = set()  # model ที่โหลดอยู่ใน memory (/api/ps และการเรียกที่สำเร็จ)
+        self.last_error = None
+
+    def available(self, now):
+        return self.healthy is not False and now >= self.ejected_until
+
+    def has_model(self, model):
+        return self.models is None or model in self.models
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'ejected': time.monotonic() < self.ejected_until,
+            'max_concurrency': self.max_concurrency,
+            'active': self.active,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ejections': self.ejections,
+            'loaded_models': sorted(self.loaded),
+            'last_error': self.last_error
+        }
+
+class OllamaSlot:
+    """สิทธิ์ในการเรียก Ollama 1 ครั้งบน backend ที่เลือกไว้ (คืนสิทธิ์ได้หลายครั้งโดยไม่มีผลเพิ่ม)"""
+
+    def __init__(self, client, backend):
+        self._client = client
+        self.backend = backend
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._client._release(self.backend)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class OllamaClient:
+    """
+    HTTP client สำหรับเรียก Ollama หลาย instance (backend pool)
+    - ใช้ requests.Session เดียว เปิด connection ค้างไว้ใช้ซ้ำ (keep-alive)
+    - จำกัดจำนวนการประเมินพร้อมกันต่อ backend ถ้ารอคิวนานเกิน queue_timeout จะ raise OllamaBusyError
+    - ส่งงานให้ backend ที่มี model โหลดอยู่แล้วก่อน แล้วเลือกตัวที่งานค้างน้อยที่สุด
+    - backend ที่เชื่อมต่อไม่ได้หรือตอบ 5xx ถูกพักไว้ และย้ายงานไป backend อื่นทันที (failover)
+    """
+
+    def __init__(self, backends, max_concurrency, queue_timeout, retries, backoff, pool_size,
+                 max_failures, eject_seconds):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self._session = None
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self.active = 0
+        self.waiting = 0
+        self.requests = 0
+        self.rejected = 0
+        self.failovers = 0
+        self.set_backends(backends)
+
+    def set_backends(self, urls):
+        """กำหนดรายการ backend ใหม่ (ใช้ก่อนเริ่มรับ request เช่นตอน load test)"""
+        with self._condition:
+            self.backends = [OllamaBackend(url, self.max_concurrency) for url in urls]
+            self._session = None
+            self._condition.notify_all()
+
+    @property
+    def session(self):
+        """requests.Session ที่ใช้ร่วมกัน (สร้างเมื่อเรียก Ollama ครั้งแรก)"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    from urllib3.util.retry import Retry
+
+                    # retry เฉพาะตอนเชื่อมต่อไม่ได้ (request ยังไม่ถูกส่ง) จึงปลอดภัยแม้เป็น POST
+                    # ถ้ามีหลาย backend ไม่ต้อง retry ที่เดิม ย้ายไป backend อื่นแทน
+                    retries = self.retries if len(self.backends) == 1 else 0
+                    retry = Retry(
+                        total=retries,
+                        connect=retries,
+                        read=0,
+                        status=0,
+                        other=0,
+                        backoff_factor=self.backoff,
+                        allowed_methods=None,
+                        raise_on_status=False
+                    )
+                    adapter = HTTPAdapter(pool_connections=len(self.backends), pool_maxsize=self.pool_size,
+                                          max_retries=retry)
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def _pick(self, model, exclude):
+        """เลือก backend ที่ว่าง (เรียกขณะถือ lock) คืนค่า None ถ้าทุกตัวเต็ม"""
+        now = time.monotonic()
+        candidates = [backend for backend in self.backends if backend not in exclude]
+        available = [backend for backend in candidates if backend.available(now)]
+        # ใช้เฉพาะ backend ที่มี model ถ้ามี, ถ้าทุกตัวถูกพักไว้ก็ยังลองส่งไป (ดีกว่าตอบ error ทันที)
+        pool = ([backend for backend in available if backend.has_model(model)]
+                or available or candidates)
+
+        free = [backend for backend in pool if backend.active < backend.max_concurrency]
+        if not free:
+            return None
+        # model โหลดอยู่แล้วมาก่อน (ไม่ต้องรอโหลด model ใหม่) แล้วเลือกตัวที่งานค้างน้อยที่สุด
+        return min(free, key=lambda backend: (model not in backend.loaded, backend.active, backend.requests))
+
+    def acquire(self, model, exclude=()):
+        """
+        รอคิวเพื่อเรียก Ollama คืนค่า OllamaSlot ของ backend ที่เลือก
+        หรือ raise OllamaBusyError ถ้ารอนานเกินไป (exclude = backend ที่ไม่ต้องการ เช่นตัวที่เพิ่งล้มเหลว)
+        """
+        model = ollama_model_name(model)
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.queue_timeout
+
+        with self._condition:
+            self.waiting += 1
+            try:
+                while True:
+                    backend = self._pick(model, exclude)
+                    if backend is not None:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        break
+                    self._condition.wait(remaining)
+
+                if backend is not None:
+                    backend.active += 1
+                    backend.requests += 1
+                    self.active += 1
+                    self.requests += 1
+            finally:
+                self.waiting -= 1
+
+        ollama_queue_wait.observe(time.perf_counter() - started)
+        if backend is None:
+            raise OllamaBusyError('ขณะนี้มีผู้ใช้งาน AI จำนวนมาก กรุณาลองใหม่อีกครั้งในอีกสักครู่', OLLAMA_RETRY_AFTER)
+        return OllamaSlot(self, backend)
+
+    def _release(self, backend):
+        with self._condition:
+            backend.active -= 1
+            self.active -= 1
+            self._condition.notify_all()
+
+    def _succeeded(self, backend, model):
+        with self._condition:
+            backend.failures = 0
+            backend.loaded.add(ollama_model_name(model))
+
+    def _failed(self, backend, error):
+        """บันทึกการเรียกที่ไม่สำเร็จ ครบ max_failures ครั้งติดกันจะพัก backend ไว้ eject_seconds วินาที"""
+        with self._condition:
+            backend.failures += 1
+            backend.last_error = str(error)
+            if backend.failures >= self.max_failures:
+                backend.ejected_until = time.monotonic() + self.eject_seconds
+                backend.ejections += 1
+                backend.loaded.clear()
+
+    def _post(self, model, payload, stream, timeout, slot=None):
+        """
+        ส่ง /api/generate ไปยัง backend ของ slot จะย้ายไป backend อื่นเมื่อ
+        - เชื่อมต่อไม่ได้ หรือ timeout ก่อนได้ response (ยังไม่ได้รับข้อมูลใด ๆ จึงส่งซ้ำได้)
+        - ตอบ 404 (backend นี้ไม่มี model) หรือ 5xx
+        คืนค่า (slot, response) โดย slot อาจเป็นคนละตัวกับที่ส่งมา ผู้เรียกต้อง release slot ที่คืนไป
+        """
+        import requests
+
+        slot = slot or self.acquire(model)
+        tried = []
+        while True:
+            backend = slot.backend
+            try:
+                response = self.session.post(f"{backend.url}/api/generate", json=payload, stream=stream,
+                                             timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                response, error = None, e
+            except Exception:
+                slot.release()
+                raise
+            else:
+                if response.status_code == 404:
+                    response.close()
+                    response, error = None, OllamaError(f'ไม่พบ model {model} บน Ollama (ollama pull {model})')
+                    with self._condition:
+                        if backend.models is not None:
+                            backend.models.discard(ollama_model_name(model))
+                        backend.loaded.discard(ollama_model_name(model))
+                elif response.status_code < 500:
+                    return slot, response
+                else:
+                    response.close()
+                    error = OllamaError(f'HTTP {response.status_code}')
+
+            self._failed(backend, error)
+            slot.release()
+            tried.append(backend)
+            if len(tried) >= len(self.backends):
+                if response is None:
+                    raise error
+                raise OllamaError('ไม่สามารถเชื่อมต่อกับ AI ได้')
+
+            slot = self.acquire(model, exclude=tried)
+            with self._lock:
+                self.failovers += 1
+
+    def generate(self, prompt, model):
+        """เรียก /api/generate แบบรอผลลัพธ์ทั้งหมด คืนค่า JSON ที่ Ollama ตอบกลับ"""
+        started = time.perf_counter()
+        slot, response = self._post(
+            model,
+            {
+                "model": model,
+                "prompt": prompt,
+                "stream": False
+            },
+            stream=False,
+            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_GENERATE_TIMEOUT)
+        )
+        with slot:
+            ollama_request_duration.observe(time.perf_counter() - started, ('generate',))
+
+            if response.status_code != 200:
+                raise OllamaError('ไม่สามารถเชื่อมต่อกับ AI ได้')
+
+            data = response.json()
+            self._succeeded(slot.backend, model)
+            observe_ollama_response(data)
+            return data
+
+    def generate_stream(self, prompt, model, slot=None):
+        """
+        เรียก /api/generate แบบ stream และ yield JSON ทีละ chunk
+        ส่ง slot ที่จองไว้แล้วมาได้ (เช่นจองก่อนเริ่มส่ง response) ไม่เช่นนั้นจะรอคิวเอง
+        """
+        started = time.perf_counter()
+        # timeout คือเวลารอระหว่างแต่ละ chunk ไม่ใช่เวลารวม
+        slot, response = self._post(
+            model,
+            {
+                "model": model,
+                "prompt": prompt,
+                "stream": True
+            },
+            stream=True,
+            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_STREAM_READ_TIMEOUT),
+            slot=slot
+        )
+        with slot, response:
+            if response.status_code != 200:
+                raise OllamaError('ไม่สามารถเชื่อมต่อกับ AI ได้')
+
+            for line in response.iter_lines():
+                if line:
+                    chunk = json.loads(line)
+                    if chunk.get('done'):
+                        ollama_request_duration.observe(time.perf_counter() - started, ('stream',))
+                        observe_ollama_response(chunk)
+                        self._succeeded(slot.backend, model)
+                    yield chunk
+
+    def _model_names(self, backend, path, timeout):
+        response = self.session.get(f"{backend.url}{path}", timeout=timeout)
+        response.raise_for_status()
+        return [model['name'] for model in response.json().get('models', [])]
+
+    def _check_backend(self, backend, timeout):
+        """ตรวจสอบ backend ด้วย /api/tags (และ /api/ps) คืนค่ารายชื่อ model หรือ None ถ้าเชื่อมต่อไม่ได้"""
+        try:
+            models = self._model_names(backend, '/api/tags', timeout)
+        except Exception as e:
+            with self._condition:
+                backend.healthy = False
+                backend.last_error = str(e)
+                backend.loaded.clear()
+            return None
+
+        try:
+            loaded = self._model_names(backend, '/api/ps', timeout)
+        except Exception:
+            loaded = None  # Ollama รุ่นเก่าไม่มี /api/ps ใช้ข้อมูลจากการเรียกที่สำเร็จแทน
+
+        with self._condition:
+            # ตรวจสอบผ่าน: รับ backend กลับเข้า pool ทันทีแม้ยังไม่ครบเวลาพัก
+            backend.healthy = True
+            backend.failures = 0
+            backend.ejected_until = 0.0
+            backend.models = {ollama_model_name(name) for name in models}
+            if loaded is not None:
+                backend.loaded = {ollama_model_name(name) for name in loaded}
+            self._condition.notify_all()
+        return models
+
+    def check(self, timeout=5):
+        """
+        ตรวจสอบทุก backend พร้อมกัน (ไม่ต้องรอคิว)
+        คืนค่า (จำนวน backend ที่ใช้ได้, รายชื่อ model รวมของทุก backend ที่ใช้ได้)
+        """
+        backends = list(self.backends)
+        with ThreadPoolExecutor(max_workers=len(backends), thread_name_prefix='ollama-check') as executor:
+            results = list(executor.map(lambda backend: self._check_backend(backend, timeout), backends))
+
+        models = []
+        for names in results:
+            for name in names or ():
+                if name not in models:
+                    models.append(name)
+        return sum(names is not None for names in results), models
+
+    def stats(self):
+        """สถิติการเรียก Ollama"""
+        with self._lock:
+            return {
+                'max_concurrency': sum(backend.max_concurrency for backend in self.backends),
+                'active': self.active,
+                'waiting': self.waiting,
+                'requests': self.requests,
+                'rejected': self.rejected,
+                'failovers': self.failovers,
+                'backends': [backend.stats() for backend in self.backends]
+            }
+
+ollama_client = OllamaClient(
+    OLLAMA_BACKENDS,
+    max_concurrency=OLLAMA_MAX_CONCURRENCY,
+    queue_timeout=OLLAMA_QUEUE_TIMEOUT,
+    retries=OLLAMA_RETRIES,
+    backoff=OLLAMA_RETRY_BACKOFF,
+    pool_size=OLLAMA_POOL_SIZE,
+    max_failures=OLLAMA_BACKEND_MAX_FAILURES,
+    eject_seconds=OLLAMA_BACKEND_EJECT_SECONDS
+)
+
+def generate_evaluation(prompt):
+    """เรียก Ollama แบบรอผลลัพธ์ทั้งหมด และคืนข้อความผลการประเมิน"""
+    return ollama_client.generate(prompt, OLLAMA_MODEL).get('response', '')
+
+def stream_evaluation(prompt, slot=None):
+    """เรียก Ollama แบบ stream และ yield ข้อความทีละ chunk"""
+    for chunk in ollama_client.generate_stream(prompt, OLLAMA_MODEL, slot=slot):
+        if chunk.get('error'):
+            raise OllamaError(chunk['error'])
+
+        text = chunk.get('response', '')
+        if text:
+            yield text
+
+        if chunk.get('done'):
+            break
+
+def busy_response(error):
+    """response 503 พร้อม Retry-After เมื่อคิว (Ollama / PDF) เต็ม"""
+    response = jsonify({
+        'success': False,
+        'error': str(error),
+        'retry_after': error.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+# ========================================
+# Ollama Health Monitor
+# ========================================
+
+class OllamaHealthMonitor:
+    """
+    ตรวจสอบสถานะ Ollama ใน background thread ทุก interval วินาที แล้วเก็บผลไว้
+    ทุก request ของ /api/check-ollama อ่านค่าที่เก็บไว้ จึงไม่ต้องเรียก Ollama เอง
+    """
+
+    def __init__(self, client, interval):
+        self.client = client
+        self.interval = interval
+        self.version = 0
+        self.probes = 0
+        self._status = None
+        self._etag = None
+        self._condition = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _probe(self):
+        # ตรวจสอบทุก backend (ผลใช้เลือก backend ด้วย) เชื่อมต่อได้ถ้ามีอย่างน้อย 1 ตัวที่ใช้ได้
+        healthy, models = self.client.check(timeout=5)
+        status = {
+            'connected': healthy > 0,
+            'models': models,
+            'backends': {'healthy': healthy, 'total': len(self.client.backends)}
+        }
+
+        with self._condition:
+            self.probes += 1
+            changed = (self._status is None
+                       or status['connected'] != self._status['connected']
+                       or status['models'] != self._status['models']
+                       or status['backends'] != self._status['backends'])
+
+            status['checked_at'] = datetime.now().isoformat(timespec='seconds')
+            self._status = status
+
+            if changed:
+                self.version += 1
+                payload = json.dumps([status['connected'], status['models'], status['backends']],
+                                     ensure_ascii=False)
+                self._etag = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+                self._condition.notify_all()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._probe()
+
+    def ensure_started(self):
+        """เริ่ม background thread (ครั้งแรกจะตรวจสอบทันทีเพื่อให้มีสถานะพร้อมใช้)"""
+        if self._thread is not None:
+            return
+
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._probe()
+            self._thread = threading.Thread(target=self._run, name='ollama-health', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        """คืนค่า (status, etag, version) ล่าสุด"""
+        self.ensure_started()
+        with self._condition:
+            return dict(self._status), self._etag, self.version
+
+    def wait_for_change(self, version, timeout):
+        """รอจนสถานะเปลี่ยนจาก version ที่ระบุ หรือจนหมดเวลา คืนค่าเหมือน status()"""
+        self.ensure_started()
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout=timeout)
+            return dict(self._status), self._etag, self.version
+
+    def stats(self):
+        with self._condition:
+            return {
+                'interval_seconds': self.interval,
+                'probes': self.probes,
+                'version': self.version,
+                'connected': self._status['connected'] if self._status else None
+            }
+
+ollama_health = OllamaHealthMonitor(ollama_client, OLLAMA_HEALTH_INTERVAL)
+
+# ========================================
+# Request Coalescing (Single-flight)
+# ========================================
+
+class FlightCall:
+    """งานที่กำลังทำอยู่ 1 งาน (เก็บ chunk ที่ได้แล้ว เพื่อส่งต่อให้คนที่มารอทีหลัง)"""
+
+    def __init__(self):
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.condition = threading.Condition()
+
+    def publish(self, chunk):
+        """ส่ง chunk ใหม่ให้คนที่รออยู่"""
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+class SingleFlight:
+    """
+    รวม request ที่ทำงานเดียวกัน (key เดียวกัน) ในเวลาเดียวกันให้ทำงานจริงเพียงครั้งเดียว
+    คนแรกเป็น leader ที่ทำงานจริง คนที่มาทีหลังรอรับผลลัพธ์ (และ chunk) จาก leader
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.waiting = 0
+
+    def join(self, key):
+        """เข้าร่วมงานของ key นี้ คืนค่า (call, is_leader)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                self.waiting += 1
+                return call, False
+
+            call = FlightCall()
+            self._calls[key] = call
+            self.executions += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        """leader แจ้งว่างานเสร็จแล้ว (สำเร็จหรือผิดพลาด)"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+        with call.condition:
+            if call.done:
+                return
+            call.result = result
+            call.error = error
+            call.done = True
+            call.condition.notify_all()
+
+    def follow(self, call):
+        """รับ chunk จาก leader จนงานเสร็จ ถ้า leader ผิดพลาดจะ raise error เดียวกัน"""
+        index = 0
+        try:
+            while True:
+                with call.condition:
+                    while index >= len(call.chunks) and not call.done:
+                        call.condition.wait()
+                    chunks = call.chunks[index:]
+                    index = len(call.chunks)
+                    done = call.done
+
+                for chunk in chunks:
+                    yield chunk
+
+                if done:
+                    break
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+        if call.error is not None:
+            raise call.error
+
+    def do(self, key, fn):
+        """เรียก fn() ครั้งเดียวต่อ key คืนค่า (result, coalesced)"""
+        call, is_leader = self.join(key)
+
+        if not is_leader:
+            for _ in self.follow(call):
+                pass
+            return call.result, True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+
+        self.finish(key, call, result=result)
+        return result, False
+
+    def stats(self):
+        """สถิติการรวม request"""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'waiting': self.waiting,
+                'executions': self.executions,
+                'coalesced': self.coalesced
+            }
+
+evaluation_flight = SingleFlight()
+
+def run_evaluation(property_data):
+    """
+    ประเมินราคาด้วย AI: ใช้ผลจาก cache ถ้ามี ไม่เช่นนั้นเรียก Ollama
+    (ถ้ามีคนกำลังประเมินข้อมูลชุดเดียวกันอยู่ จะรอผลจากการเรียกครั้งเดียวกัน)
+    คืนค่า (ผลการประเมิน, cached, coalesced)
+    """
+    cache_key = evaluation_cache_key(property_data)
+    cached_evaluation = evaluation_cache.get(cache_key)
+    if cached_evaluation is not None:
+        return cached_evaluation, True, False
+
+    prompt = build_evaluation_prompt(property_data)
+
+    def run():
+        ai_response = generate_evaluation(prompt)
+        if ai_response:
+            evaluation_cache.set(cache_key, property_data, ai_response)
+        return ai_response
+
+    ai_response, coalesced = evaluation_flight.do(cache_key, run)
+    return ai_response, False, coalesced
+
+# ========================================
+# Evaluation Job Queue
+# ========================================
+
+class EvaluationJobQueue:
+    """
+    คิวงานประเมินด้วย AI: ส่งงานแล้วได้ job id กลับทันที worker thread จะประมวลผลใน background
+    สถานะและผลลัพธ์เก็บใน SQLite จึงดูได้จากทุก process และยังอยู่หลัง restart
+    ทุก sweep_interval วินาที worker หนึ่งตัวนำงานที่ค้าง running นานเกิน stale_after (process ตาย)
+    กลับเข้าคิว และลบงานที่เสร็จแล้วนานเกิน retention วินาที
+    """
+
+    def __init__(self, path, workers, stale_after, sweep_interval, retention):
+        self.path = path
+        self.workers = workers
+        self.stale_after = stale_after
+        self.sweep_interval = sweep_interval
+        self.retention = retention
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+        self.pruned = 0
+        self._queue = queue.Queue()
+        self._pending = set()  # id ที่อยู่ใน _queue แล้ว (sweep ไม่ใส่ซ้ำ)
+        self._condition = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._swept_at = None
+        self._threads = []
+        self._table_ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        if not self._table_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS evaluation_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    property_data TEXT NOT NULL,
+                    evaluation TEXT,
+                    error TEXT,
+                    cached INTEGER DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_evaluation_jobs_status ON evaluation_jobs (status, created_at)')
+            conn.commit()
+            self._table_ready = True
+        return conn
+
+    def ensure_started(self):
+        """เริ่ม worker thread (sweep ครั้งแรกทันที: นำงานที่ค้างอยู่ เช่นก่อน restart กลับเข้าคิว)"""
+        if self._threads:
+            return
+
+        with self._start_lock:
+            if self._threads:
+                return
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'evaluation-worker-{i + 1}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, property_data):
+        """เพิ่มงานเข้าคิว คืนค่า job id"""
+        self.ensure_started()
+
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT INTO evaluation_jobs (id, status, property_data, created_at)
+                VALUES (?, 'queued', ?, ?)
+            ''', (job_id, json.dumps(property_data, ensure_ascii=False), time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._enqueue(job_id)
+        return job_id
+
+    def _enqueue(self, job_id):
+        with self._condition:
+            if job_id in self._pending:
+                return False
+            self._pending.add(job_id)
+        self._queue.put(job_id)
+        return True
+
+    def _work(self):
+        while True:
+            self._maybe_sweep()
+            try:
+                job_id = self._queue.get(timeout=self.sweep_interval)
+            except queue.Empty:
+                continue
+            try:
+                self._process(job_id)
+            except Exception as e:
+                print(f"❌ ประมวลผลงาน {job_id} ไม่สำเร็จ: {e}")
+            finally:
+                with self._condition:
+                    self._pending.discard(job_id)
+                self._queue.task_done()
+
+    def _maybe_sweep(self):
+        # worker ตัวใดตัวหนึ่งทำเมื่อครบ sweep_interval ตัวอื่นไม่ต้องรอ
+        if self._swept_at is not None and time.monotonic() - self._swept_at < self.sweep_interval:
+            return
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            if self._swept_at is None or time.monotonic() - self._swept_at >= self.sweep_interval:
+                self._sweep()
+                self._swept_at = time.monotonic()
+        except Exception as e:
+            print(f"❌ ตรวจสอบงานที่ค้างไม่สำเร็จ: {e}")
+            self._swept_at = time.monotonic()
+        finally:
+            self._sweep_lock.release()
+
+    def _sweep(self):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE evaluation_jobs SET status = 'queued', started_at = NULL
+                WHERE status = 'running' AND started_at < ?
+            ''', (now - self.stale_after,))
+            pruned = conn.execute(
+                "DELETE FROM evaluation_jobs WHERE status IN ('done', 'error') AND finished_at < ?",
+                (now - self.retention,)
+            ).rowcount
+            conn.commit()
+            pending = conn.execute(
+                "SELECT id FROM evaluation_jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        recovered = sum(self._enqueue(row['id']) for row in pending)
+        with self._condition:
+            self.recovered += recovered
+            self.pruned += pruned
+
+    def _process(self, job_id):
+        import requests
+
+        conn = self._connect()
+        try:
+            # จองงาน (ป้องกันไม่ให้ worker อื่นทำงานซ้ำ)
+            claimed = conn.execute(
+                "UPDATE evaluation_jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            ).rowcount
+            conn.commit()
+            if not claimed:
+                return
+
+            row = conn.execute('SELECT property_data FROM evaluation_jobs WHERE id = ?', (job_id,)).fetchone()
+            property_data = extract_property_data(json.loads(row['property_data']))
+
+            evaluation = error = None
+            cached = False
+            while True:
+                try:
+                    evaluation, cached, _ = run_evaluation(property_data)
+                    break
+                except OllamaBusyError as e:
+                    # คิว Ollama เต็ม (ใช้ร่วมกับ request ที่รอผลอยู่) รอแล้วลองใหม่
+                    # ต่อเวลา started_at ไว้ sweep จะได้ไม่นำงานที่ยังรออยู่กลับเข้าคิว
+                    time.sleep(e.retry_after)
+                    conn.execute('UPDATE evaluation_jobs SET started_at = ? WHERE id = ?', (time.time(), job_id))
+                    conn.commit()
+                except OllamaError as e:
+                    error = str(e)
+                    break
+                except requests.exceptions.ConnectionError:
+                    error = OLLAMA_CONNECTION_ERROR
+                    break
+                except Exception as e:
+                    error = f'เกิดข้อผิดพลาด: {str(e)}'
+                    break
+
+            conn.execute('''
+                UPDATE evaluation_jobs SET status = ?, evaluation = ?, error = ?, cached = ?, finished_at = ?
+                WHERE id = ?
+            ''', ('error' if error else 'done', evaluation, error, int(cached), time.time(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._condition:
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self._condition.notify_all()
+
+    def get(self, job_id):
+        """ดึงข้อมูลงาน หรือ None ถ้าไม่พบ"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM evaluation_jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+
+        job = {
+            'id': row['id'],
+            'status': row['status'],
+            'property_data': public_property_data(extract_property_data(json.loads(row['property_data']))),
+            'created_at': datetime.fromtimestamp(row['created_at']).isoformat(timespec='seconds')
+        }
+        if row['status'] == 'done':
+            job['evaluation'] = row['evaluation']
+            job['cached'] = bool(row['cached'])
+        if row['status'] == 'error':
+            job['error'] = row['error']
+        if row['finished_at']:
+            job['finished_at'] = datetime.fromtimestamp(row['finished_at']).isoformat(timespec='seconds')
+        return job
+
+    def wait(self, job_id, timeout):
+        """รอจนงานเสร็จหรือจนหมดเวลา คืนค่าเหมือน get()"""
+        deadline = time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.time()
+            if job is None or job['status'] in ('done', 'error') or remaining <= 0:
+                return job
+
+            # งานอาจทำเสร็จใน process อื่น จึงตรวจสอบฐานข้อมูลซ้ำอย่างน้อยทุก 1 วินาที
+            with self._condition:
+                self._condition.wait(min(remaining, 1.0))
+
+    def stats(self):
+        with self._condition:
+            return {
+                'workers': self.workers,
+                'queued': self._queue.qsize(),
+                'completed': self.completed,
+                'failed': self.failed,
+                'recovered': self.recovered,
+                'pruned': self.pruned
+            }
+
+evaluation_jobs = EvaluationJobQueue(AI_DATABASE, EVALUATION_WORKERS, JOB_STALE_AFTER, JOB_SWEEP_INTERVAL,
+                                     JOB_RETENTION)
+
+# ========================================
+# Authentication Routes
+# ========================================
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    """หน้า Login"""
+    if current_user.is_authenticated:
+        return redirect(url_for('index'))
+
+    if request.method == 'POST':
+        email = request.form.get('email')
+        password = request.form.get('password')
+        remember = request.form.get('remember', False)
+
+        if not email or not password:
+            flash('กรุณากรอกอีเมล์และรหัสผ่าน', 'danger')
+            return render_template('login.html')
+
+        # จำกัดการ login ผิดซ้ำ ๆ ต่อ IP และต่อบัญชีจาก IP นั้น (บล็อก)
+        # ส่วนบัญชีที่ถูกเดาจากหลาย IP จะถูกหน่วงเวลาแทน ผู้อื่นจึงล็อกบัญชีของเราไม่ได้
+        normalized_email = email.strip().lower()
+        ip_key = f'ip:{request.remote_addr}'
+        ip_account_key = f'ip-email:{request.remote_addr}:{normalized_email}'
+        account_key = f'email:{normalized_email}'
+        retry_after = max(login_limiter.retry_after(ip_key, LOGIN_MAX_FAILURES_PER_IP),
+                          login_limiter.retry_after(ip_account_key, LOGIN_MAX_FAILURES_PER_ACCOUNT))
+        if retry_after:
+            flash(f'เข้าสู่ระบบผิดหลายครั้งเกินไป กรุณาลองใหม่ในอีก {(retry_after + 59) // 60} นาที', 'danger')
+            return render_template('login.html'), 429, {'Retry-After': str(retry_after)}
+        login_limiter.delay(account_key, LOGIN_ACCOUNT_DELAY_AFTER, LOGIN_ACCOUNT_DELAY)
+
+        # ตรวจสอบ user ในฐานข้อมูล
+        conn = get_db()
+        user_cache.refresh(get_db)
+        version = user_cache.version  # อ่านก่อน query (ดู UserCache.set)
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
+        user_data = cursor.fetchone()
+
+        try:
+            if user_data:
+                password_ok = password_hasher.verify(user_data['password'], password)
+            else:
+                # ไม่พบอีเมล์: ตรวจกับ hash สมมติ เวลาตอบจึงไม่บอกว่าอีเมล์นี้มีบัญชีหรือไม่
+                password_hasher.verify(password_hasher.dummy_hash, password)
+                password_ok = False
+        except PasswordHashBusyError as e:
+            flash(str(e), 'danger')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+
+        if password_ok:
+            login_limiter.reset(ip_account_key, account_key)
+
+            # hash เดิมใช้ method/cost เก่า hash ใหม่ด้วยค่าปัจจุบัน
+            if password_hasher.needs_rehash(user_data['password']):
+                try:
+                    cursor.execute('UPDATE users SET password = ? WHERE id = ?',
+                                   (password_hasher.rehash(password), user_data['id']))
+                    conn.commit()
+                except PasswordHashBusyError:
+                    pass  # hash ใหม่ในการ login ครั้งถัดไป
+
+            # Login สำเร็จ
+            user = User(
+                id=user_data['id'],
+                email=user_data['email'],
+                full_name=user_data['full_name'],
+                role=user_data['role']
+            )
+            login_user(user, remember=remember)
+            user_cache.set(user, version)
+
+            # อัปเดต last_login (เขียนลง database ใน background)
+            login_events.record('login', user_id=user_data['id'], email=user_data['email'],
+                                ip_address=request.remote_addr)
+
+            flash(f'ยินดีต้อนรับ {user.full_name}!', 'success')
+
+            # Redirect to next page or index
+            next_page = request.args.get('next')
+            return redirect(next_page) if next_page else redirect(url_for('index'))
+        else:
+            login_limiter.record_failure(ip_key, ip_account_key, account_key)
+            login_events.record('login_failed', user_id=user_data['id'] if user_data else None, email=email,
+                                ip_address=request.remote_addr)
+            flash('อีเมล์หรือรหัสผ่านไม่ถูกต้อง', 'danger')
+
+    return render_template('login.html')
+
+@app.route('/register', methods=['GET', 'POST'])
+def register():
+    """หน้า Register (สมัครสมาชิก)"""
+    if current_user.is_authenticated:
+        return redirect(url_for('index'))
+
+    if request.method == 'POST':
+        email = request.form.get('email')
+        password = request.form.get('password')
+        confirm_password = request.form.get('confirm_password')
+        full_name = request.form.get('full_name')
+
+        # Validation
+        if not email or not password or not full_name:
+            flash('กรุณากรอกข้อมูลให้ครบถ้วน', 'danger')
+            return render_template('register.html')
+
+        if password != confirm_password:
+            flash('รหัสผ่านไม่ตรงกัน', 'danger')
+            return render_template('register.html')
+
+        if len(password) < 4:
+            flash('รหัสผ่านต้องมีอย่างน้อย 4 ตัวอักษร', 'danger')
+            return render_template('register.html')
+
+        # ตรวจสอบว่าอีเมล์ซ้ำหรือไม่
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
+        existing_user = cursor.fetchone()
+
+        if existing_user:
+            flash('อีเมล์นี้ถูกใช้งานแล้ว', 'danger')
+            return render_template('register.html')
+
+        # สร้าง account ใหม่
+        try:
+            hashed_password = password_hasher.hash(password)
+        except PasswordHashBusyError as e:
+            flash(str(e), 'danger')
+            return render_template('register.html'), 503, {'Retry-After': '5'}
+
+        try:
+            cursor.execute('''
+                INSERT INTO users (email, password, full_name, role)
                 VALUES (?, ?, ?, ?)
             ''', (email, hashed_password, full_name, 'user'))
             conn.commit()
-            conn.close()
 
             flash('สมัครสมาชิกสำเร็จ! กรุณาเข้าสู่ระบบ', 'success')
             return redirect(url_for('login'))
         except Exception as e:
-            conn.close()
+            conn.rollback()
             flash(f'เกิดข้อผิดพลาด: {str(e)}', 'danger')
             return render_template('register.html')
 
@@ -460,17 +4244,21 @@ def change_password():
         cursor.execute('SELECT password FROM users WHERE id = ?', (current_user.id,))
         user_data = cursor.fetchone()
 
-        if not user_data or not check_password_hash(user_data['password'], current_password):
-            flash('รหัสผ่านเดิมไม่ถูกต้อง', 'danger')
-            conn.close()
-            return render_template('change_password.html')
+        try:
+            if not user_data or not password_hasher.verify(user_data['password'], current_password):
+                flash('รหัสผ่านเดิมไม่ถูกต้อง', 'danger')
+                return render_template('change_password.html')
+
+            # เปลี่ยนรหัสผ่าน
+            hashed_password = password_hasher.hash(new_password)
+        except PasswordHashBusyError as e:
+            flash(str(e), 'danger')
+            return render_template('change_password.html'), 503, {'Retry-After': '5'}
 
-        # เปลี่ยนรหัสผ่าน
-        hashed_password = generate_password_hash(new_password)
         cursor.execute('UPDATE users SET password = ? WHERE id = ?',
                       (hashed_password, current_user.id))
         conn.commit()
-        conn.close()
+        user_cache.invalidate(current_user.id)
 
         flash('เปลี่ยนรหัสผ่านสำเร็จ!', 'success')
         return redirect(url_for('index'))
@@ -480,20 +4268,61 @@ def change_password():
 @app.route('/admin')
 @admin_required
 def admin():
-    """หน้า Admin Panel - จัดการผู้ใช้"""
+    """หน้า Admin Panel - จัดการผู้ใช้ (ค้นหาด้วย ?q= และแบ่งหน้าด้วย ?cursor=)"""
     conn = get_db()
-    cursor = conn.cursor()
 
-    # ดึงข้อมูลผู้ใช้ทั้งหมด
-    cursor.execute('''
-        SELECT id, email, full_name, role, created_at, last_login
-        FROM users
-        ORDER BY created_at DESC
-    ''')
-    users = cursor.fetchall()
-    conn.close()
+    query = request.args.get('q', '').strip()
+    role = request.args.get('role') or None
+    cursor = decode_user_cursor(request.args['cursor']) if request.args.get('cursor') else None
+
+    users, next_cursor = list_users(conn, query=query, role=role, cursor=cursor)
+
+    return render_template('admin.html', users=users, next_cursor=next_cursor, counts=count_users_by_role(conn),
+                           query=query, role=role, page_size=ADMIN_USERS_PAGE_SIZE)
+
+@app.route('/api/admin/users', methods=['GET'])
+@admin_required
+def api_admin_users():
+    """
+    API รายชื่อผู้ใช้สำหรับตารางในหน้า Admin
+    ?q= ค้นหาอีเมล์/ชื่อ, ?role=admin|user, ?cursor= หน้าถัดไป (จาก next_cursor), ?limit=
+    """
+    try:
+        cursor = None
+        if request.args.get('cursor'):
+            cursor = decode_user_cursor(request.args['cursor'])
+            if cursor is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'cursor ไม่ถูกต้อง'
+                }), 400
+
+        try:
+            limit = int(request.args.get('limit', ADMIN_USERS_PAGE_SIZE))
+        except ValueError:
+            limit = ADMIN_USERS_PAGE_SIZE
+        limit = max(1, min(limit, ADMIN_USERS_MAX_PAGE_SIZE))
+
+        users, next_cursor = list_users(
+            get_db(),
+            query=request.args.get('q', ''),
+            role=request.args.get('role') or None,
+            cursor=cursor,
+            limit=limit
+        )
+
+        return jsonify({
+            'success': True,
+            'users': users,
+            'next_cursor': next_cursor,
+            'current_user_id': current_user.id
+        })
 
-    return render_template('admin.html', users=users)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'เกิดข้อผิดพลาด: {str(e)}'
+        }), 500
 
 @app.route('/admin/delete-user/<int:user_id>', methods=['POST'])
 @admin_required
@@ -507,7 +4336,7 @@ def delete_user(user_id):
     cursor = conn.cursor()
     cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
     conn.commit()
-    conn.close()
+    user_cache.invalidate(user_id)
 
     flash('ลบผู้ใช้เรียบร้อย', 'success')
     return redirect(url_for('admin'))
@@ -533,9 +4362,9 @@ def toggle_role(user_id):
 
         cursor.execute('UPDATE users SET role = ? WHERE id = ?', (new_role, user_id))
         conn.commit()
+        user_cache.invalidate(user_id)
         flash(f'เปลี่ยน Role เป็น {new_role} เรียบร้อย', 'success')
 
-    conn.close()
     return redirect(url_for('admin'))
 
 # ========================================
@@ -546,113 +4375,211 @@ def toggle_role(user_id):
 @login_required
 def index():
     y = getYear()
-    return render_template('index.html', year=y, user=current_user)
+    return render_template('index.html', year=y, user=current_user, ollama_status_stream=OLLAMA_STATUS_STREAM)
 
 @app.route('/api/provinces', methods=['GET'])
 def get_provinces():
     """
     API สำหรับดึงข้อมูลจังหวัดทั้งหมด
+    ส่ง ?region=เหนือ เพื่อดึงเฉพาะจังหวัดในภูมิภาคนั้น
+    (response สร้างไว้ล่วงหน้าทั้งแบบปกติและ gzip พร้อม ETag)
     """
-    provinces_list = []
-    for province, data in PROVINCES_DATA.items():
-        provinces_list.append({
-            'name': province,
-            'region': data['region'],
-            'multiplier': data['multiplier']
-        })
+    responses = get_provinces_responses()
+    region = request.args.get('region') or None
+
+    if region not in responses:
+        return jsonify({
+            'success': False,
+            'error': 'ไม่พบภูมิภาคที่ระบุ'
+        }), 404
 
-    # เรียงตามชื่อจังหวัด
-    provinces_list.sort(key=lambda x: x['name'])
+    body, gzipped, etag = responses[region]
 
-    return jsonify({
-        'success': True,
-        'provinces': provinces_list,
-        'total': len(provinces_list)
-    })
+    if request.accept_encodings['gzip']:
+        response = Response(gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag + '-gz')
+    else:
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+
+    response.headers['Cache-Control'] = f'public, max-age={PROVINCES_CACHE_MAX_AGE}'
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
 
 @app.route('/api/evaluate', methods=['POST'])
 def evaluate_property():
     """
     API สำหรับประเมินราคาทรัพย์สินโดยใช้ AI
     """
+    import requests
+
     try:
         data = request.get_json()
 
         # ดึงข้อมูลจาก request
-        property_type = data.get('property_type', '')
-        location = data.get('location', '')
-        area = data.get('area', '')
-        bedrooms = data.get('bedrooms', '')
-        bathrooms = data.get('bathrooms', '')
-        age = data.get('age', '')
-        condition = data.get('condition', '')
-        additional_info = data.get('additional_info', '')
-
-        # สร้าง prompt สำหรับ AI
-        prompt = f"""คุณเป็นผู้เชี่ยวชาญด้านการประเมินราคาอสังหาริมทรัพย์ในประเทศไทย กรุณาประเมินราคาทรัพย์สินตามข้อมูลต่อไปนี้:
-
-ประเภททรัพย์สิน: {property_type}
-ทำเลที่ตั้ง: {location}
-ขนาดพื้นที่: {area} ตารางเมตร
-จำนวนห้องนอน: {bedrooms} ห้อง
-จำนวนห้องน้ำ: {bathrooms} ห้อง
-อายุอาคาร: {age} ปี
-สภาพทรัพย์สิน: {condition}
-ข้อมูลเพิ่มเติม: {additional_info}
-
-กรุณาวิเคราะห์และให้คำแนะนำเกี่ยวกับ:
-1. ราคาประเมินโดยประมาณ (บาท)
-2. ปัจจัยที่ส่งผลต่อราคา
-3. แนวโน้มตลาดในพื้นที่
-4. คำแนะนำสำหรับผู้ซื้อหรือผู้ขาย
-
-โปรดตอบเป็นภาษาไทยและให้รายละเอียดที่ชัดเจน"""
-
-        # เรียก Ollama API
-        ollama_response = requests.post(
-            OLLAMA_API_URL,
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False
-            },
-            timeout=60
-        )
+        property_data = extract_property_data(data)
 
-        if ollama_response.status_code == 200:
-            ai_result = ollama_response.json()
-            ai_response = ai_result.get('response', '')
+        # ใช้ผลจาก cache ถ้ามี ไม่เช่นนั้นเรียก AI
+        ai_response, cached, coalesced = run_evaluation(property_data)
 
-            return jsonify({
-                'success': True,
-                'evaluation': ai_response,
-                'property_data': {
-                    'property_type': property_type,
-                    'location': location,
-                    'area': area,
-                    'bedrooms': bedrooms,
-                    'bathrooms': bathrooms,
-                    'age': age,
-                    'condition': condition
-                }
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'ไม่สามารถเชื่อมต่อกับ AI ได้'
-            }), 500
+        return jsonify({
+            'success': True,
+            'evaluation': ai_response,
+            'property_data': public_property_data(property_data),
+            'cached': cached,
+            'coalesced': coalesced
+        })
 
+    except OllamaBusyError as e:
+        return busy_response(e)
+    except OllamaError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
     except requests.exceptions.ConnectionError:
         return jsonify({
             'success': False,
-            'error': 'ไม่สามารถเชื่อมต่อกับ Ollama ได้ กรุณาตรวจสอบว่า Ollama กำลังทำงานอยู่ที่ localhost:11434'
+            'error': OLLAMA_CONNECTION_ERROR
+        }), 500
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'เกิดข้อผิดพลาด: {str(e)}'
         }), 500
+
+@app.route('/api/evaluate/stream', methods=['POST'])
+def evaluate_property_stream():
+    """
+    API สำหรับประเมินราคาทรัพย์สินโดยใช้ AI แบบ streaming
+    ส่งผลลัพธ์กลับเป็น NDJSON (1 บรรทัดต่อ 1 event) ทันทีที่ Ollama สร้างข้อความ
+    - {"type": "start", "property_data": {...}}
+    - {"type": "chunk", "text": "..."}
+    - {"type": "done", "evaluation": "..."}
+    - {"type": "error", "error": "..."}
+    """
+    import requests
+
+    data = request.get_json(silent=True) or {}
+    property_data = extract_property_data(data)
+    prompt = build_evaluation_prompt(property_data)
+    cache_key = evaluation_cache_key(property_data)
+
+    cached_evaluation = evaluation_cache.get(cache_key)
+    call, is_leader = (None, False) if cached_evaluation is not None else evaluation_flight.join(cache_key)
+
+    # จองคิว Ollama ก่อนเริ่มส่ง response เพื่อให้ตอบ 503 ได้ทันทีเมื่อคิวเต็ม
+    slot = None
+    if is_leader:
+        try:
+            slot = ollama_client.acquire(OLLAMA_MODEL)
+        except OllamaBusyError as e:
+            evaluation_flight.finish(cache_key, call, error=e)
+            return busy_response(e)
+
+    def generate():
+        yield ndjson_line({'type': 'start', 'property_data': public_property_data(property_data)})
+
+        try:
+            if cached_evaluation is not None:
+                yield ndjson_line({'type': 'chunk', 'text': cached_evaluation})
+                yield ndjson_line({'type': 'done', 'evaluation': cached_evaluation, 'cached': True})
+                return
+
+            if not is_leader:
+                # มีคนกำลังประเมินข้อมูลชุดเดียวกันอยู่ ส่งต่อ chunk จากการเรียกครั้งนั้น
+                for text in evaluation_flight.follow(call):
+                    yield ndjson_line({'type': 'chunk', 'text': text})
+                yield ndjson_line({'type': 'done', 'evaluation': call.result, 'cached': False, 'coalesced': True})
+                return
+
+            try:
+                parts = []
+                for text in stream_evaluation(prompt, slot=slot):
+                    parts.append(text)
+                    call.publish(text)
+                    yield ndjson_line({'type': 'chunk', 'text': text})
+
+                ai_response = ''.join(parts)
+                if ai_response:
+                    evaluation_cache.set(cache_key, property_data, ai_response)
+
+                evaluation_flight.finish(cache_key, call, result=ai_response)
+            except Exception as e:
+                evaluation_flight.finish(cache_key, call, error=e)
+                raise
+
+            yield ndjson_line({'type': 'done', 'evaluation': ai_response, 'cached': False, 'coalesced': False})
+
+        except OllamaError as e:
+            yield ndjson_line({'type': 'error', 'error': str(e)})
+        except requests.exceptions.ConnectionError:
+            yield ndjson_line({'type': 'error', 'error': OLLAMA_CONNECTION_ERROR})
+        except Exception as e:
+            yield ndjson_line({'type': 'error', 'error': f'เกิดข้อผิดพลาด: {str(e)}'})
+
+    def cleanup():
+        # client ปิดการเชื่อมต่อกลางคัน: คืนคิว Ollama และปล่อยคนที่รอผลอยู่
+        if slot is not None:
+            slot.release()
+        if is_leader:
+            evaluation_flight.finish(cache_key, call, error=OllamaError('การประเมินถูกยกเลิก กรุณาลองใหม่อีกครั้ง'))
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # ปิด buffering ของ nginx เพื่อให้ chunk ถึง browser ทันที
+        }
+    )
+    response.call_on_close(cleanup)
+    return response
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_evaluation_job():
+    """
+    API สำหรับส่งงานประเมินราคาด้วย AI เข้าคิว (ได้ job id กลับทันที)
+    """
+    try:
+        data = request.get_json()
+        property_data = extract_property_data(data)
+        job_id = evaluation_jobs.submit(property_data)
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': url_for('get_evaluation_job', job_id=job_id)
+        }), 202
+
     except Exception as e:
         return jsonify({
             'success': False,
             'error': f'เกิดข้อผิดพลาด: {str(e)}'
         }), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_evaluation_job(job_id):
+    """
+    API สำหรับดูสถานะ/ผลลัพธ์ของงาน
+    ส่ง ?wait=วินาที เพื่อรอจนงานเสร็จ (long polling, สูงสุด JOB_WAIT_MAX วินาที)
+    """
+    wait = min(request.args.get('wait', 0, type=float), JOB_WAIT_MAX)
+    job = evaluation_jobs.wait(job_id, wait) if wait > 0 else evaluation_jobs.get(job_id)
+
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'ไม่พบงานที่ระบุ'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
 @app.route('/api/quick-estimate', methods=['POST'])
 def quick_estimate():
     """
@@ -666,42 +4593,24 @@ def quick_estimate():
         area = float(data.get('area', 0))
         province = data.get('province', '')
 
-        # ราคาต่อตารางเมตรโดยประมาณ (หน่วย: บาท)
-        base_prices = {
-            'คอนโด': 50000,
-            'บ้านเดี่ยว': 35000,
-            'ทาวน์เฮาส์': 30000,
-            'อาคารพาณิชย์': 40000,
-            'ที่ดิน': 15000
-        }
-
-        # ดึงตัวคูณจากข้อมูลจังหวัด
-        location_multiplier = 1.0
-        province_info = None
-
-        if province in PROVINCES_DATA:
-            province_info = PROVINCES_DATA[province]
-            location_multiplier = province_info['multiplier']
-        else:
-            # ถ้าไม่พบจังหวัด ให้ใช้ค่า default
-            location_multiplier = 1.0
-
-        base_price = base_prices.get(property_type, 30000)
-        estimated_price = area * base_price * location_multiplier
-        price_per_sqm = base_price * location_multiplier
+        # ราคาต่อตารางเมตร: ราคาที่อัปโหลด > ค่าเฉลี่ยภูมิภาค > ราคาพื้นฐาน × ตัวคูณจังหวัด
+        price_per_sqm, price_source = get_price_index().lookup(province, property_type)
+        estimated_price = area * price_per_sqm
+        province_info = PROVINCES_DATA.get(province)
 
         response_data = {
             'success': True,
             'estimated_price': estimated_price,
             'price_per_sqm': price_per_sqm,
             'area': area,
-            'province': province
+            'province': province,
+            'price_source': price_source
         }
 
         # เพิ่มข้อมูลภูมิภาคถ้ามี
         if province_info:
             response_data['region'] = province_info['region']
-            response_data['multiplier'] = location_multiplier
+            response_data['multiplier'] = province_info['multiplier']
 
         return jsonify(response_data)
 
@@ -715,27 +4624,117 @@ def quick_estimate():
 def check_ollama():
     """
     ตรวจสอบการเชื่อมต่อกับ Ollama
+    ใช้สถานะล่าสุดจาก background monitor (ตอบ 304 ถ้า client มีสถานะล่าสุดอยู่แล้ว)
     """
-    try:
-        response = requests.get('http://localhost:11434/api/tags', timeout=5)
-        if response.status_code == 200:
-            models = response.json().get('models', [])
-            return jsonify({
-                'success': True,
-                'connected': True,
-                'models': [model['name'] for model in models]
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'connected': False
-            })
-    except:
+    status, etag, _ = ollama_health.status()
+
+    response = jsonify(ollama_status_payload(status))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/check-ollama/stream', methods=['GET'])
+def check_ollama_stream():
+    """
+    ส่งสถานะ Ollama แบบ Server-Sent Events: ส่งสถานะปัจจุบันทันที แล้วส่งใหม่ทุกครั้งที่สถานะเปลี่ยน
+    ปิดการเชื่อมต่อเมื่อครบ OLLAMA_STATUS_STREAM_MAX_AGE วินาที เพื่อไม่ให้ใช้ worker ค้างไว้ตลอด
+    """
+    if not OLLAMA_STATUS_STREAM:
         return jsonify({
             'success': False,
-            'connected': False,
-            'error': 'ไม่สามารถเชื่อมต่อกับ Ollama ได้'
-        })
+            'error': 'ปิดการใช้งาน status stream'
+        }), 404
+
+    def generate():
+        deadline = time.monotonic() + OLLAMA_STATUS_STREAM_MAX_AGE
+        status, _, version = ollama_health.status()
+        yield f"retry: {OLLAMA_HEALTH_INTERVAL * 1000}\n"
+        yield f"data: {json.dumps(ollama_status_payload(status), ensure_ascii=False)}\n\n"
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            status, _, new_version = ollama_health.wait_for_change(
+                version, timeout=min(OLLAMA_STATUS_HEARTBEAT, remaining))
+            if new_version == version:
+                yield ': keep-alive\n\n'
+                continue
+
+            version = new_version
+            yield f"data: {json.dumps(ollama_status_payload(status), ensure_ascii=False)}\n\n"
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def ollama_status_payload(status):
+    """รูปแบบ response ของสถานะ Ollama"""
+    payload = {
+        'success': status['connected'],
+        'connected': status['connected'],
+        'checked_at': status['checked_at'],
+        'backends': status['backends']
+    }
+    if status['connected']:
+        payload['models'] = status['models']
+    else:
+        payload['error'] = 'ไม่สามารถเชื่อมต่อกับ Ollama ได้'
+    return payload
+
+@app.route('/api/stats', methods=['GET'])
+@admin_required
+def get_stats():
+    """
+    สถิติการทำงานของระบบ (Admin เท่านั้น)
+    """
+    return jsonify({
+        'success': True,
+        'evaluation_cache': evaluation_cache.stats(),
+        'single_flight': evaluation_flight.stats(),
+        'ollama': ollama_client.stats(),
+        'ollama_health': ollama_health.stats(),
+        'jobs': evaluation_jobs.stats(),
+        'pdf': pdf_pool.stats(),
+        'pdf_cache': pdf_cache.stats(),
+        'user_cache': user_cache.stats(),
+        'password_hasher': password_hasher.stats(),
+        'login_limiter': login_limiter.stats(),
+        'login_events': login_events.stats(),
+        'price_uploads': price_uploads.stats()
+    })
+
+def metrics_authorized():
+    """scraper ส่ง token ถูกต้อง, มาจาก IP ที่อนุญาต หรือเป็น admin ที่ login อยู่"""
+    if METRICS_TOKEN and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return True
+    if request.remote_addr in METRICS_ALLOWED_IPS:
+        return True
+    return current_user.is_authenticated and current_user.is_admin()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Metrics ในรูปแบบ Prometheus (ค่าแยกต่อ process เมื่อรันหลาย worker)
+    """
+    if not METRICS_ENABLED:
+        return jsonify({
+            'success': False,
+            'error': 'ปิดการใช้งาน metrics'
+        }), 404
+
+    if not metrics_authorized():
+        return Response('unauthorized\n', status=401, mimetype='text/plain',
+                        headers={'WWW-Authenticate': 'Bearer'})
+
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
 
 @app.route('/api/download-pdf', methods=['POST'])
 def download_pdf():
@@ -744,28 +4743,151 @@ def download_pdf():
     """
     try:
         data = request.get_json()
-        evaluation_data = data.get('property_data', {})
-        ai_response = data.get('evaluation', '')
+        evaluation_data, ai_response, error = resolve_report_data(data)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        # ใช้ PDF ที่เคยสร้างจากข้อมูลชุดเดียวกัน ถ้าไม่มีจึงสร้างใหม่
+        cache_key = pdf_cache.key(evaluation_data, ai_response)
+        pdf_path = pdf_cache.get(cache_key)
+        if pdf_path is None:
+            pdf_path = pdf_cache.put(cache_key, pdf_pool.render(evaluation_data, ai_response))
+
+        # ส่งไฟล์ PDF
+        filename = f"property_evaluation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+
+        response = send_file(
+            pdf_path,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=filename,
+            conditional=True,
+            etag=cache_key
+        )
+        # URL สำหรับดาวน์โหลดไฟล์เดิมซ้ำ (GET รองรับ If-None-Match และ Range)
+        response.headers['Content-Location'] = url_for('download_cached_pdf', cache_key=cache_key)
+        return response
+
+    except PdfBusyError as e:
+        return busy_response(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'เกิดข้อผิดพลาด: {str(e)}'
+        }), 500
+
+@app.route('/api/download-pdf/<cache_key>', methods=['GET'])
+def download_cached_pdf(cache_key):
+    """
+    ดาวน์โหลด PDF ที่เคยสร้างแล้วจาก cache (ใช้ URL จาก header Content-Location ของ POST /api/download-pdf)
+    """
+    if len(cache_key) != 64 or not all(c in '0123456789abcdef' for c in cache_key):
+        return jsonify({
+            'success': False,
+            'error': 'ไม่พบไฟล์ PDF'
+        }), 404
+
+    pdf_path = pdf_cache.get(cache_key)
+    if pdf_path is None:
+        return jsonify({
+            'success': False,
+            'error': 'ไม่พบไฟล์ PDF (อาจถูกลบออกจาก cache แล้ว)'
+        }), 404
+
+    return send_file(
+        pdf_path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'property_evaluation_{cache_key[:12]}.pdf',
+        conditional=True,
+        etag=cache_key
+    )
+
+@app.route('/api/download-pdf/batch', methods=['POST'])
+def download_pdf_batch():
+    """
+    API สำหรับดาวน์โหลดรายงาน PDF หลายรายการในครั้งเดียว
+    - format=pdf: รวมเป็น PDF ไฟล์เดียว มีสารบัญ และขึ้นหน้าใหม่ทุกทรัพย์สิน
+    - format=zip: ZIP ของ PDF แยกรายการ สร้างพร้อมกันและส่งออกทีละไฟล์ทันทีที่เสร็จ
+    """
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({
+                'success': False,
+                'error': 'รูปแบบข้อมูลไม่ถูกต้อง'
+            }), 400
 
-        if not evaluation_data or not ai_response:
+        items = data.get('items') or []
+        output_format = data.get('format', 'pdf')
+
+        if output_format not in ('pdf', 'zip'):
             return jsonify({
                 'success': False,
-                'error': 'ข้อมูลไม่ครบถ้วน'
+                'error': 'format ต้องเป็น pdf หรือ zip'
             }), 400
 
-        # สร้าง PDF
-        pdf_buffer = generate_pdf_report(evaluation_data, ai_response)
+        if not items:
+            return jsonify({
+                'success': False,
+                'error': 'ไม่มีรายการที่ต้องการดาวน์โหลด'
+            }), 400
 
-        # ส่งไฟล์ PDF
-        filename = f"property_evaluation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        if not isinstance(items, list):
+            return jsonify({
+                'success': False,
+                'error': 'items ต้องเป็น list'
+            }), 400
 
-        return send_file(
-            pdf_buffer,
+        if len(items) > BATCH_PDF_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f'ดาวน์โหลดได้ครั้งละไม่เกิน {BATCH_PDF_MAX_ITEMS:,} รายการ'
+            }), 400
+
+        reports = []
+        for index, item in enumerate(items, 1):
+            if not isinstance(item, dict):
+                return jsonify({
+                    'success': False,
+                    'error': f'รายการที่ {index}: รูปแบบข้อมูลไม่ถูกต้อง'
+                }), 400
+
+            evaluation_data, ai_response, error = resolve_report_data(item)
+            if error:
+                payload, status_code = error
+                payload['error'] = f"รายการที่ {index}: {payload['error']}"
+                return jsonify(payload), status_code
+            reports.append((evaluation_data, ai_response))
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        if output_format == 'zip':
+            return Response(
+                stream_batch_zip(reports),
+                mimetype='application/zip',
+                headers={'Content-Disposition': f'attachment; filename=property_evaluations_{timestamp}.zip'}
+            )
+
+        cache_key = pdf_cache.key([report[0] for report in reports], [report[1] for report in reports])
+        pdf_path = pdf_cache.get(cache_key)
+        if pdf_path is None:
+            future = pdf_pool.submit(render_batch_pdf_bytes, reports)
+            pdf_path = pdf_cache.put(cache_key, pdf_pool.result(future))
+
+        response = send_file(
+            pdf_path,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=filename
+            download_name=f'property_evaluations_{timestamp}.pdf',
+            conditional=True,
+            etag=cache_key
         )
+        response.headers['Content-Location'] = url_for('download_cached_pdf', cache_key=cache_key)
+        return response
 
+    except PdfBusyError as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -773,11 +4895,16 @@ def download_pdf():
         }), 500
 
 @app.route('/api/upload-price-data', methods=['POST'])
+@login_required
 def upload_price_data():
     """
     API สำหรับอัปโหลดข้อมูลราคาจาก Excel
     รูปแบบไฟล์: province, property_type, base_price_per_sqm
+    ไฟล์ขนาดใหญ่: ส่งตัวไฟล์เป็น body พร้อม ?filename= (นำเข้าใน background ดูสถานะที่ GET /api/upload-price-data/<id>)
     """
+    if request.args.get('filename'):
+        return upload_price_data_stream(request.args['filename'])
+
     try:
         # ตรวจสอบว่ามีไฟล์หรือไม่
         if 'file' not in request.files:
@@ -803,11 +4930,9 @@ def upload_price_data():
             }), 400
 
         # อ่านไฟล์ Excel
+        started = time.perf_counter()
         try:
-            if file.filename.endswith('.csv'):
-                df = pd.read_csv(file)
-            else:
-                df = pd.read_excel(file)
+            df = read_uploaded_table(file)
         except Exception as e:
             return jsonify({
                 'success': False,
@@ -815,48 +4940,30 @@ def upload_price_data():
             }), 400
 
         # ตรวจสอบ columns ที่จำเป็น
-        required_columns = ['province', 'property_type', 'base_price_per_sqm']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in PRICE_REQUIRED_COLUMNS if col not in df.columns]
 
         if missing_columns:
             return jsonify({
                 'success': False,
                 'error': f'ขาด columns: {", ".join(missing_columns)}',
-                'required_columns': required_columns
+                'required_columns': PRICE_REQUIRED_COLUMNS
             }), 400
 
         # อัปเดตฐานข้อมูลราคา
-        updated_count = 0
-        errors = []
-
-        for index, row in df.iterrows():
-            try:
-                province = str(row['province']).strip()
-                property_type = str(row['property_type']).strip()
-                base_price = float(row['base_price_per_sqm'])
-
-                # สร้าง key
-                key = f"{province}_{property_type}"
-                price_database[key] = {
-                    'province': province,
-                    'property_type': property_type,
-                    'base_price_per_sqm': base_price
-                }
-                updated_count += 1
-
-            except Exception as e:
-                errors.append(f"แถว {index + 2}: {str(e)}")
+        updated_count, errors, error_count = ingest_price_frame(df, filename=file.filename)
+        observe_price_upload(updated_count, error_count, time.perf_counter() - started)
 
         response_data = {
             'success': True,
             'message': f'อัปโหลดสำเร็จ {updated_count} รายการ',
             'updated_count': updated_count,
-            'total_records': len(price_database)
+            'total_records': len(price_store),
+            'version': price_store.version
         }
 
-        if errors:
+        if error_count:
             response_data['errors'] = errors
-            response_data['error_count'] = len(errors)
+            response_data['error_count'] = error_count
 
         return jsonify(response_data)
 
@@ -866,19 +4973,198 @@ def upload_price_data():
             'error': f'เกิดข้อผิดพลาด: {str(e)}'
         }), 500
 
+def upload_price_data_stream(filename):
+    """
+    รับไฟล์ราคาขนาดใหญ่ (body ของ request คือตัวไฟล์) เขียนลง disk แล้วนำเข้าใน background
+    ไม่ผ่าน MAX_CONTENT_LENGTH ใช้ PRICE_STREAM_MAX_BYTES แทน ตอบ 202 พร้อม upload id
+    """
+    extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if extension not in PRICE_STREAM_EXTENSIONS:
+        return jsonify({
+            'success': False,
+            'error': 'การอัปโหลดไฟล์ขนาดใหญ่รองรับเฉพาะไฟล์ .xlsx, .csv เท่านั้น (ไฟล์ .xls กรุณาบันทึกเป็น .xlsx)'
+        }), 400
+
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    stored_path = os.path.abspath(os.path.join(UPLOAD_FOLDER, f'price-upload-{uuid.uuid4().hex}.{extension}'))
+    # จองก่อนรับ body: ผู้ใช้คนหนึ่งส่งไฟล์ขนาดใหญ่พร้อมกันได้ไม่เกิน PRICE_STREAM_MAX_ACTIVE_PER_USER ไฟล์
+    upload_id = price_store.create_upload(filename, 'receiving', stored_path=stored_path, user_id=current_user.id,
+                                          max_active=PRICE_STREAM_MAX_ACTIVE_PER_USER)
+    if upload_id is None:
+        return jsonify({
+            'success': False,
+            'error': 'มีการอัปโหลดไฟล์ราคาที่ยังไม่เสร็จอยู่แล้ว กรุณารอให้เสร็จก่อน',
+            'retry_after': PRICE_STREAM_RETRY_AFTER
+        }), 429, {'Retry-After': str(PRICE_STREAM_RETRY_AFTER)}
+
+    try:
+        bytes_total = spool_request_body(stored_path, PRICE_STREAM_MAX_BYTES,
+                                         heartbeat=lambda: price_store.update_upload(upload_id, heartbeat_at=time.time()))
+    except RequestEntityTooLarge:
+        price_store.update_upload(upload_id, status='error', error='ไฟล์มีขนาดใหญ่เกินกำหนด', finished_at=time.time())
+        return jsonify({
+            'success': False,
+            'error': f'ไฟล์มีขนาดใหญ่เกิน {PRICE_STREAM_MAX_BYTES // (1024 * 1024)} MB'
+        }), 413
+    except Exception as e:
+        price_store.update_upload(upload_id, status='error', error=str(e), finished_at=time.time())
+        return jsonify({
+            'success': False,
+            'error': f'รับไฟล์ไม่สำเร็จ: {str(e)}'
+        }), 500
+
+    if not bytes_total:
+        os.remove(stored_path)
+        price_store.update_upload(upload_id, status='error', error='ไฟล์ว่าง', finished_at=time.time())
+        return jsonify({
+            'success': False,
+            'error': 'ไม่พบไฟล์ที่อัปโหลด'
+        }), 400
+
+    price_store.update_upload(upload_id, status='queued', bytes_total=bytes_total)
+    price_uploads.submit(upload_id)
+
+    status_url = url_for('get_price_upload', upload_id=upload_id)
+    return jsonify({
+        'success': True,
+        'upload_id': upload_id,
+        'status': 'queued',
+        'status_url': status_url
+    }), 202, {'Location': status_url}
+
+@app.route('/api/upload-price-data/<int:upload_id>', methods=['GET'])
+@login_required
+def get_price_upload(upload_id):
+    """
+    สถานะและความคืบหน้าของการอัปโหลดไฟล์ราคา (เฉพาะผู้อัปโหลดและ admin)
+    """
+    upload = price_store.get_upload(upload_id)
+    if upload is None or (upload['user_id'] != current_user.id and not current_user.is_admin()):
+        return jsonify({
+            'success': False,
+            'error': 'ไม่พบการอัปโหลดที่ระบุ'
+        }), 404
+
+    payload = price_upload_payload(upload)
+    if payload['status'] == 'done':
+        payload['total_records'] = len(price_store)
+    return jsonify({'success': True, 'upload': payload})
+
+@app.route('/api/batch-estimate', methods=['POST'])
+def batch_estimate():
+    """
+    API สำหรับประมาณราคาหลายรายการจากไฟล์ Excel/CSV แล้วส่งไฟล์ผลลัพธ์กลับ
+    รูปแบบไฟล์: province, property_type, area (columns อื่นจะถูกคงไว้ในไฟล์ผลลัพธ์)
+    Form fields (ไม่บังคับ):
+    - format: xlsx (ค่าเริ่มต้น) หรือ csv
+    - ai: 1 เพื่อส่งแถวที่ถูกต้องให้ AI ประเมินผ่านคิว /api/jobs (สูงสุด BATCH_AI_MAX_ROWS แถว)
+    """
+    import pandas as pd
+
+    try:
+        if 'file' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'ไม่พบไฟล์ที่อัปโหลด'
+            }), 400
+
+        file = request.files['file']
+
+        if file.filename == '':
+            return jsonify({
+                'success': False,
+                'error': 'ไม่ได้เลือกไฟล์'
+            }), 400
+
+        if not allowed_file(file.filename):
+            return jsonify({
+                'success': False,
+                'error': 'รองรับเฉพาะไฟล์ .xlsx, .xls, .csv เท่านั้น'
+            }), 400
+
+        try:
+            df = read_uploaded_table(file)
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': f'ไม่สามารถอ่านไฟล์ได้: {str(e)}'
+            }), 400
+
+        required_columns = ['province', 'property_type', 'area']
+        missing_columns = [col for col in required_columns if col not in df.columns]
+
+        if missing_columns:
+            return jsonify({
+                'success': False,
+                'error': f'ขาด columns: {", ".join(missing_columns)}',
+                'required_columns': required_columns
+            }), 400
+
+        if len(df) > BATCH_MAX_ROWS:
+            return jsonify({
+                'success': False,
+                'error': f'จำนวนแถวเกินกำหนด (สูงสุด {BATCH_MAX_ROWS} แถว)'
+            }), 400
+
+        result = estimate_prices_frame(df)
+
+        # ส่งแถวที่ถูกต้องให้ AI ประเมินผ่านคิว (จำกัดจำนวนเพื่อไม่ให้ Ollama ล้น)
+        if request.form.get('ai') in ('1', 'true', 'on'):
+            result['ai_job_id'] = ''
+            ai_rows = result.index[result['error'] == ''][:BATCH_AI_MAX_ROWS]
+            for index in ai_rows:
+                row = result.loc[index]
+                property_data = extract_property_data({
+                    field: ('' if pd.isna(row.get(field)) else str(row.get(field)))
+                    for field in EVALUATION_FIELDS
+                    if field in row.index
+                })
+                property_data['location'] = str(row['province']).strip()
+                result.at[index, 'ai_job_id'] = evaluation_jobs.submit(property_data)
+
+        output = io.BytesIO()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        if request.form.get('format') == 'csv':
+            # utf-8-sig เพื่อให้ Excel เปิดภาษาไทยได้ถูกต้อง
+            output.write(result.to_csv(index=False).encode('utf-8-sig'))
+            mimetype = 'text/csv'
+            filename = f'batch_estimate_{timestamp}.csv'
+        else:
+            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                result.to_excel(writer, index=False, sheet_name='ผลการประเมิน')
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            filename = f'batch_estimate_{timestamp}.xlsx'
+
+        output.seek(0)
+
+        return send_file(
+            output,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=filename
+        )
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'เกิดข้อผิดพลาด: {str(e)}'
+        }), 500
+
 @app.route('/api/get-price-data', methods=['GET'])
 def get_price_data():
     """
     API สำหรับดึงข้อมูลราคาที่อัปโหลดไว้
     """
     try:
-        # แปลงเป็น list
-        price_list = list(price_database.values())
+        price_list = price_store.all()
 
         return jsonify({
             'success': True,
             'data': price_list,
-            'total': len(price_list)
+            'total': len(price_list),
+            'version': price_store.version,
+            'uploads': price_store.uploads()
         })
 
     except Exception as e:
@@ -892,6 +5178,8 @@ def download_template():
     """
     ดาวน์โหลดไฟล์ Excel template สำหรับอัปโหลดข้อมูลราคา
     """
+    import pandas as pd
+
     try:
         # สร้าง sample data
         sample_data = {
@@ -923,6 +5211,7 @@ def download_template():
         }), 500
 
 if __name__ == '__main__':
+    create_app()
     print("=" * 60)
     print("ระบบประเมินราคาทรัพย์สิน - มั่นใจ")
     print("=" * 60)
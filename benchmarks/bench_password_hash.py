@@ -0,0 +1,86 @@
+"""
+Benchmark การตรวจสอบรหัสผ่านตอน login (PasswordHasher)
+
+วัดจำนวน login ต่อวินาทีเมื่อมีผู้ใช้ login พร้อมกัน ที่ cost ต่าง ๆ ของ PASSWORD_HASH_METHOD
+เปรียบเทียบการตรวจสอบใน thread ของ request เอง (workers=0) กับ process pool
+
+วิธีใช้ (รันจาก root ของโปรเจค):
+    python benchmarks/bench_password_hash.py
+    python benchmarks/bench_password_hash.py --methods scrypt:16384:8:1 pbkdf2:sha256:600000 \\
+        --workers 0 4 --concurrency 16 --logins 64 --output results.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import app  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+DEFAULT_METHODS = ['pbkdf2:sha256:600000', 'scrypt:16384:8:1', 'scrypt:32768:8:1']
+
+
+def run(method, workers, concurrency, logins):
+    """คืนค่า (logins/sec, เวลาเฉลี่ยต่อ login เป็น ms)"""
+    pwhash = generate_password_hash('benchmark-password', method)
+    hasher = app.PasswordHasher(method, workers, max_pending=max(concurrency, 1), timeout=300)
+
+    # warm-up ให้ worker process เริ่มทำงานก่อนจับเวลา
+    for _ in range(max(workers, 1)):
+        hasher.verify(pwhash, 'benchmark-password')
+
+    latencies = []
+
+    def login(_):
+        start = time.perf_counter()
+        hasher.verify(pwhash, 'benchmark-password')
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+
+    if hasher._executor is not None:
+        hasher._executor.shutdown()
+
+    return logins / elapsed, sum(latencies) / len(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', nargs='+', default=DEFAULT_METHODS)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, os.cpu_count() or 2])
+    parser.add_argument('--concurrency', type=int, default=16, help='จำนวนผู้ใช้ที่ login พร้อมกัน')
+    parser.add_argument('--logins', type=int, default=48, help='จำนวน login ทั้งหมดต่อการวัด')
+    parser.add_argument('--output', help='บันทึกผลเป็นไฟล์ JSON')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'method':>22} {'workers':>8} {'logins/s':>10} {'avg':>10}")
+
+    for method in args.methods:
+        for workers in args.workers:
+            rate, avg_ms = run(method, workers, args.concurrency, args.logins)
+            print(f"{method:>22} {workers:>8} {rate:>10.1f} {avg_ms:>8.1f}ms")
+            results.append({
+                'method': method,
+                'workers': workers,
+                'concurrency': args.concurrency,
+                'logins_per_second': round(rate, 2),
+                'avg_latency_ms': round(avg_ms, 2)
+            })
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'password_hash', 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark การสร้างรายงาน PDF (generate_pdf_report)
+
+เปรียบเทียบแบบเดิมที่ลงทะเบียนฟอนต์และสร้าง stylesheet ใหม่ทุกครั้ง
+กับ PdfRenderer ที่โหลดฟอนต์และ style ครั้งเดียวแล้วใช้ซ้ำ
+วัดเวลาต่อ PDF และหน่วยความจำที่จองต่อ PDF (tracemalloc)
+
+วิธีใช้ (รันจาก root ของโปรเจค):
+    python benchmarks/bench_pdf.py
+    python benchmarks/bench_pdf.py --iterations 100 --output results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import app  # noqa: E402
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle  # noqa: E402
+from reportlab.pdfbase import pdfmetrics  # noqa: E402
+from reportlab.pdfbase.ttfonts import TTFont  # noqa: E402
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer  # noqa: E402
+
+PROPERTY_DATA = {
+    'ประเภททรัพย์สิน': 'คอนโด',
+    'ทำเลที่ตั้ง': 'กรุงเทพมหานคร',
+    'พื้นที่': '50 ตร.ม.',
+    'ห้องนอน': '2',
+    'ห้องน้ำ': '2',
+    'อายุอาคาร': '5 ปี',
+    'สภาพ': 'ดี'
+}
+
+EVALUATION = ('ราคาประเมินโดยประมาณ 3,500,000 - 4,200,000 บาท '
+              'ทำเลใกล้รถไฟฟ้า สภาพห้องดี เหมาะสำหรับอยู่อาศัยและปล่อยเช่า ') * 8
+
+
+def legacy_generate_pdf_report(evaluation_data, ai_response):
+    """การสร้าง PDF แบบเดิม (ก่อนมี PdfRenderer) ไว้เปรียบเทียบ"""
+    pdfmetrics.registerFont(TTFont('THSarabun', app.PDF_FONT_REGULAR))
+    pdfmetrics.registerFont(TTFont('THSarabun-Bold', app.PDF_FONT_BOLD))
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=40, leftMargin=40, topMargin=40, bottomMargin=40)
+
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='TitleTH', fontName='THSarabun-Bold', fontSize=26, leading=32,
+                              alignment=1, spaceAfter=20))
+    styles.add(ParagraphStyle(name='BodyTH', fontName='THSarabun', fontSize=16, leading=22,
+                              spaceBefore=4, spaceAfter=4))
+    styles.add(ParagraphStyle(name='SectionTH', fontName='THSarabun-Bold', fontSize=18, leading=24,
+                              spaceBefore=12, spaceAfter=6))
+
+    story = [
+        Paragraph("รายงานผลการประเมินราคาอสังหาริมทรัพย์", styles["TitleTH"]),
+        Spacer(1, 14),
+        Paragraph("ผลการประเมินโดย AI", styles["SectionTH"]),
+        Paragraph(ai_response, styles["BodyTH"]),
+        Spacer(1, 16),
+        Paragraph("ข้อมูลทรัพย์สิน", styles["SectionTH"])
+    ]
+    for key, value in evaluation_data.items():
+        story.append(Paragraph(f"<b>{key}</b>: {value}", styles["BodyTH"]))
+    story.append(Spacer(1, 20))
+
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+
+def measure(fn, iterations):
+    """คืนค่า (เวลาแต่ละครั้งเป็น ms, หน่วยความจำที่จองเฉลี่ยต่อครั้งเป็น KB, peak KB)"""
+    fn(PROPERTY_DATA, EVALUATION)  # warm-up ให้ import และ cache ภายใน reportlab พร้อม
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(PROPERTY_DATA, EVALUATION)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(min(iterations, 10)):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(PROPERTY_DATA, EVALUATION)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return timings, allocated / min(iterations, 10) / 1024, peak / 1024
+
+
+def summarize(name, timings, allocated_kb, peak_kb):
+    ordered = sorted(timings)
+    return {
+        'name': name,
+        'mean_ms': round(statistics.mean(timings), 2),
+        'p50_ms': round(ordered[len(ordered) // 2], 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        'peak_alloc_kb_per_pdf': round(allocated_kb, 1),
+        'peak_traced_kb': round(peak_kb, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--output', help='บันทึกผลเป็นไฟล์ JSON')
+    args = parser.parse_args()
+
+    results = [
+        summarize('legacy', *measure(legacy_generate_pdf_report, args.iterations)),
+        summarize('pdf_renderer', *measure(app.generate_pdf_report, args.iterations))
+    ]
+
+    print(f"{'':>14} {'mean':>9} {'p50':>9} {'p95':>9} {'alloc/pdf':>11}")
+    for result in results:
+        print(f"{result['name']:>14} {result['mean_ms']:>7.2f}ms {result['p50_ms']:>7.2f}ms "
+              f"{result['p95_ms']:>7.2f}ms {result['peak_alloc_kb_per_pdf']:>9.1f}KB")
+    print(f"speedup: {results[0]['mean_ms'] / results[1]['mean_ms']:.1f}x")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'generate_pdf_report', 'iterations': args.iterations, 'results': results},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark เวลาเริ่มต้นของแอป (import app / create_app)
+
+รัน `python -X importtime -c "import app"` ใน process ใหม่ทุกครั้ง เพื่อวัดเวลา import ของ app
+และ module ที่ใช้เวลามากที่สุด พร้อมหน่วยความจำ (max RSS) หลัง import และหลัง create_app()
+ใช้ดูผลของการ import pandas / reportlab / requests แบบ lazy และการย้าย init_db() ออกจากตอน import
+
+วิธีใช้ (รันจาก root ของโปรเจค):
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10 --top 15 --output results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+# วัด RSS ใน process ลูก: resource.getrusage คืนค่า ru_maxrss เป็น KB บน Linux
+RSS_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+rss_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+app.create_app()
+created = time.perf_counter() - start
+rss_app = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+heavy = [name for name in ('pandas', 'reportlab', 'requests') if name in sys.modules]
+print(json.dumps({'import_seconds': imported, 'create_app_seconds': created,
+                  'rss_import_kb': rss_import, 'rss_create_app_kb': rss_app, 'heavy_modules': heavy}))
+"""
+
+
+def import_times():
+    """คืนค่า dict ชื่อ module -> เวลาสะสม (cumulative) เป็น µs จาก -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        # รูปแบบ: "import time:   self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        times[name] = max(times.get(name, 0), int(cumulative))
+    return times
+
+
+def measure_rss():
+    result = subprocess.run([sys.executable, '-c', RSS_SCRIPT],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='จำนวนครั้งที่รัน process ใหม่')
+    parser.add_argument('--top', type=int, default=10, help='แสดง module ที่ import นานที่สุดกี่อันดับ')
+    parser.add_argument('--output', help='บันทึกผลเป็นไฟล์ JSON')
+    args = parser.parse_args()
+
+    app_times = []
+    module_times = {}
+    for _ in range(args.repeat):
+        times = import_times()
+        app_times.append(times.get('app', 0) / 1000)
+        for name, micros in times.items():
+            module_times.setdefault(name, []).append(micros / 1000)
+
+    runs = [measure_rss() for _ in range(args.repeat)]
+
+    top = sorted(((name, statistics.median(values)) for name, values in module_times.items() if name != 'app'),
+                 key=lambda item: item[1], reverse=True)[:args.top]
+
+    print(f"import app (median of {args.repeat}): {statistics.median(app_times):.1f}ms "
+          f"(min {min(app_times):.1f}ms, max {max(app_times):.1f}ms)")
+    print(f"create_app(): {statistics.median(r['create_app_seconds'] for r in runs) * 1000:.1f}ms")
+    print(f"max RSS after import: {statistics.median(r['rss_import_kb'] for r in runs) / 1024:.1f}MB, "
+          f"after create_app(): {statistics.median(r['rss_create_app_kb'] for r in runs) / 1024:.1f}MB")
+    print(f"heavy modules loaded at import: {', '.join(runs[0]['heavy_modules']) or '-'}")
+    print()
+    print(f"{'module':>40} {'cumulative':>12}")
+    for name, millis in top:
+        print(f"{name:>40} {millis:>10.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'benchmark': 'startup',
+                'repeat': args.repeat,
+                'import_app_ms': round(statistics.median(app_times), 2),
+                'create_app_ms': round(statistics.median(r['create_app_seconds'] for r in runs) * 1000, 2),
+                'rss_import_mb': round(statistics.median(r['rss_import_kb'] for r in runs) / 1024, 1),
+                'rss_create_app_mb': round(statistics.median(r['rss_create_app_kb'] for r in runs) / 1024, 1),
+                'heavy_modules_at_import': runs[0]['heavy_modules'],
+                'top_modules': [{'module': name, 'cumulative_ms': round(millis, 2)} for name, millis in top]
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
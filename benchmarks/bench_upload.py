@@ -0,0 +1,124 @@
+"""
+Benchmark การนำเข้าตารางราคา (upload_price_data)
+
+เปรียบเทียบการวนลูปทีละแถวด้วย df.iterrows() แบบเดิม กับ ingest_price_frame() แบบ vectorized
+(รวมการบันทึกลง price store ใน SQLite)
+ที่ 10k / 100k / 1M แถว
+
+วิธีใช้ (รันจาก root ของโปรเจค):
+    python benchmarks/bench_upload.py
+    python benchmarks/bench_upload.py --rows 10000 100000 --legacy-max-rows 100000 --output results.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+
+
+def make_price_frame(rows, seed=42):
+    """สร้างตารางราคาจำลอง: จังหวัด × ประเภท × เขต พร้อมแถวที่ผิดพลาดประมาณ 1%"""
+    rng = random.Random(seed)
+    provinces = list(app.PROVINCES_DATA)
+    property_types = list(app.DEFAULT_BASE_PRICES)
+
+    province_col = []
+    type_col = []
+    price_col = []
+    for i in range(rows):
+        province_col.append(f" {rng.choice(provinces)} ")
+        type_col.append(f"{rng.choice(property_types)}-เขต{i % 500}")
+        price_col.append('ไม่ระบุ' if rng.random() < 0.01 else rng.randint(5000, 150000))
+
+    return pd.DataFrame({
+        'province': province_col,
+        'property_type': type_col,
+        'base_price_per_sqm': price_col
+    })
+
+
+def legacy_ingest(df):
+    """การนำเข้าแบบเดิม (ก่อนเปลี่ยนเป็น vectorized) ไว้เปรียบเทียบ"""
+    database = {}
+    updated_count = 0
+    errors = []
+    for index, row in df.iterrows():
+        try:
+            province = str(row['province']).strip()
+            property_type = str(row['property_type']).strip()
+            base_price = float(row['base_price_per_sqm'])
+            database[f"{province}_{property_type}"] = {
+                'province': province,
+                'property_type': property_type,
+                'base_price_per_sqm': base_price
+            }
+            updated_count += 1
+        except Exception as e:
+            errors.append(f"แถว {index + 2}: {str(e)}")
+    return updated_count, errors
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-max-rows', type=int, default=100_000,
+                        help='ข้ามการวัดแบบเดิมเมื่อจำนวนแถวมากกว่านี้ (iterrows ช้ามาก)')
+    parser.add_argument('--output', help='บันทึกผลเป็นไฟล์ JSON')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'rows':>10} {'parse csv':>10} {'legacy':>10} {'vectorized':>11} {'speedup':>8}")
+
+    for rows in args.rows:
+        df = make_price_frame(rows)
+        csv_bytes = df.to_csv(index=False).encode('utf-8')
+
+        parse_time, parsed = timed(pd.read_csv, io.BytesIO(csv_bytes))
+
+        legacy_time = None
+        if rows <= args.legacy_max_rows:
+            legacy_time, _ = timed(legacy_ingest, parsed)
+
+        # เขียนลงฐานข้อมูลชั่วคราว ไม่ให้กระทบข้อมูลราคาจริง
+        with tempfile.TemporaryDirectory() as tmp:
+            app.price_store = app.PriceStore(os.path.join(tmp, 'bench.db'), app.PRICE_CACHE_CHECK_INTERVAL)
+            vectorized_time, (updated_count, _, error_count) = timed(app.ingest_price_frame, parsed)
+
+        speedup = f"{legacy_time / vectorized_time:.1f}x" if legacy_time else '-'
+        legacy_text = f"{legacy_time:.3f}s" if legacy_time else 'skipped'
+        print(f"{rows:>10} {parse_time:>9.3f}s {legacy_text:>10} {vectorized_time:>10.3f}s {speedup:>8}")
+
+        results.append({
+            'rows': rows,
+            'parse_seconds': round(parse_time, 4),
+            'legacy_seconds': round(legacy_time, 4) if legacy_time else None,
+            'vectorized_seconds': round(vectorized_time, 4),
+            'rows_per_second': round(rows / vectorized_time),
+            'updated_count': updated_count,
+            'error_count': error_count
+        })
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'upload_price_data', 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""
+Load test ของ API หลัก โดยใช้ Ollama จำลอง (stub_ollama.py)
+
+เริ่ม app จริง (werkzeug threaded server) ในโฟลเดอร์ชั่วคราว ไม่กระทบฐานข้อมูลจริง
+แล้วยิง request พร้อมกันตามจำนวนที่กำหนด วัด p50 / p95 / p99 latency และ req/s ของแต่ละ scenario:
+    quick-estimate   POST /api/quick-estimate
+    evaluate         POST /api/evaluate (ข้อมูลต่างกันทุก request = ไม่ใช้ cache)
+    evaluate-cached  POST /api/evaluate (ข้อมูลเดิมทุก request = ใช้ cache)
+    pdf              POST /api/download-pdf
+    upload           POST /api/upload-price-data (CSV ขนาด --upload-rows แถว)
+    login            POST /login
+
+ใช้ --backends N เพื่อเริ่ม stub N ตัวเป็น Ollama backend pool (ดูว่า req/s เพิ่มตามจำนวน backend หรือไม่)
+
+บันทึกผลเป็น JSON แล้วเทียบกับผลครั้งก่อนด้วย --baseline เพื่อดูว่าช้าลงหรือไม่ระหว่าง release
+
+วิธีใช้ (รันจาก root ของโปรเจค):
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --scenarios quick-estimate evaluate --concurrency 1 8 32 --requests 400 \\
+        --latency 0.2 --tokens-per-second 40 --output results.json
+    python benchmarks/loadtest.py --scenarios evaluate --concurrency 16 --backends 4 --latency 0.5
+    python benchmarks/loadtest.py --baseline results.json      # exit code 1 ถ้า p95 ช้าลงเกิน --threshold
+
+ยิงไปที่ app ที่รันอยู่แล้ว (ต้องเริ่ม stub_ollama.py และตั้ง OLLAMA_BACKENDS เอง, upload จะแก้ข้อมูลราคาจริง):
+    python benchmarks/loadtest.py --url http://localhost:8088 --email admin@PasitDev.com --password admin123
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from stub_ollama import add_stub_arguments, start_stub, stub_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ['quick-estimate', 'evaluate', 'evaluate-cached', 'pdf', 'upload', 'login']
+LOGIN_SCENARIOS = {'upload'}  # scenario ที่ต้อง login ก่อน (ใช้ผู้ใช้ --email / --password)
+
+PROVINCES = ['กรุงเทพมหานคร', 'เชียงใหม่', 'ภูเก็ต', 'ขอนแก่น', 'ชลบุรี', 'สงขลา']
+PROPERTY_TYPES = ['คอนโด', 'บ้านเดี่ยว', 'ทาวน์เฮาส์', 'ที่ดิน']
+
+LOADTEST_EMAIL = 'loadtest@PasitDev.com'
+LOADTEST_PASSWORD = 'loadtest-password'
+
+
+def build_request(scenario, i, options):
+    """คืนค่า (method, path, kwargs ของ requests, status ที่ถือว่าสำเร็จ) สำหรับ request ที่ i"""
+    province = PROVINCES[i % len(PROVINCES)]
+    property_type = PROPERTY_TYPES[i % len(PROPERTY_TYPES)]
+
+    if scenario == 'quick-estimate':
+        payload = {'province': province, 'property_type': property_type, 'area': 30 + i % 200}
+        return 'POST', '/api/quick-estimate', {'json': payload}, {200}
+
+    if scenario in ('evaluate', 'evaluate-cached'):
+        area = 50 if scenario == 'evaluate-cached' else 30 + i
+        payload = {'property_type': property_type, 'location': province, 'area': str(area),
+                   'bedrooms': '2', 'bathrooms': '1', 'age': '5', 'condition': 'ดี'}
+        if scenario == 'evaluate-cached':
+            payload.update(property_type='คอนโด', location='กรุงเทพมหานคร')
+        return 'POST', '/api/evaluate', {'json': payload}, {200}
+
+    if scenario == 'pdf':
+        payload = {
+            'property_data': {'property_type': property_type, 'location': province, 'area': str(30 + i)},
+            'evaluation': f'ราคาประเมินโดยประมาณ {3_000_000 + i * 1000:,} บาท ' * 20
+        }
+        return 'POST', '/api/download-pdf', {'json': payload}, {200}
+
+    if scenario == 'upload':
+        files = {'file': ('loadtest.csv', options['upload_csv'], 'text/csv')}
+        return 'POST', '/api/upload-price-data', {'files': files}, {200}
+
+    if scenario == 'login':
+        form = {'email': options['email'], 'password': options['password']}
+        return 'POST', '/login', {'data': form, 'allow_redirects': False}, {302}
+
+    raise ValueError(f'ไม่รู้จัก scenario: {scenario}')
+
+
+def make_upload_csv(rows):
+    lines = ['province,property_type,base_price_per_sqm']
+    for i in range(rows):
+        lines.append(f'{PROVINCES[i % len(PROVINCES)]},{PROPERTY_TYPES[i % len(PROPERTY_TYPES)]}-เขต{i},'
+                     f'{20000 + i % 100 * 500}')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def new_session(base_url, scenario, options):
+    """requests.Session ต่อ thread (login ไว้ก่อนถ้า scenario ต้องการ)"""
+    session = requests.Session()
+    if scenario in LOGIN_SCENARIOS:
+        session.post(base_url + '/login', data={'email': options['email'], 'password': options['password']},
+                     allow_redirects=False, timeout=options['timeout'])
+    return session
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def run_level(base_url, scenario, concurrency, total, warmup, options):
+    """ยิง request ทั้งหมด total ครั้ง ด้วย concurrency thread พร้อมกัน คืนค่าสรุปผล"""
+    with new_session(base_url, scenario, options) as session:
+        for i in range(warmup):
+            method, path, kwargs, _ = build_request(scenario, -1 - i, options)
+            session.request(method, base_url + path, timeout=options['timeout'], **kwargs)
+
+    # เลข request ต่อเนื่องข้ามทุกระดับ concurrency ไม่ให้ระดับถัดไปได้ผลจาก cache ของระดับก่อน
+    first = options['sequence']
+    options['sequence'] += total
+    counter = itertools.count(first)
+    latencies = []
+    statuses = {}
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        session = new_session(base_url, scenario, options)  # keep-alive ต่อ thread เหมือน browser หนึ่งตัว
+        while True:
+            i = next(counter)
+            if i >= first + total:
+                break
+            method, path, kwargs, expected = build_request(scenario, i, options)
+            if scenario == 'login':
+                session.cookies.clear()  # login ใหม่ทุกครั้ง ไม่ใช้ session เดิม
+
+            start = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=options['timeout'], **kwargs)
+                response.content
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status not in expected:
+                    errors.append(status)
+        session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': len(errors),
+        'status_counts': statuses,
+        'requests_per_second': round(total / wall, 2),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+        'wall_seconds': round(wall, 3)
+    }
+
+
+def start_app(stub_urls, workdir):
+    """เริ่ม app ใน thread (ฐานข้อมูล / uploads / pdf_cache อยู่ใน workdir) คืนค่า (module app, server)"""
+    os.chdir(workdir)
+    os.symlink(os.path.join(ROOT, 'fonts'), 'fonts')
+    sys.path.insert(0, ROOT)
+
+    import app
+    from werkzeug.security import generate_password_hash
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass  # ไม่พิมพ์ log ทุก request (ทำให้ผลการวัดช้าลง)
+
+    app.ollama_client.set_backends(stub_urls)
+    app.create_app()
+
+    conn = app.connect_db()
+    conn.execute('INSERT OR IGNORE INTO users (email, password, full_name, role) VALUES (?, ?, ?, ?)',
+                 (LOADTEST_EMAIL, generate_password_hash(LOADTEST_PASSWORD, app.PASSWORD_HASH_METHOD),
+                  'Load Test', 'user'))
+    conn.commit()
+    conn.close()
+
+    server = make_server('127.0.0.1', 0, app.app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return app, server
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """เทียบกับผลครั้งก่อน คืนค่ารายการที่ p95 ช้าลงหรือ req/s ลดลงเกิน threshold"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['scenario'], r['concurrency']): r for r in json.load(f)['results']}
+
+    regressions = []
+    print()
+    print(f"{'scenario':>16} {'conc':>5} {'req/s':>16} {'p95':>20}")
+    for result in results:
+        before = baseline.get((result['scenario'], result['concurrency']))
+        if not before:
+            continue
+        rps_change = result['requests_per_second'] / before['requests_per_second'] - 1
+        p95_change = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0
+        regressed = p95_change > threshold or rps_change < -threshold
+        print(f"{result['scenario']:>16} {result['concurrency']:>5} {rps_change:>+15.1%} "
+              f"{p95_change:>+19.1%}{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=100, help='จำนวน request ต่อ scenario ต่อระดับ concurrency')
+    parser.add_argument('--warmup', type=int, default=3, help='request ก่อนเริ่มจับเวลา (ไม่นับผล)')
+    parser.add_argument('--timeout', type=float, default=120, help='timeout ต่อ request (วินาที)')
+    parser.add_argument('--upload-rows', type=int, default=1000)
+    parser.add_argument('--backends', type=int, default=1, help='จำนวน stub Ollama ใน backend pool')
+    parser.add_argument('--url', help='ยิงไปที่ app ที่รันอยู่แล้วแทนการเริ่ม app เอง')
+    parser.add_argument('--email', default=LOADTEST_EMAIL)
+    parser.add_argument('--password', default=LOADTEST_PASSWORD)
+    parser.add_argument('--output', help='บันทึกผลเป็นไฟล์ JSON')
+    parser.add_argument('--baseline', help='ไฟล์ JSON ผลครั้งก่อนสำหรับเปรียบเทียบ')
+    parser.add_argument('--threshold', type=float, default=0.10, help='สัดส่วนที่ถือว่าช้าลง (0.10 = 10%%)')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    options = {
+        'timeout': args.timeout,
+        'email': args.email,
+        'password': args.password,
+        'upload_csv': make_upload_csv(args.upload_rows),
+        'sequence': 0
+    }
+
+    stubs = []
+    server = None
+    workdir = None
+    meta = {}
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        stubs = [start_stub(**stub_config(args)) for _ in range(args.backends)]
+        workdir = tempfile.mkdtemp(prefix='pasitdev-loadtest-')
+        app, server = start_app([stub.url for stub in stubs], workdir)
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        meta['app_config'] = {
+            'OLLAMA_BACKENDS': len(stubs),
+            'OLLAMA_MAX_CONCURRENCY': app.OLLAMA_MAX_CONCURRENCY,
+            'OLLAMA_QUEUE_TIMEOUT': app.OLLAMA_QUEUE_TIMEOUT,
+            'PDF_WORKERS': app.PDF_WORKERS,
+            'PDF_MAX_PENDING': app.PDF_MAX_PENDING,
+            'PASSWORD_HASH_METHOD': app.PASSWORD_HASH_METHOD,
+            'PASSWORD_HASH_WORKERS': app.PASSWORD_HASH_WORKERS
+        }
+
+    results = []
+    print(f"{'scenario':>16} {'conc':>5} {'req/s':>9} {'p50':>10} {'p95':>10} {'p99':>10} {'errors':>7}")
+    try:
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                result = run_level(base_url, scenario, concurrency, args.requests, args.warmup, options)
+                results.append(result)
+                print(f"{scenario:>16} {concurrency:>5} {result['requests_per_second']:>9.1f} "
+                      f"{result['p50_ms']:>8.1f}ms {result['p95_ms']:>8.1f}ms {result['p99_ms']:>8.1f}ms "
+                      f"{result['errors']:>7}")
+    finally:
+        if server is not None:
+            server.shutdown()
+        if stubs:
+            meta['stub_stats'] = [stub.stats() for stub in stubs]
+        for stub in stubs:
+            stub.shutdown()
+        if workdir is not None:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'benchmark': 'loadtest',
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'cpu_count': os.cpu_count(),
+                'target': args.url or 'in-process',
+                'stub': None if args.url else stub_config(args),
+                **meta,
+                'results': results
+            }, f, ensure_ascii=False, indent=2)
+
+    if baseline and compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Ollama จำลอง (stub) สำหรับ benchmark / load test
+
+ตอบ /api/generate (ทั้งแบบ stream และไม่ stream), /api/tags, /api/ps และ /api/version เหมือน Ollama จริง
+แต่ไม่ต้องมี model ทำให้ผลการวัดไม่ขึ้นกับเครื่องหรือ GPU และรันซ้ำได้ผลเหมือนเดิม
+ปรับได้: เวลาก่อนได้ token แรก, ความเร็ว token/วินาที, จำนวน token และอัตราการตอบ error
+
+วิธีใช้ (รันจาก root ของโปรเจค):
+    python benchmarks/stub_ollama.py
+    python benchmarks/stub_ollama.py --port 11434 --latency 0.2 --tokens-per-second 40 --tokens 120 \\
+        --error-rate 0.01 --error-status 500
+
+ใช้ใน script อื่น:
+    from stub_ollama import start_stub
+    stub = start_stub(port=0, latency=0.05)   # port=0 เลือก port ว่างให้เอง
+    print(stub.url)
+    stub.shutdown()
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ข้อความตอบกลับ (ตัดเป็น token ทีละคำ วนซ้ำจนครบจำนวน token ที่ตั้งไว้)
+RESPONSE_WORDS = ('**ราคาประเมิน** ประมาณ 3,200,000 - 3,800,000 บาท '
+                  'ทำเลใกล้รถไฟฟ้าและแหล่งชุมชน สภาพทรัพย์สินดี เหมาะสำหรับอยู่อาศัยและลงทุนปล่อยเช่า '
+                  'ปัจจัยที่ส่งผลต่อราคา ได้แก่ ทำเล ขนาดพื้นที่ อายุอาคาร และสภาพโดยรวม').split(' ')
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive เหมือน Ollama จริง
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self.send_json(200, {'models': [{'name': name, 'model': name, 'size': 0} for name in self.server.models]})
+        elif self.path == '/api/ps':
+            # model ที่ "โหลด" แล้ว = model ที่เคยถูกเรียกใน stub นี้
+            self.send_json(200, {'models': [{'name': name, 'model': name, 'size': 0} for name in self.server.loaded]})
+        elif self.path == '/api/version':
+            self.send_json(200, {'version': 'stub'})
+        elif self.path == '/stub/stats':
+            self.send_json(200, self.server.stats())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json(400, {'error': 'invalid JSON'})
+            return
+
+        if self.path != '/api/generate':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        server = self.server
+        if server.should_fail():
+            time.sleep(server.latency)
+            self.send_json(server.error_status, {'error': 'stub: injected error'})
+            return
+
+        model = body.get('model') or server.models[0]
+        if server.check_model and model not in server.models and f'{model}:latest' not in server.models:
+            self.send_json(404, {'error': f"model '{model}' not found"})
+            return
+
+        tokens = server.tokens_for(server.tokens, model)
+        try:
+            start = time.perf_counter()
+            time.sleep(server.latency)  # เวลาโหลด prompt ก่อนได้ token แรก
+            first_token = time.perf_counter()
+
+            if body.get('stream'):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for token in tokens:
+                    time.sleep(server.token_interval)
+                    self.write_chunk({'model': model, 'created_at': now(), 'response': token, 'done': False})
+                self.write_chunk(self.final_payload(model, '', tokens, start, first_token))
+                self.wfile.write(b'0\r\n\r\n')
+            else:
+                time.sleep(server.token_interval * len(tokens))
+                self.send_json(200, self.final_payload(model, ''.join(tokens), tokens, start, first_token))
+        finally:
+            server.record_generate(len(tokens))
+
+    def write_chunk(self, payload):
+        data = (json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def final_payload(self, model, response, tokens, start, first_token):
+        end = time.perf_counter()
+        return {
+            'model': model,
+            'created_at': now(),
+            'response': response,
+            'done': True,
+            'done_reason': 'stop',
+            'total_duration': int((end - start) * 1e9),
+            'load_duration': int((first_token - start) * 1e9),
+            'prompt_eval_count': 200,
+            'prompt_eval_duration': int((first_token - start) * 1e9),
+            'eval_count': len(tokens),
+            'eval_duration': int((end - first_token) * 1e9)
+        }
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.05, tokens_per_second=200, tokens=60, error_rate=0.0,
+                 error_status=500, models=('llama3.2:latest',), check_model=False, seed=42):
+        super().__init__(address, StubOllamaHandler)
+        self.latency = latency
+        self.token_interval = 1 / tokens_per_second if tokens_per_second > 0 else 0
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.models = list(models)
+        self.check_model = check_model
+        self.loaded = []
+
+        self._random = random.Random(seed)  # สุ่มแบบกำหนด seed เพื่อให้ error เกิดตำแหน่งเดิมทุกครั้ง
+        self._lock = threading.Lock()
+        self.generate_requests = 0
+        self.injected_errors = 0
+        self.tokens_sent = 0
+        self.active = 0
+        self.max_active = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def tokens_for(self, count, model):
+        with self._lock:
+            if model not in self.loaded:
+                self.loaded.append(model)
+            self.generate_requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        return [RESPONSE_WORDS[i % len(RESPONSE_WORDS)] + ' ' for i in range(count)]
+
+    def should_fail(self):
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.injected_errors += 1
+                return True
+        return False
+
+    def record_generate(self, tokens):
+        with self._lock:
+            self.active -= 1
+            self.tokens_sent += tokens
+
+    def stats(self):
+        with self._lock:
+            return {
+                'generate_requests': self.generate_requests,
+                'injected_errors': self.injected_errors,
+                'tokens_sent': self.tokens_sent,
+                'active': self.active,
+                'max_active': self.max_active
+            }
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def start_stub(host='127.0.0.1', port=0, **config):
+    """เริ่ม stub ใน background thread คืนค่า StubOllamaServer (ดู URL ที่ .url, หยุดด้วย .shutdown())"""
+    server = StubOllamaServer((host, port), **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_stub_arguments(parser):
+    """เพิ่ม option ของ stub ให้ argparse (ใช้ร่วมกับ loadtest.py)"""
+    parser.add_argument('--latency', type=float, default=0.05, help='วินาทีก่อนได้ token แรก')
+    parser.add_argument('--tokens-per-second', type=float, default=200, help='ความเร็วการสร้าง token (0 = ไม่หน่วง)')
+    parser.add_argument('--tokens', type=int, default=60, help='จำนวน token ต่อคำตอบ')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='สัดส่วน request ที่ตอบ error (0-1)')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status ของ error ที่จำลอง')
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def stub_config(args):
+    return {
+        'latency': args.latency,
+        'tokens_per_second': args.tokens_per_second,
+        'tokens': args.tokens,
+        'error_rate': args.error_rate,
+        'error_status': args.error_status,
+        'seed': args.seed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--models', nargs='+', default=['llama3.2:latest'])
+    parser.add_argument('--check-model', action='store_true', help='ตอบ 404 ถ้าขอ model ที่ไม่มีใน --models')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubOllamaServer((args.host, args.port), models=args.models, check_model=args.check_model,
+                              **stub_config(args))
+    print(f'stub Ollama: {server.url} (Ctrl+C เพื่อหยุด)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,15 +11,12 @@ $(document).ready(function() {
     // โหลดข้อมูลจังหวัด
     loadProvinces();
 
-    // ตรวจสอบสถานะ Ollama เมื่อเริ่มโหลดหน้า
-    checkOllamaStatus();
+    // ติดตามสถานะ Ollama (ตรวจสอบทุก 30 วินาที หรือรับการแจ้งเตือนจาก server ถ้าเปิด status stream ไว้)
+    watchOllamaStatus();
 
     // ตั้งค่า Event Handlers
     setupEventHandlers();
 
-    // ตรวจสอบ Ollama ทุก 30 วินาที
-    setInterval(checkOllamaStatus, 30000);
-
     // File input change handler
     $('#excelFileInput').on('change', function() {
         const fileName = this.files[0] ? this.files[0].name : 'เลือกไฟล์ Excel หรือ CSV';
@@ -69,36 +66,71 @@ function setupEventHandlers() {
 // ========================================
 // Check Ollama Status
 // ========================================
+function watchOllamaStatus() {
+    // server เปิด stream เฉพาะเมื่อรันด้วย worker ที่รองรับการเชื่อมต่อค้างไว้ (OLLAMA_STATUS_STREAM)
+    if ($('body').data('ollama-status-stream') !== true || !window.EventSource) {
+        startOllamaPolling();
+        return;
+    }
+
+    const source = new EventSource('/api/check-ollama/stream');
+    let received = false;
+
+    source.onmessage = function(e) {
+        received = true;
+        renderOllamaStatus(JSON.parse(e.data));
+    };
+
+    source.onerror = function() {
+        // ถ้า server ไม่รองรับ stream ให้กลับไปใช้การตรวจสอบเป็นระยะ
+        if (!received) {
+            source.close();
+            startOllamaPolling();
+        }
+    };
+}
+
+function startOllamaPolling() {
+    checkOllamaStatus();
+    setInterval(checkOllamaStatus, 30000);
+}
+
 function checkOllamaStatus() {
     $.ajax({
         url: '/api/check-ollama',
         method: 'GET',
-        success: function(response) {
-            const $status = $('#ollamaStatus');
-            if (response.connected) {
-                $status.removeClass('disconnected checking')
-                       .addClass('connected');
-                $status.find('span').text('AI เชื่อมต่อแล้ว');
-
-                // แสดง models ที่มี (ถ้ามี)
-                if (response.models && response.models.length > 0) {
-                    console.log('Available Ollama models:', response.models);
-                }
-            } else {
-                $status.removeClass('connected checking')
-                       .addClass('disconnected');
-                $status.find('span').text('Ollama ไม่เชื่อมต่อ');
+        ifModified: true,
+        success: function(response, textStatus) {
+            // 304: สถานะไม่เปลี่ยนจากครั้งก่อน
+            if (textStatus === 'notmodified') {
+                return;
             }
+            renderOllamaStatus(response);
         },
         error: function() {
-            const $status = $('#ollamaStatus');
-            $status.removeClass('connected checking')
-                   .addClass('disconnected');
-            $status.find('span').text('Ollama ไม่เชื่อมต่อ');
+            renderOllamaStatus({ connected: false });
         }
     });
 }
 
+function renderOllamaStatus(response) {
+    const $status = $('#ollamaStatus');
+    if (response.connected) {
+        $status.removeClass('disconnected checking')
+               .addClass('connected');
+        $status.find('span').text('AI เชื่อมต่อแล้ว');
+
+        // แสดง models ที่มี (ถ้ามี)
+        if (response.models && response.models.length > 0) {
+            console.log('Available Ollama models:', response.models);
+        }
+    } else {
+        $status.removeClass('connected checking')
+               .addClass('disconnected');
+        $status.find('span').text('Ollama ไม่เชื่อมต่อ');
+    }
+}
+
 // ========================================
 // Load Provinces Data
 // ========================================
@@ -184,7 +216,20 @@ function submitEvaluation() {
     // เก็บข้อมูลไว้ใช้ภายหลัง
     currentEvaluationData = formData;
 
-    // เรียก API
+    // เรียก API แบบ streaming ถ้า browser รองรับ ไม่เช่นนั้นใช้แบบรอผลลัพธ์ทั้งหมด
+    if (window.fetch && window.ReadableStream && window.TextDecoder) {
+        streamEvaluation(formData);
+    } else {
+        requestEvaluation(formData);
+    }
+}
+
+function finishEvaluation() {
+    $('#loading').hide();
+    $('#evaluationForm').show();
+}
+
+function requestEvaluation(formData) {
     $.ajax({
         url: '/api/evaluate',
         method: 'POST',
@@ -206,13 +251,98 @@ function submitEvaluation() {
             }
             showError(errorMsg);
         },
-        complete: function() {
-            $('#loading').hide();
-            $('#evaluationForm').show();
-        }
+        complete: finishEvaluation
     });
 }
 
+// ========================================
+// Stream Evaluation (NDJSON)
+// ========================================
+function streamEvaluation(formData) {
+    let evaluationText = '';
+    let started = false;
+    let failed = false;
+
+    function handleEvent(event) {
+        if (event.type === 'start') {
+            displayPropertySummary(event.property_data);
+        } else if (event.type === 'chunk') {
+            evaluationText += event.text;
+            $('#resultContent').html(formatEvaluation(evaluationText));
+
+            // แสดงผลลัพธ์ตั้งแต่ chunk แรก
+            if (!started) {
+                started = true;
+                finishEvaluation();
+                showResultCard();
+            }
+        } else if (event.type === 'done') {
+            $('#resultContent').html(formatEvaluation(event.evaluation));
+            if (!started) {
+                started = true;
+                showResultCard();
+            }
+            showNotification('ประเมินราคาสำเร็จ', 'success');
+        } else if (event.type === 'error') {
+            failed = true;
+            showError(event.error || 'เกิดข้อผิดพลาดในการประเมินราคา');
+        }
+    }
+
+    fetch('/api/evaluate/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(formData)
+    })
+    .then(response => {
+        if (!response.ok || !response.body) {
+            // เช่น 503 เมื่อคิว AI เต็ม (server ส่งข้อความ error กลับมาเป็น JSON)
+            return response.json()
+                .catch(() => ({}))
+                .then(data => {
+                    throw new Error(data.error || 'ไม่สามารถเชื่อมต่อกับเซิร์ฟเวอร์ได้');
+                });
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+
+        function read() {
+            return reader.read().then(({ done, value }) => {
+                if (done) {
+                    if (buffer.trim()) {
+                        handleEvent(JSON.parse(buffer));
+                    }
+                    return;
+                }
+
+                buffer += decoder.decode(value, { stream: true });
+
+                // แยก event ทีละบรรทัด (บรรทัดสุดท้ายอาจยังไม่ครบ)
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.forEach(function(line) {
+                    if (line.trim() && !failed) {
+                        handleEvent(JSON.parse(line));
+                    }
+                });
+
+                return read();
+            });
+        }
+
+        return read();
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showError(error.message || 'ไม่สามารถเชื่อมต่อกับเซิร์ฟเวอร์ได้');
+    })
+    .finally(finishEvaluation);
+}
+
 // ========================================
 // Submit Quick Estimate
 // ========================================
@@ -252,9 +382,12 @@ function submitQuickEstimate() {
 // Display Result (AI Evaluation)
 // ========================================
 function displayResult(response) {
-    const data = response.property_data;
-    const evaluation = response.evaluation;
+    displayPropertySummary(response.property_data);
+    $('#resultContent').html(formatEvaluation(response.evaluation));
+    showResultCard();
+}
 
+function displayPropertySummary(data) {
     // สร้าง HTML สำหรับสรุปข้อมูลทรัพย์สิน
     let summaryHTML = '<h4><i class="fas fa-home"></i> ข้อมูลทรัพย์สิน</h4>';
     summaryHTML += '<div class="property-info">';
@@ -315,9 +448,11 @@ function displayResult(response) {
 
     summaryHTML += '</div>';
 
-    // แสดงผลลัพธ์
     $('#propertySummary').html(summaryHTML);
-    $('#resultContent').html(formatEvaluation(evaluation));
+}
+
+function showResultCard() {
+    // แสดงผลลัพธ์
     $('#resultCard').fadeIn(500);
 
     // Scroll to result
@@ -565,6 +700,16 @@ function uploadExcelFile() {
         return;
     }
 
+    // ไฟล์ใหญ่เกิน 16MB ส่งตัวไฟล์ตรง ๆ แล้วให้ server นำเข้าใน background
+    if (file.size > STREAM_UPLOAD_THRESHOLD) {
+        if (fileExtension === 'xls') {
+            showNotification('ไฟล์ .xls ขนาดใหญ่ไม่รองรับ กรุณาบันทึกเป็น .xlsx หรือ .csv', 'error');
+            return;
+        }
+        uploadLargePriceFile(file, fileInput);
+        return;
+    }
+
     // แสดงสถานะกำลังอัปโหลด
     showNotification('กำลังอัปโหลดไฟล์...', 'info');
 
@@ -609,6 +754,125 @@ function uploadExcelFile() {
     });
 }
 
+const STREAM_UPLOAD_THRESHOLD = 16 * 1024 * 1024;
+const UPLOAD_POLL_INTERVAL = 2000;
+const UPLOAD_POLL_MAX_FAILURES = 5;  // ตรวจสอบสถานะไม่สำเร็จติดกันครบเท่านี้จะหยุด
+
+function uploadLargePriceFile(file, fileInput) {
+    showNotification('กำลังอัปโหลดไฟล์ขนาดใหญ่...', 'info');
+
+    fetch('/api/upload-price-data?filename=' + encodeURIComponent(file.name), {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/octet-stream' },
+        body: file
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            showNotification(data.error || 'เกิดข้อผิดพลาดในการอัปโหลด', 'error');
+            return;
+        }
+
+        showNotification('อัปโหลดไฟล์แล้ว กำลังนำเข้าข้อมูล...', 'info');
+        fileInput.value = '';
+        closeUploadModal();
+        pollPriceUpload(data.status_url);
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showNotification('เกิดข้อผิดพลาดในการอัปโหลด', 'error');
+    });
+}
+
+function pollPriceUpload(statusUrl, failures = 0) {
+    fetch(statusUrl)
+    .then(response => response.json())
+    .then(data => {
+        const upload = data.upload;
+        if (!upload) {
+            hidePriceUploadProgress();
+            showNotification(data.error || 'ไม่พบการอัปโหลด', 'error');
+            return;
+        }
+
+        if (upload.status === 'done') {
+            hidePriceUploadProgress();
+            showNotification(
+                `อัปโหลดสำเร็จ ${upload.row_count.toLocaleString()} รายการ (รวม ${upload.total_records} รายการ)`,
+                'success'
+            );
+            if (upload.error_count > 0) {
+                console.warn('Upload errors:', upload.errors);
+                showNotification(`มี ${upload.error_count} รายการที่ไม่สามารถอัปโหลดได้`, 'warning');
+            }
+        } else if (upload.status === 'error') {
+            hidePriceUploadProgress();
+            showNotification(upload.error || 'เกิดข้อผิดพลาดในการนำเข้าข้อมูล', 'error');
+        } else {
+            showPriceUploadProgress(upload);
+            setTimeout(() => pollPriceUpload(statusUrl), UPLOAD_POLL_INTERVAL);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        // เครือข่ายหรือ server มีปัญหา: ลองใหม่ แต่ไม่เกิน UPLOAD_POLL_MAX_FAILURES ครั้งติดกัน
+        if (failures + 1 >= UPLOAD_POLL_MAX_FAILURES) {
+            hidePriceUploadProgress();
+            showNotification('ไม่สามารถตรวจสอบสถานะการนำเข้าข้อมูลได้ server ยังนำเข้าต่อ กรุณาตรวจสอบภายหลัง', 'warning');
+            return;
+        }
+        setTimeout(() => pollPriceUpload(statusUrl, failures + 1), UPLOAD_POLL_INTERVAL * (failures + 2));
+    });
+}
+
+// แสดงความคืบหน้าการนำเข้าไฟล์ราคาค้างไว้มุมจอ (modal ปิดไปแล้วหลังส่งไฟล์)
+function showPriceUploadProgress(upload) {
+    let $panel = $('#priceUploadProgress');
+    if (!$panel.length) {
+        $panel = $(`
+            <div id="priceUploadProgress" style="
+                position: fixed;
+                bottom: 20px;
+                right: 20px;
+                background: white;
+                padding: 1rem 1.5rem;
+                border-radius: 8px;
+                box-shadow: var(--shadow-lg);
+                border-left: 4px solid var(--primary-color);
+                z-index: 9999;
+                min-width: 300px;
+            ">
+                <div style="display: flex; align-items: center; gap: 0.75rem; margin-bottom: 0.5rem;">
+                    <i class="fas fa-spinner fa-spin" style="color: var(--primary-color);"></i>
+                    <span class="upload-progress-text" style="flex: 1;"></span>
+                </div>
+                <div style="background: #e9ecef; border-radius: 4px; height: 8px; overflow: hidden;">
+                    <div class="upload-progress-bar" style="
+                        background: var(--primary-color);
+                        height: 100%;
+                        width: 0;
+                        transition: width 0.3s ease;
+                    "></div>
+                </div>
+            </div>
+        `);
+        $('body').append($panel);
+    }
+
+    const rows = `${upload.row_count.toLocaleString()} รายการ`;
+    if (upload.progress !== null) {
+        const percent = Math.round(upload.progress * 100);
+        $panel.find('.upload-progress-text').text(`กำลังนำเข้า ${upload.filename} ${percent}% (${rows})`);
+        $panel.find('.upload-progress-bar').css('width', `${percent}%`);
+    } else {
+        $panel.find('.upload-progress-text').text(`กำลังนำเข้า ${upload.filename} (${rows})`);
+    }
+}
+
+function hidePriceUploadProgress() {
+    $('#priceUploadProgress').fadeOut(300, function() { $(this).remove(); });
+}
+
 function downloadTemplate() {
     showNotification('กำลังดาวน์โหลด template...', 'info');
 
@@ -0,0 +1,113 @@
+"""
+fixture ที่ใช้ร่วมกันของชุดทดสอบ
+
+- app ทำงานใน folder ชั่วคราว (database / uploads / pdf_cache / metrics_data ไม่ปนกับของจริง)
+- Ollama เป็น stub จาก benchmarks/stub_ollama.py ไม่ต้องมี model จริง
+- แต่ละ test ใช้ IP ของ client ไม่ซ้ำกัน การ login ผิดใน test หนึ่งจึงไม่ทำให้ test อื่นถูกบล็อก
+
+วิธีรัน (จาก root ของโปรเจค):
+    pip install pytest
+    python -m pytest -q
+"""
+import itertools
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import app as asset_app  # noqa: E402
+from stub_ollama import start_stub  # noqa: E402
+
+TEST_PASSWORD = 'test-password-123'
+
+_client_ips = (f'10.0.{i // 250}.{i % 250 + 1}' for i in itertools.count())
+
+
+@pytest.fixture(scope='session')
+def stub_ollama():
+    """Ollama จำลองที่ app ใช้ตลอดชุดทดสอบ"""
+    stub = start_stub(port=0, latency=0.01, tokens_per_second=0, tokens=20)
+    yield stub
+    stub.shutdown()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def app_module(tmp_path_factory, stub_ollama):
+    """module app ที่เตรียม resource แล้ว (database ฯลฯ อยู่ใน folder ชั่วคราว)"""
+    os.chdir(tmp_path_factory.mktemp('app'))
+    os.symlink(os.path.join(ROOT, 'fonts'), 'fonts')
+
+    asset_app.app.config['TESTING'] = True
+    # process เดียว: ไม่ต้องเขียน snapshot ของ metrics (เหมือน METRICS_MULTIPROCESS_DIR = None)
+    asset_app.metrics.directory = None
+    asset_app.ollama_client.set_backends([stub_ollama.url])
+    asset_app.create_app()
+    return asset_app
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtestloop(session):
+    yield
+    # flush login event ที่ค้างลง database ของชุดทดสอบ ก่อน pytest chdir กลับไปที่ root ของโปรเจค
+    asset_app.login_events.close()
+
+
+@pytest.fixture
+def client(app_module):
+    """test client ของ Flask ที่มี IP ของตัวเอง"""
+    client = app_module.app.test_client()
+    client.environ_base['REMOTE_ADDR'] = next(_client_ips)
+    return client
+
+
+def create_user(app_module, role='user'):
+    """เพิ่มผู้ใช้ใหม่ลง database คืนค่า (id, email)"""
+    email = f'{role}-{uuid.uuid4().hex[:12]}@example.com'
+    conn = app_module.connect_db()
+    try:
+        cursor = conn.execute(
+            'INSERT INTO users (email, password, full_name, role) VALUES (?, ?, ?, ?)',
+            (email, app_module.password_hasher.hash(TEST_PASSWORD), 'ผู้ทดสอบ', role)
+        )
+        conn.commit()
+        return cursor.lastrowid, email
+    finally:
+        conn.close()
+
+
+def property_data(**overrides):
+    """ข้อมูลทรัพย์สินสำหรับประเมิน (additional_info ไม่ซ้ำกัน จึงไม่ได้ผลจาก cache ของ test อื่น)"""
+    data = {
+        'property_type': 'คอนโด',
+        'location': 'กรุงเทพมหานคร',
+        'area': '35',
+        'bedrooms': '1',
+        'bathrooms': '1',
+        'age': '5',
+        'condition': 'ดี',
+        'additional_info': uuid.uuid4().hex
+    }
+    data.update(overrides)
+    return data
+
+
+def login(client, email, password=TEST_PASSWORD):
+    return client.post('/login', data={'email': email, 'password': password})
+
+
+@pytest.fixture
+def user(app_module):
+    return create_user(app_module)
+
+
+@pytest.fixture
+def logged_in_client(client, user):
+    """client ที่ login เป็นผู้ใช้ทั่วไปแล้ว"""
+    response = login(client, user[1])
+    assert response.status_code == 302
+    return client
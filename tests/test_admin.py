@@ -0,0 +1,42 @@
+"""หน้า Admin: จำนวนผู้ใช้แยกตาม role จากตาราง user_role_counts ต้องตรงกับตาราง users เสมอ"""
+from conftest import create_user, login
+
+
+def role_counts(app_module):
+    conn = app_module.connect_db()
+    try:
+        counts = app_module.count_users_by_role(conn)
+        actual = {'admin': 0, 'user': 0}
+        actual.update(dict(conn.execute('SELECT role, COUNT(*) FROM users GROUP BY role').fetchall()))
+        actual['total'] = sum(actual.values())
+        return counts, actual
+    finally:
+        conn.close()
+
+
+def test_role_counts_follow_insert_toggle_and_delete(app_module, client):
+    _, admin_email = create_user(app_module, role='admin')
+    user_id, _ = create_user(app_module)
+    login(client, admin_email)
+
+    counts, actual = role_counts(app_module)
+    assert counts == actual
+
+    assert client.post(f'/admin/toggle-role/{user_id}').status_code == 302
+    after_toggle, actual = role_counts(app_module)
+    assert after_toggle == actual
+    assert after_toggle['admin'] == counts['admin'] + 1
+    assert after_toggle['user'] == counts['user'] - 1
+
+    assert client.post(f'/admin/delete-user/{user_id}').status_code == 302
+    after_delete, actual = role_counts(app_module)
+    assert after_delete == actual
+    assert after_delete['total'] == counts['total'] - 1
+
+
+def test_admin_page_shows_counts(app_module, client):
+    _, admin_email = create_user(app_module, role='admin')
+    login(client, admin_email)
+
+    response = client.get('/admin')
+    assert response.status_code == 200
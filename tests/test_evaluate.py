@@ -0,0 +1,31 @@
+"""การประเมินด้วย AI ผ่าน Ollama จำลอง (cache ผลการประเมิน / streaming)"""
+import json
+
+from conftest import property_data
+
+
+def test_evaluate_uses_ollama_then_cache(client):
+    data = property_data()
+
+    first = client.post('/api/evaluate', json=data)
+    assert first.status_code == 200
+    assert first.json['success'] is True
+    assert '3,200,000' in first.json['evaluation']
+    assert first.json['cached'] is False
+
+    second = client.post('/api/evaluate', json=data)
+    assert second.status_code == 200
+    assert second.json['cached'] is True
+    assert second.json['evaluation'] == first.json['evaluation']
+
+
+def test_evaluate_stream_returns_ndjson_events(client):
+    response = client.post('/api/evaluate/stream', json=property_data())
+    assert response.status_code == 200
+
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+    assert events[0]['type'] == 'start'
+    assert events[-1]['type'] == 'done'
+    text = ''.join(event['text'] for event in events if event['type'] == 'chunk')
+    assert text == events[-1]['evaluation']
+    assert '3,200,000' in text
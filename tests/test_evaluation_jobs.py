@@ -0,0 +1,78 @@
+"""คิวงานประเมิน (/api/jobs): การประมวลผล การนำงานที่ค้างกลับเข้าคิว และการลบงานเก่า"""
+import json
+import time
+import uuid
+
+import pytest
+
+from conftest import property_data
+
+
+@pytest.fixture
+def job_queue(app_module, tmp_path):
+    """คิวแยกของแต่ละ test (ยังไม่เริ่ม worker) ใช้ database ของตัวเอง"""
+    return app_module.EvaluationJobQueue(str(tmp_path / 'jobs.db'), workers=1, stale_after=60,
+                                         sweep_interval=60, retention=3600)
+
+
+def insert_job(job_queue, status, created_at, started_at=None, finished_at=None):
+    job_id = uuid.uuid4().hex
+    conn = job_queue._connect()
+    try:
+        conn.execute('''
+            INSERT INTO evaluation_jobs (id, status, property_data, created_at, started_at, finished_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (job_id, status, json.dumps(property_data()), created_at, started_at, finished_at))
+        conn.commit()
+    finally:
+        conn.close()
+    return job_id
+
+
+def test_submitted_job_completes(client):
+    response = client.post('/api/jobs', json=property_data())
+    assert response.status_code == 202
+    assert response.json['status'] == 'queued'
+
+    job = client.get(f"{response.json['status_url']}?wait=10").json['job']
+    assert job['status'] == 'done'
+    assert '3,200,000' in job['evaluation']
+
+
+def test_unknown_job_is_404(client):
+    assert client.get(f'/api/jobs/{uuid.uuid4().hex}').status_code == 404
+
+
+def test_sweep_requeues_stale_running_job(job_queue):
+    now = time.time()
+    stale = insert_job(job_queue, 'running', now - 120, started_at=now - 120)
+    fresh = insert_job(job_queue, 'running', now - 10, started_at=now - 10)
+
+    job_queue._sweep()
+
+    assert job_queue.get(stale)['status'] == 'queued'
+    assert job_queue.get(fresh)['status'] == 'running'
+    assert job_queue.stats()['recovered'] == 1
+
+    # งานเดิมยังอยู่ในคิว sweep ซ้ำจึงไม่ใส่ซ้ำ
+    job_queue._sweep()
+    assert job_queue.stats()['queued'] == 1
+
+    job_queue.ensure_started()
+    job = job_queue.wait(stale, 10)
+    assert job['status'] == 'done'
+    assert job['evaluation']
+
+
+def test_sweep_prunes_finished_jobs_after_retention(job_queue):
+    now = time.time()
+    old_done = insert_job(job_queue, 'done', now - 7200, finished_at=now - 7200)
+    old_error = insert_job(job_queue, 'error', now - 7200, finished_at=now - 7200)
+    recent = insert_job(job_queue, 'done', now - 60, finished_at=now - 60)
+
+    job_queue._sweep()
+
+    assert job_queue.get(old_done) is None
+    assert job_queue.get(old_error) is None
+    assert job_queue.get(recent)['status'] == 'done'
+    assert job_queue.stats()['pruned'] == 2
@@ -0,0 +1,57 @@
+"""บันทึกประวัติการ login แบบ write-behind และการลบประวัติที่เก่ากว่า retention"""
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def writer(app_module, tmp_path):
+    path = str(tmp_path / 'events.db')
+    conn = app_module.connect_db(path)
+    conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, last_login TIMESTAMP)')
+    conn.execute('INSERT INTO users (id) VALUES (1)')
+    conn.commit()
+    conn.close()
+
+    writer = app_module.LoginEventWriter(path, flush_interval=60, batch_size=3, max_pending=100,
+                                         retention_days=30, prune_interval=60)
+    yield writer
+    writer.close()
+
+
+def event_count(app_module, writer):
+    conn = app_module.connect_db(writer.path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM login_events').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_flush_writes_events_and_last_login(app_module, writer):
+    writer.record('login', user_id=1, email='a@example.com', ip_address='192.0.2.1')
+    writer.record('login_failed', user_id=None, email='b@example.com', ip_address='192.0.2.2')
+    writer.flush()
+
+    assert event_count(app_module, writer) == 2
+    assert writer.stats()['written'] == 2
+    conn = app_module.connect_db(writer.path)
+    try:
+        assert conn.execute('SELECT last_login FROM users WHERE id = 1').fetchone()[0] is not None
+    finally:
+        conn.close()
+
+
+def test_prune_deletes_only_events_older_than_retention(app_module, writer):
+    old = datetime.now() - timedelta(days=31)
+    conn = writer._connect()
+    conn.executemany('INSERT INTO login_events (user_id, email, event, ip_address, created_at) VALUES (?, ?, ?, ?, ?)',
+                     [(1, 'a@example.com', 'login', '192.0.2.1', old)] * 7)
+    conn.commit()
+    conn.close()
+    writer.record('login', user_id=1, email='a@example.com', ip_address='192.0.2.1')
+    writer.flush()
+
+    writer.prune()  # ลบทีละ batch_size (3) แถวจนหมด
+
+    assert event_count(app_module, writer) == 1
+    assert writer.stats()['pruned'] == 7
@@ -0,0 +1,96 @@
+"""จำกัดการ login ผิดซ้ำ (ต่อ IP / ต่อบัญชีจาก IP เดียวกัน / หน่วงเวลาต่อบัญชี) และ 503 เมื่อคิว hash เต็ม"""
+import time
+import uuid
+
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture
+def limiter(app_module, tmp_path):
+    return app_module.LoginRateLimiter(str(tmp_path / 'limiter.db'), window=60)
+
+
+def fail_logins(client, email, times):
+    for _ in range(times):
+        assert login(client, email, 'wrong-password').status_code == 200
+
+
+def test_account_is_blocked_only_from_the_guessing_ip(app_module, client, user):
+    _, email = user
+    fail_logins(client, email, app_module.LOGIN_MAX_FAILURES_PER_ACCOUNT)
+
+    response = login(client, email)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+    # เจ้าของบัญชีจาก IP อื่นยัง login ได้
+    owner = app_module.app.test_client()
+    owner.environ_base['REMOTE_ADDR'] = '192.0.2.1'
+    assert login(owner, email).status_code == 302
+
+
+def test_successful_login_resets_account_failures(app_module, client, user):
+    _, email = user
+    fail_logins(client, email, app_module.LOGIN_MAX_FAILURES_PER_ACCOUNT - 1)
+    assert login(client, email).status_code == 302
+    client.get('/logout')
+
+    fail_logins(client, email, app_module.LOGIN_MAX_FAILURES_PER_ACCOUNT - 1)
+    assert login(client, email).status_code == 302
+
+
+def test_unknown_email_still_verifies_a_password(app_module, client):
+    verifies = app_module.password_hasher.stats()['verifies']
+    assert login(client, f'nobody-{uuid.uuid4().hex}@example.com').status_code == 200
+    assert app_module.password_hasher.stats()['verifies'] == verifies + 1
+
+
+def test_register_returns_503_when_hash_queue_is_full(app_module, client, monkeypatch):
+    def busy(password):
+        raise app_module.PasswordHashBusyError('busy')
+
+    monkeypatch.setattr(app_module.password_hasher, 'hash', busy)
+    response = client.post('/register', data={
+        'email': f'new-{uuid.uuid4().hex}@example.com',
+        'password': 'secret',
+        'confirm_password': 'secret',
+        'full_name': 'ผู้ใช้ใหม่'
+    })
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+
+
+def test_failures_are_shared_between_processes(app_module, limiter):
+    limiter.record_failure('ip:192.0.2.10', 'ip:192.0.2.11')
+    limiter.record_failure('ip:192.0.2.10')
+
+    # instance อื่นที่ใช้ database เดียวกัน (เหมือน worker process อื่น) เห็นจำนวนเดียวกัน
+    other = app_module.LoginRateLimiter(limiter.path, window=60)
+    assert other.retry_after('ip:192.0.2.10', 2) > 0
+    assert other.retry_after('ip:192.0.2.11', 2) == 0
+
+    other.reset('ip:192.0.2.10')
+    assert limiter.retry_after('ip:192.0.2.10', 2) == 0
+
+
+def test_failures_expire_after_window(app_module, tmp_path):
+    limiter = app_module.LoginRateLimiter(str(tmp_path / 'limiter.db'), window=0.2)
+    limiter.record_failure('email:a@example.com')
+    assert limiter.retry_after('email:a@example.com', 1) > 0
+
+    time.sleep(0.3)
+    assert limiter.retry_after('email:a@example.com', 1) == 0
+
+
+def test_account_delay_after_limit(limiter):
+    limiter.delay('email:a@example.com', 2, 0.2)
+    assert limiter.stats()['delayed'] == 0
+
+    limiter.record_failure('email:a@example.com')
+    limiter.record_failure('email:a@example.com')
+    started = time.perf_counter()
+    limiter.delay('email:a@example.com', 2, 0.2)
+    assert time.perf_counter() - started >= 0.2
+    assert limiter.stats()['delayed'] == 1
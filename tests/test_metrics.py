@@ -0,0 +1,68 @@
+"""/metrics: สิทธิ์การเข้าถึง และการรวมค่าจากหลาย worker process"""
+import json
+import os
+import time
+
+import pytest
+
+from conftest import create_user, login
+
+
+def write_process_snapshot(directory, pid, data, age=0):
+    path = os.path.join(directory, f'metrics-{pid}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def sample(text, name):
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.split()[-1])
+    raise AssertionError(f'ไม่พบ {name}')
+
+
+@pytest.fixture
+def registry(app_module, tmp_path):
+    registry = app_module.MetricsRegistry(str(tmp_path), interval=5, dead_retention=3600)
+    registry.counter('requests_total', 'requests').inc(amount=1)
+    registry.gauge('in_flight', 'in flight').set(2)
+    registry.gauge('version', 'version', mode='max').set(3)
+    registry.start()
+    return registry
+
+
+def test_metrics_requires_authorization(app_module, client):
+    assert client.get('/metrics').status_code == 401
+
+    _, admin_email = create_user(app_module, role='admin')
+    login(client, admin_email)
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'http_requests_total' in response.get_data(as_text=True)
+
+
+def test_counters_include_dead_processes_and_gauges_only_live(registry, tmp_path):
+    write_process_snapshot(tmp_path, 999991, {
+        'requests_total': [[[], 3]], 'in_flight': [[[], 4]], 'version': [[[], 7]]
+    })
+    write_process_snapshot(tmp_path, 999992, {
+        'requests_total': [[[], 5]], 'in_flight': [[[], 100]], 'version': [[[], 100]]
+    }, age=60)
+
+    text = registry.render()
+
+    assert sample(text, 'requests_total') == 9  # 1 + 3 + 5 (รวม process ที่จบไปแล้ว)
+    assert sample(text, 'in_flight') == 6  # 2 + 4 (เฉพาะ process ที่ยังทำงาน)
+    assert sample(text, 'version') == 7  # mode max
+
+
+def test_dead_snapshots_are_removed_after_retention(registry, tmp_path):
+    old = write_process_snapshot(tmp_path, 999993, {'requests_total': [[[], 5]]}, age=7200)
+
+    text = registry.render()
+
+    assert sample(text, 'requests_total') == 1
+    assert not os.path.exists(old)
@@ -0,0 +1,90 @@
+"""Ollama หลาย backend: ย้ายไป backend อื่นเมื่อ 5xx / timeout ก่อนได้ response / ไม่มี model และการพัก backend"""
+import pytest
+
+from stub_ollama import start_stub
+
+MODEL = 'llama3.2'
+
+
+@pytest.fixture(scope='module')
+def failing_stub():
+    stub = start_stub(port=0, latency=0, tokens=5, error_rate=1.0, error_status=500)
+    yield stub
+    stub.shutdown()
+
+
+@pytest.fixture(scope='module')
+def slow_stub():
+    stub = start_stub(port=0, latency=1.0, tokens_per_second=0, tokens=5)
+    yield stub
+    stub.shutdown()
+
+
+@pytest.fixture(scope='module')
+def missing_model_stub():
+    stub = start_stub(port=0, latency=0, tokens=5, models=('other-model:latest',), check_model=True)
+    yield stub
+    stub.shutdown()
+
+
+def make_client(app_module, urls, max_failures=2):
+    # backend แรกในรายการถูกเลือกก่อนเมื่อทุกตัวว่างเท่ากัน
+    return app_module.OllamaClient(urls, max_concurrency=2, queue_timeout=1, retries=0, backoff=0, pool_size=2,
+                                   max_failures=max_failures, eject_seconds=30)
+
+
+def test_server_error_fails_over(app_module, failing_stub, stub_ollama):
+    client = make_client(app_module, [failing_stub.url, stub_ollama.url])
+
+    assert client.generate('prompt', MODEL)['response']
+
+    stats = client.stats()
+    assert stats['failovers'] == 1
+    assert stats['backends'][0]['failures'] == 1
+    assert stats['backends'][0]['last_error'] == 'HTTP 500'
+
+
+def test_timeout_before_response_fails_over(app_module, slow_stub, stub_ollama, monkeypatch):
+    monkeypatch.setattr(app_module, 'OLLAMA_GENERATE_TIMEOUT', 0.3)
+    client = make_client(app_module, [slow_stub.url, stub_ollama.url])
+
+    assert client.generate('prompt', MODEL)['response']
+    assert client.stats()['failovers'] == 1
+
+
+def test_missing_model_fails_over_and_is_forgotten(app_module, missing_model_stub, stub_ollama):
+    client = make_client(app_module, [missing_model_stub.url, stub_ollama.url])
+    client.backends[0].models = {'other-model:latest', app_module.ollama_model_name(MODEL)}
+
+    assert client.generate('prompt', MODEL)['response']
+
+    assert client.stats()['failovers'] == 1
+    assert app_module.ollama_model_name(MODEL) not in client.backends[0].models
+    assert 'ไม่พบ model' in client.backends[0].last_error
+
+
+def test_stream_fails_over_before_first_chunk(app_module, failing_stub, stub_ollama):
+    client = make_client(app_module, [failing_stub.url, stub_ollama.url])
+
+    chunks = list(client.generate_stream('prompt', MODEL))
+    assert chunks[-1]['done'] is True
+    assert client.stats()['failovers'] == 1
+
+
+def test_all_backends_failing_raises(app_module, failing_stub, missing_model_stub):
+    client = make_client(app_module, [failing_stub.url, missing_model_stub.url])
+
+    with pytest.raises(app_module.OllamaError):
+        client.generate('prompt', MODEL)
+    assert client.stats()['active'] == 0
+
+
+def test_failing_backend_is_ejected(app_module, failing_stub, stub_ollama):
+    client = make_client(app_module, [failing_stub.url, stub_ollama.url], max_failures=1)
+
+    client.generate('prompt', MODEL)
+    assert client.stats()['backends'][0]['ejected'] is True
+
+    # backend ที่ถูกพักไว้ไม่ถูกเลือก จึงไม่ต้องย้ายอีก
+    client.generate('prompt', MODEL)
+    assert client.stats()['failovers'] == 1
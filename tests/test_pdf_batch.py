@@ -0,0 +1,63 @@
+"""ดาวน์โหลด PDF หลายรายการ: ตรวจสอบ input, ZIP ที่สมบูรณ์เสมอ และ 503 เมื่อสร้าง PDF ไม่ทันเวลา"""
+import io
+import uuid
+import zipfile
+
+import pytest
+
+from conftest import property_data
+
+
+def report_item():
+    return {'property_data': property_data(), 'evaluation': f'ราคาประเมินประมาณ 3,500,000 บาท ({uuid.uuid4().hex})'}
+
+
+@pytest.mark.parametrize('body', [
+    [report_item()],
+    {'items': {'property_data': {}}},
+    {'items': [1]},
+    {'items': [{'property_data': 'คอนโด', 'evaluation': 'ราคา'}]},
+    {'items': [{'property_data': property_data(), 'evaluation': ['ราคา']}]},
+])
+def test_malformed_batch_is_400(client, body):
+    response = client.post('/api/download-pdf/batch', json=body)
+    assert response.status_code == 400
+    assert response.json['success'] is False
+
+
+def test_zip_contains_one_pdf_per_item(client):
+    response = client.post('/api/download-pdf/batch', json={'format': 'zip', 'items': [report_item(), report_item()]})
+    assert response.status_code == 200
+
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+        names = archive.namelist()
+        assert names == ['001_property_evaluation.pdf', '002_property_evaluation.pdf']
+        assert all(archive.read(name).startswith(b'%PDF') for name in names)
+
+
+def test_failed_item_after_first_becomes_error_entry(app_module, client, monkeypatch):
+    result = app_module.pdf_pool.result
+    calls = []
+
+    def fail_second(future):
+        calls.append(future)
+        if len(calls) == 2:
+            raise RuntimeError('render failed')
+        return result(future)
+
+    monkeypatch.setattr(app_module.pdf_pool, 'result', fail_second)
+    response = client.post('/api/download-pdf/batch',
+                           json={'format': 'zip', 'items': [report_item(), report_item(), report_item()]})
+    assert response.status_code == 200
+
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+        assert archive.namelist() == ['001_property_evaluation.pdf', '002_error.txt', '003_property_evaluation.pdf']
+        assert 'render failed' in archive.read('002_error.txt').decode('utf-8')
+
+
+@pytest.mark.parametrize('output_format', ['pdf', 'zip'])
+def test_render_timeout_is_503(app_module, client, monkeypatch, output_format):
+    monkeypatch.setattr(app_module.pdf_pool, 'timeout', 0)
+    response = client.post('/api/download-pdf/batch', json={'format': output_format, 'items': [report_item()]})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(app_module.PDF_RETRY_AFTER)
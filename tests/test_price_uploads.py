@@ -0,0 +1,136 @@
+"""อัปโหลดไฟล์ราคาแบบ streaming: สิทธิ์ จำนวนที่ค้างได้ต่อผู้ใช้ และการกู้คืนเมื่อ process ตาย"""
+import os
+import time
+
+import pytest
+
+from conftest import create_user, login
+
+
+def price_csv(rows):
+    lines = ['province,property_type,base_price_per_sqm']
+    lines += [f'กรุงเทพมหานคร,คอนโด,{80000 + i}' for i in range(rows)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def wait_for_upload(app_module, upload_id, timeout=10):
+    deadline = time.time() + timeout
+    while True:
+        upload = app_module.price_store.get_upload(upload_id)
+        if upload['status'] in ('done', 'error') or time.time() > deadline:
+            return upload
+        time.sleep(0.05)
+
+
+def stale_upload(app_module, user_id, status, path):
+    """การอัปโหลดที่ process ซึ่งทำอยู่ตายไปแล้ว (heartbeat เก่ากว่า stale_after)"""
+    upload_id = app_module.price_store.create_upload('prices.csv', status, stored_path=path, user_id=user_id)
+    old = time.time() - app_module.PRICE_UPLOAD_STALE_AFTER - 60
+    app_module.price_store.update_upload(upload_id, started_at=old, heartbeat_at=old)
+    return upload_id
+
+
+@pytest.fixture
+def upload_folder(app_module):
+    return os.path.abspath(app_module.UPLOAD_FOLDER)
+
+
+def test_streaming_upload_requires_login(client):
+    response = client.post('/api/upload-price-data?filename=prices.csv', data=price_csv(3))
+    assert response.status_code == 401
+    assert response.json['success'] is False
+
+
+def test_streaming_upload_is_imported_in_background(app_module, logged_in_client, upload_folder):
+    response = logged_in_client.post('/api/upload-price-data?filename=prices.csv', data=price_csv(120))
+    assert response.status_code == 202
+
+    upload_id = response.json['upload_id']
+    assert wait_for_upload(app_module, upload_id)['status'] == 'done'
+
+    upload = logged_in_client.get(response.json['status_url']).json['upload']
+    assert upload['row_count'] == 120
+    assert upload['progress'] == 1.0
+    assert not [name for name in os.listdir(upload_folder) if name.endswith('.csv')]
+
+
+def test_one_active_streaming_upload_per_user(app_module, logged_in_client, user):
+    app_module.price_store.create_upload('prices.csv', 'receiving', user_id=user[0])
+
+    response = logged_in_client.post('/api/upload-price-data?filename=prices.csv', data=price_csv(3))
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(app_module.PRICE_STREAM_RETRY_AFTER)
+
+
+def test_upload_status_only_visible_to_owner_and_admin(app_module, client, user):
+    upload_id = app_module.price_store.create_upload('prices.csv', 'error', user_id=user[0])
+    status_url = f'/api/upload-price-data/{upload_id}'
+
+    _, other_email = create_user(app_module)
+    login(client, other_email)
+    assert client.get(status_url).status_code == 404
+
+    client.get('/logout')
+    _, admin_email = create_user(app_module, role='admin')
+    login(client, admin_email)
+    assert client.get(status_url).json['upload']['id'] == upload_id
+
+
+def test_sweep_requeues_stale_processing_upload(app_module, user, upload_folder):
+    path = os.path.join(upload_folder, 'price-upload-stale-processing.csv')
+    with open(path, 'wb') as f:
+        f.write(price_csv(50))
+    upload_id = stale_upload(app_module, user[0], 'processing', path)
+
+    app_module.price_uploads._sweep()
+
+    upload = wait_for_upload(app_module, upload_id)
+    assert upload['status'] == 'done'
+    assert upload['row_count'] == 50
+    assert not os.path.exists(path)
+
+
+def test_sweep_abandons_stale_receiving_upload(app_module, user, upload_folder):
+    path = os.path.join(upload_folder, 'price-upload-stale-receiving.csv')
+    with open(path + '.part', 'wb') as f:
+        f.write(price_csv(5)[:20])
+    upload_id = stale_upload(app_module, user[0], 'receiving', path)
+
+    app_module.price_uploads._sweep()
+
+    upload = app_module.price_store.get_upload(upload_id)
+    assert upload['status'] == 'error'
+    assert not os.path.exists(path + '.part')
+
+
+def test_sweep_removes_only_old_orphan_files(app_module, upload_folder):
+    old = os.path.join(upload_folder, 'price-upload-orphan-old.csv.part')
+    fresh = os.path.join(upload_folder, 'price-upload-orphan-fresh.csv.part')
+    for path in (old, fresh):
+        with open(path, 'wb') as f:
+            f.write(b'province')
+    stale_time = time.time() - app_module.PRICE_UPLOAD_STALE_AFTER - 60
+    os.utime(old, (stale_time, stale_time))
+
+    app_module.price_uploads._sweep()
+
+    assert not os.path.exists(old)
+    assert os.path.exists(fresh)
+    os.remove(fresh)
+
+
+def test_reclaimed_upload_rejects_rows_from_previous_worker(app_module, user):
+    store = app_module.price_store
+    upload_id = store.create_upload('prices.csv', 'queued', user_id=user[0])
+    first_claim = store.claim_upload(upload_id)
+    assert first_claim is not None
+    assert store.claim_upload(upload_id) is None  # worker อื่นจองซ้ำไม่ได้
+
+    # worker แรกหยุดไปนาน: sweep นำกลับเข้าคิวแล้ว worker ใหม่จองต่อ
+    store.update_upload(upload_id, status='queued')
+    time.sleep(0.01)
+    second_claim = store.claim_upload(upload_id)
+
+    assert store.append_upload_rows(upload_id, first_claim, [], 1, 0, None) is False
+    assert store.append_upload_rows(upload_id, second_claim, [], 1, 0, None) is True
+    store.update_upload(upload_id, status='error')